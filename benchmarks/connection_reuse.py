@@ -0,0 +1,103 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+# Counts the TCP connections the stub server accepts, and times the
+# run, for a crawl-like mix of small queries sent:
+#
+#     pooled       through one Client and its pooled transport
+#     keep-alive   through a Client with keep_alive=False
+#     unpooled     through module-level requests.get, one call each
+#
+# --workers threads share each client, as a concurrent crawl would.
+#
+#     python -m benchmarks.connection_reuse --queries 2000 --workers 8
+import argparse
+import concurrent.futures
+import time
+
+from tcia import _utils
+from tcia import api
+from tests.conftest import StubServer
+
+
+def _pooled(server, **kwargs):
+    client = api.Client("benchmark", base_url=server.url, **kwargs)
+
+    def query(index):
+        # Distinct params, so no two concurrent queries are coalesced.
+        client.patients(collection=str(index)).get()
+
+    return query, client.close
+
+
+def _unpooled(server):
+    url = f"{server.url}/TCIA/query/getPatient"
+
+    def query(index):
+        _utils.get_text(
+            url,
+            headers={"api_key": "benchmark"},
+            params={"Collection": str(index), "format": "json"},
+        )
+
+    return query, lambda: None
+
+
+_CASES = {
+    "pooled": lambda server, workers: _pooled(server, pool_maxsize=workers),
+    "keep-alive": lambda server, workers: _pooled(
+        server, pool_maxsize=workers, keep_alive=False
+    ),
+    "unpooled": lambda server, workers: _unpooled(server),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument(
+        "--cases", nargs="+", choices=list(_CASES), default=list(_CASES)
+    )
+    args = parser.parse_args(argv)
+
+    print(
+        f"{args.queries} queries, {args.workers} workers, "
+        f"latency {args.latency * 1000:.0f} ms"
+    )
+    print(f"{'case':>12} {'connections':>12} {'seconds':>9}")
+
+    for name in args.cases:
+        server = StubServer(latency=args.latency)
+        server.route("getPatient", [])
+
+        try:
+            query, close = _CASES[name](server, args.workers)
+            start = time.perf_counter()
+
+            with concurrent.futures.ThreadPoolExecutor(
+                args.workers
+            ) as executor:
+                list(executor.map(query, range(args.queries)))
+
+            elapsed = time.perf_counter() - start
+            close()
+            print(f"{name:>12} {server.connections:>12} {elapsed:>9.3f}")
+        finally:
+            server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+# Times the zip and per-instance download strategies against the local
+# stub server, over a grid of series shapes, to locate the crossover
+# behind the "auto" strategy's thresholds.
+#
+# The stub caps each response at --bandwidth bytes per second and adds
+# --latency seconds per request, so a single getImage stream is bound
+# by bandwidth while fan-out trades it for per-request latency. Sizes
+# are given in multiples of the bandwidth-delay product (BDP), in which
+# the crossover does not depend on the absolute numbers: results from
+# a fast, scaled-down run carry over to the real archive.
+#
+#     python -m benchmarks.download_strategy --latency 0.02 \
+#         --bandwidth 4e6 --objects 4 16 64 256 --sizes 1 4 16 64
+import argparse
+import os
+import tempfile
+import time
+
+from tcia import api
+from tests.conftest import StubServer
+from tests.conftest import make_zip
+
+
+def _route(server, members):
+    zip_ = make_zip(members)
+    instances = {name[: -len(".dcm")]: data for name, data in members.items()}
+    server.route("getImage", zip_)
+    server.route(
+        "getSeriesSize",
+        [
+            {
+                "TotalSizeInBytes": sum(map(len, members.values())),
+                "ObjectCount": len(members),
+            }
+        ],
+    )
+    server.route(
+        "getSOPInstanceUIDs",
+        [{"sop_instance_uid": uid} for uid in instances],
+    )
+    server.route(
+        "getSingleImage",
+        lambda request: instances[request.params["SOPInstanceUID"]],
+    )
+
+
+def _time(client, strategy, repeat):
+    best = None
+
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as dest_dir:
+            start = time.perf_counter()
+            report = client.download_series(
+                ["1.2.3"], dest_dir, extract=True, strategy=strategy
+            )
+            elapsed = time.perf_counter() - start
+
+        (download,) = report.downloads
+
+        if download.error is not None:
+            raise download.error
+
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--bandwidth", type=float, default=4e6)
+    parser.add_argument("--instance-workers", type=int, default=8)
+    parser.add_argument(
+        "--objects", type=int, nargs="+", default=[4, 16, 64, 256]
+    )
+    parser.add_argument(
+        "--sizes", type=float, nargs="+", default=[1, 4, 16, 64]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    bdp = args.latency * args.bandwidth
+    server = StubServer(latency=args.latency, bandwidth=args.bandwidth)
+    print(
+        f"latency {args.latency * 1000:.0f} ms, bandwidth "
+        f"{args.bandwidth / 1e6:.1f} MB/s per stream, BDP {bdp / 1e3:.0f} kB, "
+        f"{args.instance_workers} instance workers"
+    )
+    print(
+        f"{'objects':>8} {'size/BDP':>9} {'size/object/BDP':>16} "
+        f"{'zip s':>8} {'instances s':>12} {'speedup':>8}"
+    )
+
+    try:
+        with api.Client(
+            "benchmark",
+            base_url=server.url,
+            pool_maxsize=args.instance_workers,
+        ) as client:
+            for objects in args.objects:
+                crossover = None
+
+                for multiple in sorted(args.sizes):
+                    object_size = max(1, int(multiple * bdp / objects))
+                    _route(
+                        server,
+                        {
+                            f"1.2.3.{index}.dcm": os.urandom(object_size)
+                            for index in range(objects)
+                        },
+                    )
+                    zip_time = _time(client, "zip", args.repeat)
+                    instances_time = _time(client, "instances", args.repeat)
+                    speedup = zip_time / instances_time
+
+                    if speedup > 1 and crossover is None:
+                        crossover = multiple
+                    elif speedup <= 1:
+                        crossover = None
+
+                    print(
+                        f"{objects:>8} {multiple:>9g} "
+                        f"{object_size / bdp:>16.3f} {zip_time:>8.3f} "
+                        f"{instances_time:>12.3f} {speedup:>8.2f}"
+                    )
+
+                print(
+                    f"{objects:>8} objects: fan-out wins from "
+                    + (
+                        "no measured size"
+                        if crossover is None
+                        else f"{crossover:g} x BDP"
+                    )
+                )
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+# Measures how fast a getImage body is copied to disk, in MB/s and in
+# CPU seconds per GB, for the ways the client has read responses:
+#
+#     direct     write_response_content() reading http.client directly
+#     readinto   write_response_content() through urllib3's readinto()
+#     iter       response.iter_content() chunks written one by one
+#
+# The stub server runs in this process, so CPU time is taken for the
+# reading thread alone (time.thread_time) and excludes the server.
+#
+#     python -m benchmarks.download_throughput --size 256 --repeat 5
+import argparse
+import os
+import time
+
+import requests
+
+from tcia import _utils
+from tests.conftest import StubServer
+
+
+def _readinto_reader(response):
+    response.raw.decode_content = True
+    return response.raw, False
+
+
+def _direct(response, buffer):
+    _utils.write_response_content(response, buffer)
+
+
+def _readinto(response, buffer):
+    get_reader = _utils._get_reader
+    _utils._get_reader = _readinto_reader
+
+    try:
+        _utils.write_response_content(response, buffer)
+    finally:
+        _utils._get_reader = get_reader
+
+
+def _iter(response, buffer):
+    with response:
+        for bytes_ in response.iter_content(chunk_size=65536):
+            buffer.write(bytes_)
+
+
+_METHODS = {"direct": _direct, "readinto": _readinto, "iter": _iter}
+
+
+def _measure(session, url, method, repeat):
+    best_wall = best_cpu = None
+
+    for _ in range(repeat):
+        response = session.get(url, stream=True)
+        response.raise_for_status()
+
+        with open(os.devnull, "wb", buffering=0) as buffer:
+            wall = time.perf_counter()
+            cpu = time.thread_time()
+            method(response, buffer)
+            cpu = time.thread_time() - cpu
+            wall = time.perf_counter() - wall
+
+        best_wall = wall if best_wall is None else min(best_wall, wall)
+        best_cpu = cpu if best_cpu is None else min(best_cpu, cpu)
+
+    return best_wall, best_cpu
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--size", type=int, default=256, help="body size in MiB"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--methods", nargs="+", choices=list(_METHODS), default=list(_METHODS)
+    )
+    args = parser.parse_args(argv)
+
+    size = args.size * 1024**2
+    server = StubServer()
+    server.route("getImage", os.urandom(1024**2) * args.size)
+    url = f"{server.url}/query/getImage"
+    print(f"{args.size} MiB body, best of {args.repeat}")
+    print(f"{'method':>10} {'MB/s':>10} {'CPU s/GB':>10}")
+
+    try:
+        with requests.Session() as session:
+            for name in args.methods:
+                wall, cpu = _measure(session, url, _METHODS[name], args.repeat)
+                print(
+                    f"{name:>10} {size / wall / 1e6:>10.0f} "
+                    f"{cpu / (size / 1e9):>10.3f}"
+                )
+    finally:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
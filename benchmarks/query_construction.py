@@ -0,0 +1,63 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+# Times building and using query objects in tight loops: the per-call
+# overhead paid by code that creates one query per patient, study or
+# series, and by caches and dedup maps keyed on queries.
+#
+# No requests are sent; the client points at an unused local port.
+#
+#     python -m benchmarks.query_construction --number 200000
+import argparse
+import timeit
+
+from tcia import api
+
+
+def _cases(client):
+    series = client.series(collection="A")
+    query = series(patient_id="P0")
+    keys = {query: None}
+    return {
+        "attribute access": lambda: client.series,
+        "filtered call": lambda: client.series(
+            collection="A", patient_id="P0"
+        ),
+        "chained call": lambda: series(patient_id="P0"),
+        "hash": lambda: hash(series(patient_id="P0")),
+        "dict lookup": lambda: keys[series(patient_id="P0")],
+        "rehash": lambda: hash(query),
+        "repeat lookup": lambda: keys[query],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--number", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    print(f"best of {args.repeat} x {args.number} calls")
+    print(f"{'case':>18} {'us/call':>9}")
+
+    with api.Client("benchmark", base_url="http://127.0.0.1:9") as client:
+        for name, case in _cases(client).items():
+            best = min(
+                timeit.repeat(case, number=args.number, repeat=args.repeat)
+            )
+            print(f"{name:>18} {best / args.number * 1e6:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -12,12 +12,12 @@
 # implied. See the License for the specific language governing
 # permissions and limitations under the License.
 # ----------------------------------------------------------------------
-import pkg_resources
-
 from tcia import api
+from tcia import cache
+from tcia import catalog
 from tcia.api import Client
 from tcia import _version
 
 
-__all__ = ["api", "Client"]
+__all__ = ["api", "cache", "catalog", "Client"]
 __version__ = _version.get_version()
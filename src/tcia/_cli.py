@@ -12,12 +12,378 @@
 # implied. See the License for the specific language governing
 # permissions and limitations under the License.
 # ----------------------------------------------------------------------
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+
 import click
 
+from tcia import api
+from tcia import cache
+from tcia import catalog
+from tcia import store
+from tcia import _resources
+
 
 __all__ = ["main"]
 
+_QUERIES = {
+    "collections": _resources.CollectionsResource,
+    "modalities": _resources.ModalitiesResource,
+    "body_parts_examined": _resources.BodyPartsExaminedResource,
+    "manufacturers": _resources.ManufacturersResource,
+    "patients": _resources.PatientsResource,
+    "patients_by_modality": _resources.PatientsByModalityResource,
+    "patient_studies": _resources.PatientStudiesResource,
+    "series": _resources.SeriesResource,
+    "series_size": _resources.SeriesSizeResource,
+    "new_patients_in_collection": _resources.NewPatientsInCollectionResource,
+    "new_studies_in_patient_collection": (
+        _resources.NewStudiesInPatientCollectionResource
+    ),
+    "sop_instance_uids": _resources.SOPInstanceUIDsResource,
+    "contents_by_name": _resources.ContentsByNameResource,
+}
+
+_FORMATS = ["csv", "json", "jsonl", "xml", "html"]
+
+
+def _get_client(ctx):
+    # Built on first use so that --help never needs an API key.
+    options = ctx.find_root().obj
+
+    if "client" not in options:
+        if options["api_key"] is None:
+            raise click.UsageError(
+                "an API key is required: pass --api-key or set TCIA_API_KEY"
+            )
+
+        client = api.Client(
+            options["api_key"],
+            base_url=options["base_url"],
+            cache=(
+                None
+                if options["cache_path"] is None
+                else cache.ResponseCache(options["cache_path"])
+            ),
+            catalog=(
+                None
+                if options["catalog_path"] is None
+                else catalog.Catalog(options["catalog_path"])
+            ),
+            store=(
+                None
+                if options["store_path"] is None
+                else store.ImageStore(options["store_path"])
+            ),
+        )
+        ctx.find_root().call_on_close(client.close)
+        options["client"] = client
+
+    return options["client"]
+
+
+def _write_lines(lines):
+    try:
+        for line in lines:
+            sys.stdout.write(line)
+        sys.stdout.flush()
+    except BrokenPipeError:
+        # The reader went away (e.g. `| head`); stop quietly and keep
+        # the interpreter from failing again when it flushes stdout.
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+
+def _to_json(record):
+    if hasattr(record, "_asdict"):
+        return record._asdict()
+    return record
+
+
+@click.group()
+@click.option(
+    "--api-key", envvar="TCIA_API_KEY", help="TCIA API key [$TCIA_API_KEY]."
+)
+@click.option(
+    "--base-url",
+    default="https://services.cancerimagingarchive.net/services/v3",
+    show_default=True,
+)
+@click.option(
+    "--cache",
+    "cache_path",
+    type=click.Path(dir_okay=False),
+    help="SQLite file to cache query responses in.",
+)
+@click.option(
+    "--catalog",
+    "catalog_path",
+    type=click.Path(dir_okay=False),
+    help="SQLite catalog file to answer queries from.",
+)
+@click.option(
+    "--store",
+    "store_path",
+    type=click.Path(file_okay=False),
+    help="Directory of a deduplicating image store.",
+)
+@click.pass_context
+def main(ctx, api_key, base_url, cache_path, catalog_path, store_path):
+    ctx.obj = {
+        "api_key": api_key,
+        "base_url": base_url,
+        "cache_path": cache_path,
+        "catalog_path": catalog_path,
+        "store_path": store_path,
+    }
+
+
+def _make_query_command(name, class_):
+    def command(format_, chunk_size, **kwargs):
+        client = _get_client(click.get_current_context())
+        resource = getattr(client, name)(**kwargs)
+
+        if format_ == "jsonl":
+            lines = (
+                json.dumps(_to_json(record)) + "\n"
+                for record in resource.iter(chunk_size)
+            )
+        else:
+            lines = resource.iter_text(format_, chunk_size)
+
+        _write_lines(lines)
+
+    parameters = [
+        parameter
+        for parameter in inspect.signature(class_.__call__).parameters.values()
+        if parameter.kind is inspect.Parameter.KEYWORD_ONLY
+    ]
+
+    # Options are applied innermost first; reverse to keep their order.
+    for parameter in reversed(parameters):
+        command = click.option(
+            f"--{parameter.name.replace('_', '-')}",
+            parameter.name,
+            required=parameter.default is inspect.Parameter.empty,
+        )(command)
+
+    command = click.option(
+        "--format",
+        "format_",
+        type=click.Choice(_FORMATS),
+        default="csv",
+        show_default=True,
+        help="Output format; jsonl writes one JSON record per line.",
+    )(command)
+    command = click.option(
+        "--chunk-size", type=click.IntRange(min=1), default=65536
+    )(command)
+    endpoint = inspect.signature(class_.__init__).parameters["endpoint"]
+    return main.command(
+        name.replace("_", "-"), help=f"Query {endpoint.default}."
+    )(command)
+
+
+for _name, _class in _QUERIES.items():
+    _make_query_command(_name, _class)
+
+
+@main.command("single-image", help="Fetch one DICOM instance.")
+@click.option("--series-instance-uid", required=True)
+@click.option("--sop-instance-uid", required=True)
+@click.option(
+    "--output",
+    "-o",
+    type=click.File("wb"),
+    default="-",
+    help="Output file (default: stdout).",
+)
+@click.option(
+    "--chunk-size",
+    type=click.IntRange(min=1),
+    help="Fixed read size in bytes (default: adaptive).",
+)
+def single_image(series_instance_uid, sop_instance_uid, output, chunk_size):
+    client = _get_client(click.get_current_context())
+    client.single_image(
+        series_instance_uid=series_instance_uid,
+        sop_instance_uid=sop_instance_uid,
+    ).download(output, chunk_size=chunk_size)
+
+
+def _check_download_options(resume, extract, strategy):
+    # Checked before any query is sent, and reported as usage errors
+    # rather than the ValueError download_series() would raise.
+    if resume and extract:
+        raise click.UsageError("--resume and --extract cannot be combined")
+
+    if strategy != "zip" and not extract:
+        raise click.UsageError(f"--strategy {strategy} requires --extract")
+
+
+def _download(client, series_instance_uids, dest_dir, **options):
+    series_instance_uids = list(dict.fromkeys(series_instance_uids))
+    lock = threading.Lock()
+    progress = {"size_in_bytes": 0, "start": time.perf_counter()}
+
+    def throughput(_):
+        elapsed = time.perf_counter() - progress["start"]
+        rate = progress["size_in_bytes"] / max(elapsed, 1e-9) / 1024**2
+        return f"{rate:.1f} MiB/s"
+
+    with click.progressbar(
+        length=len(series_instance_uids),
+        label="Downloading series",
+        file=sys.stderr,
+        item_show_func=throughput,
+    ) as bar:
+
+        def callback(download):
+            with lock:
+                progress["size_in_bytes"] += download.size_in_bytes
+                bar.update(1, download)
+
+        report = client.download_series(
+            series_instance_uids, dest_dir, callback=callback, **options
+        )
+
+    for download in report.failed:
+        click.echo(
+            f"failed: {download.series_instance_uid}: {download.error}",
+            err=True,
+        )
+
+    size_in_mebibytes = report.size_in_bytes / 1024**2
+    click.echo(
+        f"{len(report.succeeded)} of {len(report.downloads)} series, "
+        f"{size_in_mebibytes:.1f} MiB in {report.elapsed:.1f} s "
+        f"({size_in_mebibytes / max(report.elapsed, 1e-9):.1f} MiB/s)",
+        err=True,
+    )
+
+    if report.failed:
+        sys.exit(1)
+
+
+def _download_options(command):
+    options = [
+        click.option(
+            "--dest-dir",
+            "-d",
+            type=click.Path(file_okay=False),
+            required=True,
+        ),
+        click.option(
+            "--workers",
+            type=click.IntRange(min=1),
+            default=4,
+            show_default=True,
+            help="Series downloaded concurrently.",
+        ),
+        click.option(
+            "--resume",
+            is_flag=True,
+            help="Continue interrupted zip downloads.",
+        ),
+        click.option(
+            "--extract",
+            is_flag=True,
+            help="Write DICOM files into a directory per series.",
+        ),
+        click.option(
+            "--strategy",
+            type=click.Choice(["zip", "instances", "auto"]),
+            default="zip",
+            show_default=True,
+        ),
+        click.option(
+            "--chunk-size",
+            type=click.IntRange(min=1),
+            help="Fixed read size in bytes (default: adaptive).",
+        ),
+    ]
+
+    for option in reversed(options):
+        command = option(command)
+
+    return command
+
+
+@main.command("download-series", help="Download series by UID.")
+@click.argument("series_instance_uids", nargs=-1)
+@click.option(
+    "--input",
+    "-i",
+    "input_",
+    type=click.File("rt"),
+    help="File of series instance UIDs, one per line ('-' for stdin).",
+)
+@_download_options
+def download_series(
+    series_instance_uids,
+    input_,
+    dest_dir,
+    workers,
+    resume,
+    extract,
+    strategy,
+    chunk_size,
+):
+    _check_download_options(resume, extract, strategy)
+    series_instance_uids = list(series_instance_uids)
+
+    if input_ is not None:
+        series_instance_uids.extend(
+            line.strip() for line in input_ if line.strip()
+        )
+
+    _download(
+        _get_client(click.get_current_context()),
+        series_instance_uids,
+        dest_dir,
+        max_workers=workers,
+        resume=resume,
+        extract=extract,
+        strategy=strategy,
+        chunk_size=chunk_size,
+    )
+
 
-@click.command()
-def main():
-    print("Hello, world!")
+@main.command(
+    "download-collection", help="Download every series of a collection."
+)
+@click.argument("collection")
+@click.option("--patient-id")
+@click.option("--modality")
+@_download_options
+def download_collection(
+    collection,
+    patient_id,
+    modality,
+    dest_dir,
+    workers,
+    resume,
+    extract,
+    strategy,
+    chunk_size,
+):
+    _check_download_options(resume, extract, strategy)
+    client = _get_client(click.get_current_context())
+    series = client.series(
+        collection=collection, patient_id=patient_id, modality=modality
+    ).iter()
+    _download(
+        client,
+        (record.series_instance_uid for record in series),
+        dest_dir,
+        max_workers=workers,
+        resume=resume,
+        extract=extract,
+        strategy=strategy,
+        chunk_size=chunk_size,
+    )
@@ -0,0 +1,250 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import concurrent.futures
+import os
+import shutil
+import time
+
+from tcia import _types
+
+
+__all__ = ["download_series"]
+
+
+_STRATEGIES = ["zip", "instances", "auto"]
+
+
+def _fan_out(client, series_instance_uid, strategy, thresholds):
+    if strategy != "auto":
+        return strategy == "instances"
+
+    min_objects, min_object_size, min_size = thresholds
+    (size,) = client.series_size(series_instance_uid=series_instance_uid).get()
+    objects = int(float(size.object_count or 0))
+    size_in_bytes = float(size.total_size_in_bytes or 0)
+
+    # Fan-out pays a request latency per object to escape the bandwidth
+    # cap of a single getImage stream, so it wins once objects are large
+    # next to the bandwidth-delay product, however many there are.
+    # benchmarks/download_strategy.py puts the crossover near a quarter
+    # of a BDP per object and a few BDPs in all; the defaults apply that
+    # to ~0.3 s per request and ~10 MB/s per stream (a 3 MB BDP).
+    return (
+        objects >= min_objects
+        and size_in_bytes >= min_size
+        and size_in_bytes / objects >= min_object_size
+    )
+
+
+def _download_instances(
+    client, series_instance_uid, path, chunk_size, max_workers
+):
+    sop_instance_uids = client.sop_instance_uids(
+        series_instance_uid=series_instance_uid
+    ).get()
+    store = client.store
+    os.makedirs(path, exist_ok=True)
+
+    def download(sop_instance_uid):
+        filename = f"{sop_instance_uid}.dcm"
+        single_image = client.single_image(
+            series_instance_uid=series_instance_uid,
+            sop_instance_uid=sop_instance_uid,
+        )
+
+        if store is not None:
+            return store.add_instance(
+                series_instance_uid,
+                filename,
+                single_image._get_content_iter(chunk_size),
+            ).size_in_bytes
+
+        instance_path = os.path.join(path, filename)
+        single_image.download(instance_path, chunk_size=chunk_size)
+        return os.path.getsize(instance_path)
+
+    if store is not None:
+        store.remove_series(series_instance_uid)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        size_in_bytes = sum(
+            executor.map(
+                download,
+                (record.sop_instance_uid for record in sop_instance_uids),
+            )
+        )
+
+    if store is not None:
+        store.mark_complete(series_instance_uid)
+        store.materialize(series_instance_uid, path)
+
+    return size_in_bytes
+
+
+def _download_one(client, series_instance_uid, dest_dir, options):
+    if options["extract"]:
+        path = os.path.join(dest_dir, series_instance_uid)
+    else:
+        path = os.path.join(dest_dir, f"{series_instance_uid}.zip")
+
+    chunk_size = options["chunk_size"]
+    start = time.perf_counter()
+
+    try:
+        store = client.store
+
+        if (
+            options["extract"]
+            and store is not None
+            and store.has_series(series_instance_uid)
+        ):
+            # Already stored for another cohort: link it in, no network.
+            size_in_bytes = sum(
+                os.path.getsize(member_path)
+                for member_path in store.materialize(series_instance_uid, path)
+            )
+        elif _fan_out(
+            client,
+            series_instance_uid,
+            options["strategy"],
+            options["fan_out_thresholds"],
+        ):
+            size_in_bytes = _download_instances(
+                client,
+                series_instance_uid,
+                path,
+                chunk_size,
+                options["instance_workers"],
+            )
+        elif options["extract"]:
+            images = client.images(series_instance_uid=series_instance_uid)
+            size_in_bytes = sum(
+                os.path.getsize(member_path)
+                for member_path in images.extract(path, chunk_size=chunk_size)
+            )
+        else:
+            images = client.images(series_instance_uid=series_instance_uid)
+            images.download(
+                path, chunk_size=chunk_size, resume=options["resume"]
+            )
+            size_in_bytes = os.path.getsize(path)
+    except Exception as error:
+        # Isolate the failure to this series: drop whatever was written
+        # (resumable downloads keep their partial file for the next run)
+        # and report the error instead of aborting the whole batch.
+        if options["extract"]:
+            shutil.rmtree(path, ignore_errors=True)
+        elif not options["resume"]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        return _types.SeriesDownload(
+            series_instance_uid=series_instance_uid,
+            path=None,
+            size_in_bytes=0,
+            elapsed=time.perf_counter() - start,
+            error=error,
+        )
+
+    return _types.SeriesDownload(
+        series_instance_uid=series_instance_uid,
+        path=path,
+        size_in_bytes=size_in_bytes,
+        elapsed=time.perf_counter() - start,
+        error=None,
+    )
+
+
+def download_series(
+    client,
+    series_instance_uids,
+    dest_dir,
+    *,
+    max_workers=4,
+    chunk_size=None,
+    resume=False,
+    extract=False,
+    strategy="zip",
+    instance_workers=8,
+    fan_out_min_objects=2,
+    fan_out_min_object_size_in_bytes=1024**2,
+    fan_out_min_size_in_bytes=16 * 1024**2,
+    callback=None,
+):
+    if not max_workers > 0:
+        raise ValueError("maximum number of workers must be greater than zero")
+
+    if not instance_workers > 0:
+        raise ValueError(
+            "number of instance workers must be greater than zero"
+        )
+
+    if strategy not in _STRATEGIES:
+        raise ValueError(
+            f"strategy '{strategy}' is not one of {', '.join(_STRATEGIES)}"
+        )
+
+    if resume and extract:
+        raise ValueError("resume and extract cannot be combined")
+
+    if strategy != "zip" and not extract:
+        raise ValueError(
+            f"strategy '{strategy}' writes series directories and requires "
+            "extract=True"
+        )
+
+    # Duplicates would race on the same destination file.
+    series_instance_uids = list(dict.fromkeys(series_instance_uids))
+    os.makedirs(dest_dir, exist_ok=True)
+    options = {
+        "chunk_size": chunk_size,
+        "resume": resume,
+        "extract": extract,
+        "strategy": strategy,
+        "instance_workers": instance_workers,
+        "fan_out_thresholds": (
+            max(1, fan_out_min_objects),
+            fan_out_min_object_size_in_bytes,
+            fan_out_min_size_in_bytes,
+        ),
+    }
+    start = time.perf_counter()
+
+    def download(series_instance_uid):
+        download = _download_one(
+            client, series_instance_uid, dest_dir, options
+        )
+
+        # Called from the worker thread as each series finishes, so that
+        # progress and journals do not wait for the whole batch.
+        if callback is not None:
+            callback(download)
+
+        return download
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        downloads = list(executor.map(download, series_instance_uids))
+
+    succeeded = [download for download in downloads if download.error is None]
+    failed = [download for download in downloads if download.error is not None]
+    return _types.DownloadReport(
+        downloads=downloads,
+        succeeded=succeeded,
+        failed=failed,
+        size_in_bytes=sum(download.size_in_bytes for download in succeeded),
+        elapsed=time.perf_counter() - start,
+    )
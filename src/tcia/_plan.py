@@ -0,0 +1,177 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import concurrent.futures
+import heapq
+import os
+import shutil
+
+from tcia import _types
+
+
+__all__ = ["balance", "plan_download"]
+
+
+# Record field -> key in the plain dicts that shared lists return.
+_KEYS = {
+    "series_instance_uid": "SeriesInstanceUID",
+    "collection": "Collection",
+    "patient_id": "PatientID",
+    "modality": "Modality",
+}
+
+
+def _field(series, name):
+    # A bare UID carries no hierarchy; it is totalled under None.
+    if isinstance(series, str):
+        return series if name == "series_instance_uid" else None
+
+    if isinstance(series, dict):
+        return series.get(_KEYS[name])
+
+    return getattr(series, name, None)
+
+
+def _series_instance_uid(series):
+    series_instance_uid = _field(series, "series_instance_uid")
+
+    if series_instance_uid is None:
+        raise ValueError(f"series has no SeriesInstanceUID: {series!r}")
+
+    return series_instance_uid
+
+
+def _estimate(client, series):
+    series_instance_uid = _series_instance_uid(series)
+    collection = _field(series, "collection")
+    patient_id = _field(series, "patient_id")
+    modality = _field(series, "modality")
+
+    # Goes through the client so that its catalog and response cache
+    # answer repeated plans without touching the network.
+    (size,) = client.series_size(series_instance_uid=series_instance_uid).get()
+    return _types.SeriesEstimate(
+        series_instance_uid=series_instance_uid,
+        collection=collection,
+        patient_id=patient_id,
+        modality=modality,
+        # The service reports sizes as decimal strings, e.g. "1234.0".
+        object_count=int(float(size.object_count or 0)),
+        size_in_bytes=int(float(size.total_size_in_bytes or 0)),
+    )
+
+
+def _totals(estimates):
+    return _types.SizeTotals(
+        series_count=len(estimates),
+        object_count=sum(estimate.object_count for estimate in estimates),
+        size_in_bytes=sum(estimate.size_in_bytes for estimate in estimates),
+    )
+
+
+def _totals_by(estimates, field):
+    groups = {}
+
+    for estimate in estimates:
+        groups.setdefault(getattr(estimate, field), []).append(estimate)
+
+    return {key: _totals(group) for key, group in groups.items()}
+
+
+def balance(estimates, batches):
+    if not batches > 0:
+        raise ValueError("number of batches must be greater than zero")
+
+    # Largest first onto the lightest batch; ties break on series UID
+    # and batch index so the same input always yields the same batches.
+    heap = [(0, index) for index in range(batches)]
+    balanced = [[] for _ in range(batches)]
+
+    for estimate in sorted(
+        estimates,
+        key=lambda estimate: (
+            -estimate.size_in_bytes,
+            estimate.series_instance_uid,
+        ),
+    ):
+        size_in_bytes, index = heapq.heappop(heap)
+        balanced[index].append(estimate)
+        heapq.heappush(heap, (size_in_bytes + estimate.size_in_bytes, index))
+
+    return balanced
+
+
+def _free_size_in_bytes(dest_dir):
+    # The destination may not exist yet; measure the volume it will be
+    # created on.
+    path = os.path.abspath(dest_dir)
+
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+
+    return shutil.disk_usage(path).free
+
+
+def plan_download(
+    client, series, *, dest_dir=None, batches=1, headroom=0.05, max_workers=16
+):
+    if not max_workers > 0:
+        raise ValueError("maximum number of workers must be greater than zero")
+
+    if not batches > 0:
+        raise ValueError("number of batches must be greater than zero")
+
+    if not headroom >= 0:
+        raise ValueError("headroom must not be negative")
+
+    # Duplicates would be counted, and later downloaded, twice.
+    unique = {}
+
+    for item in series:
+        unique.setdefault(_series_instance_uid(item), item)
+
+    series = list(unique.values())
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = [executor.submit(_estimate, client, item) for item in series]
+
+    estimates = []
+    failed = {}
+
+    for item, future in zip(series, futures):
+        try:
+            estimates.append(future.result())
+        except Exception as error:
+            failed[_series_instance_uid(item)] = error
+
+    totals = _totals(estimates)
+
+    if dest_dir is None:
+        free_size_in_bytes = None
+        fits = None
+    else:
+        free_size_in_bytes = _free_size_in_bytes(dest_dir)
+        fits = totals.size_in_bytes * (1 + headroom) <= free_size_in_bytes
+
+    return _types.DownloadPlan(
+        series=estimates,
+        failed=failed,
+        totals=totals,
+        by_collection=_totals_by(estimates, "collection"),
+        by_patient=_totals_by(estimates, "patient_id"),
+        by_modality=_totals_by(estimates, "modality"),
+        batches=balance(estimates, batches),
+        free_size_in_bytes=free_size_in_bytes,
+        fits=fits,
+    )
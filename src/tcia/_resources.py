@@ -12,10 +12,18 @@
 # implied. See the License for the specific language governing
 # permissions and limitations under the License.
 # ----------------------------------------------------------------------
+import concurrent.futures
 import json
+import os
+import threading
+import types
 
+from tcia import columnar
+from tcia import _resume
+from tcia import _transport
 from tcia import _types
 from tcia import _utils
+from tcia import _zipstream
 
 
 __all__ = [
@@ -32,22 +40,67 @@ __all__ = [
     "SOPInstanceUIDsResource",
     "SingleImageResource",
     "ContentsByNameResource",
+    "invalidate_metadata",
 ]
 
 
+# Endpoint metadata is static per deployment, so it is shared by every
+# resource instance (and every Client) in the process.
+_metadata_cache = {}
+_metadata_lock = threading.Lock()
+
+_NO_PARAMS = types.MappingProxyType({})
+
+
+def _parse_metadata(data):
+    return _types.Metadata(
+        query_name=data["QueryName"],
+        description=data["Description"],
+        parameters=[param for param in data["Parameters"]],
+        result=_types.Result(
+            name=data["Result"]["Name"],
+            description=data["Result"]["Description"],
+            attributes=[
+                _types.Attribute(
+                    name=attr["Name"],
+                    description=attr["Description"],
+                    dicom=attr["DICOM"],
+                )
+                for attr in data["Result"]["Attributes"]
+            ],
+        ),
+    )
+
+
+def invalidate_metadata(base_url=None, *, resource=None, endpoint=None):
+    with _metadata_lock:
+        for key in list(_metadata_cache):
+            if all(
+                value is None or value == part
+                for value, part in zip((base_url, resource, endpoint), key)
+            ):
+                del _metadata_cache[key]
+
+
 class _Resource:
 
     _required_params = []
 
-    def __init__(self, api_key, base_url, *, resource, endpoint):
+    def __init__(
+        self, api_key, base_url, *, resource, endpoint, transport=None
+    ):
+        if transport is None:
+            transport = _transport.Transport()
+
         self._api_key = api_key
         self._base_url = base_url
         self._resource = resource
         self._endpoint = endpoint
         self._headers = {"api_key": api_key}
         self._url = f"{base_url}/{resource}/query/{endpoint}"
-        self._params = {}
-        self._metadata = None
+        self._params = _NO_PARAMS
+        self._transport = transport
+        self._key = self._make_key()
 
     def __repr__(self):
         return (
@@ -58,6 +111,33 @@ class _Resource:
     def __call__(self):
         return self
 
+    def __eq__(self, other):
+        if not isinstance(other, _Resource):
+            return NotImplemented
+        return self._key == other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def _make_key(self):
+        # Unset params equal omitted ones, as neither reaches the query
+        # string. Built once per query, not on every __hash__/__eq__.
+        return (
+            self.__class__,
+            self._url,
+            self._api_key,
+            frozenset(_utils._filter_none_from_dict(self._params).items()),
+        )
+
+    def _with_params(self, params):
+        # Queries are immutable: a call returns a new query, so one
+        # instance can be shared by threads and used as a key.
+        resource = object.__new__(self.__class__)
+        resource.__dict__.update(self.__dict__)
+        resource._params = types.MappingProxyType({**self._params, **params})
+        resource._key = resource._make_key()
+        return resource
+
     @classmethod
     def _check_required_params(cls, params):
         for param in cls._required_params:
@@ -70,35 +150,45 @@ class _Resource:
 
     @property
     def metadata(self):
-        if self._metadata is None:
+        key = (self._base_url, self._resource, self._endpoint)
+        metadata = _metadata_cache.get(key)
+
+        if metadata is None:
             url = f"{self._url}/metadata"
-            text = _utils.get_text(url, headers=self._headers)
-            data = json.loads(text)
-            metadata = _types.Metadata(
-                query_name=data["QueryName"],
-                description=data["Description"],
-                parameters=[param for param in data["Parameters"]],
-                result=_types.Result(
-                    name=data["Result"]["Name"],
-                    description=data["Result"]["Description"],
-                    attributes=[
-                        _types.Attribute(
-                            name=attr["Name"],
-                            description=attr["Description"],
-                            dicom=attr["DICOM"],
-                        )
-                        for attr in data["Result"]["Attributes"]
-                    ],
-                ),
-            )
-            self._metadata = metadata
-        return self._metadata
+            text = self._transport.get_text(url, headers=self._headers)
+            metadata = _parse_metadata(json.loads(text))
+
+            with _metadata_lock:
+                metadata = _metadata_cache.setdefault(key, metadata)
+
+        return metadata
 
 
 class _TextResource(_Resource):
 
     _formats = ["csv", "html", "xml", "json"]
     _required_params = []
+    _record_type = None
+    _categorical_fields = []
+
+    def __init__(
+        self,
+        api_key,
+        base_url,
+        *,
+        resource,
+        endpoint,
+        transport=None,
+        catalog=None,
+    ):
+        super().__init__(
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+        )
+        self._catalog = catalog
 
     @classmethod
     def _check_format(cls, format_):
@@ -109,38 +199,204 @@ class _TextResource(_Resource):
 
     def get(self):
         self.__class__._check_required_params(self._params)
-        self._params.update({"format": "json"})
-        text = _utils.get_text(
-            self._url, headers=self._headers, params=self._params
+        params = _utils._filter_none_from_dict(
+            {**self._params, "format": "json"}
         )
-        data = json.loads(text)
-        return data
 
-    def download(
-        self, path_or_buffer, format_="csv", *, mode="wt", encoding="utf-8"
-    ):
+        if self._catalog is not None:
+            records = self._catalog.lookup(self._endpoint, params)
+
+            if records is not None:
+                return records
+
+        def fetch():
+            text = self._transport.get_text(
+                self._url, headers=self._headers, params=params
+            )
+            data = json.loads(text)
+            records = [self._make_record(element) for element in data]
+
+            if self._catalog is not None:
+                self._catalog.store(self._endpoint, params, records)
+
+            return records
+
+        records = self._transport.coalesce(
+            "records",
+            self._url,
+            fetch,
+            headers=self._headers,
+            params=params,
+        )
+
+        # Coalesced callers share one list; each gets its own copy.
+        return list(records)
+
+    def get_many(self, *, max_workers=16, **kwargs):
+        if not max_workers > 0:
+            raise ValueError(
+                "maximum number of workers must be greater than zero"
+            )
+
+        many = [
+            name
+            for name, value in kwargs.items()
+            if not isinstance(value, (str, bytes))
+            and hasattr(value, "__iter__")
+        ]
+
+        if len(many) != 1:
+            raise TypeError(
+                f"{self.__class__.__name__}().get_many() takes exactly one "
+                f"list of values, got {len(many)}"
+            )
+
+        (name,) = many
+        values = list(dict.fromkeys(kwargs.pop(name)))
+        # Built up front so that a bad keyword fails here, not per value.
+        # Only the keywords given are set: filters already on this query
+        # are kept, not reset to None by the call.
+        queries = [
+            self._with_params(
+                _utils._filter_none_from_dict(
+                    self(**kwargs, **{name: value})._params
+                )
+            )
+            for value in values
+        ]
+
+        for query in queries:
+            query.__class__._check_required_params(query._params)
+
+        results = {}
+        failed = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            futures = [executor.submit(query.get) for query in queries]
+
+            for value, future in zip(values, futures):
+                try:
+                    results[value] = future.result()
+                except Exception as error:
+                    failed[value] = error
+
+        return _types.BatchResult(
+            records=[
+                record for records in results.values() for record in records
+            ],
+            results=results,
+            failed=failed,
+        )
+
+    def iter(self, chunk_size=65536):
+        self.__class__._check_required_params(self._params)
+        text_iter = self._transport.get_text_iter(
+            self._url,
+            headers=self._headers,
+            params={**self._params, "format": "json"},
+            chunk_size=chunk_size,
+        )
+        return (
+            self._make_record(element)
+            for element in _utils.iter_json_array(text_iter)
+        )
+
+    def iter_text(self, format_="csv", chunk_size=65536):
         self.__class__._check_required_params(self._params)
         self.__class__._check_format(format_)
-        self._params.update({"format": format_})
-        text = _utils.get_text(
-            self._url, headers=self._headers, params=self._params
+        return self._transport.get_text_iter(
+            self._url,
+            headers=self._headers,
+            params={**self._params, "format": format_},
+            chunk_size=chunk_size,
+        )
+
+    def get_table(self, chunk_size=65536):
+        if self._record_type is None:
+            raise TypeError(
+                f"{self.__class__.__name__} results have no columnar form"
+            )
+
+        return columnar.Table.from_records(
+            self.iter(chunk_size),
+            self._record_type,
+            categorical=self._categorical_fields,
+        )
+
+    @staticmethod
+    def _make_record(element):
+        return element
+
+    def download(
+        self,
+        path_or_buffer,
+        format_="csv",
+        *,
+        mode="wt",
+        encoding="utf-8",
+        chunk_size=65536,
+    ):
+        # Written as it is decoded, so exports of any size use constant
+        # memory.
+        text_iter = self.iter_text(format_, chunk_size)
+        _utils.write_text_iter(
+            text_iter, path_or_buffer, mode=mode, encoding=encoding
         )
-        _utils.write_text(text, path_or_buffer, mode=mode, encoding=encoding)
 
 
 class _BytesResource(_Resource):
 
     _required_params = []
 
-    def download(self, path_or_buffer, chunk_size=1024, *, mode="wb"):
+    def download(
+        self, path_or_buffer, chunk_size=None, *, mode="wb", resume=False
+    ):
         self.__class__._check_required_params(self._params)
-        content_iter = _utils.get_content_iter(
+
+        if resume:
+            if not isinstance(path_or_buffer, (str, os.PathLike)):
+                raise TypeError("resume requires a path, not a buffer")
+
+            _resume.download_resumable(
+                self._transport,
+                self._url,
+                os.fspath(path_or_buffer),
+                headers=self._headers,
+                params=self._params,
+                chunk_size=chunk_size,
+            )
+            return
+
+        if chunk_size is not None and not chunk_size > 0:
+            raise ValueError("chunk size in bytes must be greater than zero")
+
+        response = self._transport.get_response(
+            self._url, headers=self._headers, params=self._params, stream=True
+        )
+        _utils._raise_for_status(response)
+        _utils.write_response_content(
+            response, path_or_buffer, mode=mode, chunk_size=chunk_size
+        )
+
+    def read(self, chunk_size=65536):
+        return b"".join(self._get_content_iter(chunk_size))
+
+    def _get_content_iter(self, chunk_size):
+        # None picks the sink's own sizing in download(); iterators need
+        # a fixed size.
+        if chunk_size is None:
+            chunk_size = 65536
+
+        if not chunk_size > 0:
+            raise ValueError("chunk size in bytes must be greater than zero")
+
+        self.__class__._check_required_params(self._params)
+        return self._transport.get_content_iter(
             self._url,
             headers=self._headers,
             params=self._params,
             chunk_size=chunk_size,
         )
-        _utils.write_streaming_content(content_iter, path_or_buffer, mode=mode)
 
 
 class CollectionsResource(_TextResource):
@@ -151,18 +407,21 @@ class CollectionsResource(_TextResource):
         *,
         resource="TCIA",
         endpoint="getCollectionValues",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
-    def get(self):
-        data = super().get()
-        collections = [
-            _types.Collection(collection=element.get("Collection"))
-            for element in data
-        ]
-        return collections
+    @staticmethod
+    def _make_record(element):
+        return _types.Collection(collection=element.get("Collection"))
 
 
 class ModalitiesResource(_TextResource):
@@ -173,24 +432,26 @@ class ModalitiesResource(_TextResource):
         *,
         resource="TCIA",
         endpoint="getModalityValues",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(self, *, collection=None, body_part_examined=None):
-        self._params.update(
+        return self._with_params(
             {"Collection": collection, "BodyPartExamined": body_part_examined}
         )
-        return self
 
-    def get(self):
-        data = super().get()
-        modalities = [
-            _types.Modality(modality=element.get("Modality"))
-            for element in data
-        ]
-        return modalities
+    @staticmethod
+    def _make_record(element):
+        return _types.Modality(modality=element.get("Modality"))
 
 
 class BodyPartsExaminedResource(_TextResource):
@@ -201,24 +462,28 @@ class BodyPartsExaminedResource(_TextResource):
         *,
         resource="TCIA",
         endpoint="getBodyPartValues",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(self, *, collection=None, modality=None):
-        self._params.update({"Collection": collection, "Modality": modality})
-        return self
+        return self._with_params(
+            {"Collection": collection, "Modality": modality}
+        )
 
-    def get(self):
-        data = super().get()
-        body_parts_examined = [
-            _types.BodyPartExamined(
-                body_part_examined=element.get("BodyPartExamined")
-            )
-            for element in data
-        ]
-        return body_parts_examined
+    @staticmethod
+    def _make_record(element):
+        return _types.BodyPartExamined(
+            body_part_examined=element.get("BodyPartExamined")
+        )
 
 
 class ManufacturersResource(_TextResource):
@@ -229,61 +494,76 @@ class ManufacturersResource(_TextResource):
         *,
         resource="TCIA",
         endpoint="getManufacturerValues",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(
         self, *, collection=None, modality=None, body_part_examined=None
     ):
-        self._params.update(
+        return self._with_params(
             {
                 "Collection": collection,
                 "Modality": modality,
                 "BodyPartExamined": body_part_examined,
             }
         )
-        return self
 
-    def get(self):
-        data = super().get()
-        manufacturers = [
-            _types.Manufacturer(manufacturer=element.get("Manufacturer"))
-            for element in data
-        ]
-        return manufacturers
+    @staticmethod
+    def _make_record(element):
+        return _types.Manufacturer(manufacturer=element.get("Manufacturer"))
 
 
 class PatientsResource(_TextResource):
+
+    _record_type = _types.Patient
+    _categorical_fields = ["patient_sex", "collection"]
+
     def __init__(
-        self, api_key, base_url, *, resource="TCIA", endpoint="getPatient"
+        self,
+        api_key,
+        base_url,
+        *,
+        resource="TCIA",
+        endpoint="getPatient",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(self, *, collection=None):
-        self._params.update({"Collection": collection})
-        return self
-
-    def get(self):
-        data = super().get()
-        patients = [
-            _types.Patient(
-                patient_id=element.get("PatientID"),
-                patient_name=element.get("PatientName"),
-                patient_sex=element.get("PatientSex"),
-                collection=element.get("Collection"),
-            )
-            for element in data
-        ]
-        return patients
+        return self._with_params({"Collection": collection})
+
+    @staticmethod
+    def _make_record(element):
+        return _types.Patient(
+            patient_id=element.get("PatientID"),
+            patient_name=element.get("PatientName"),
+            patient_sex=element.get("PatientSex"),
+            collection=element.get("Collection"),
+        )
 
 
 class PatientsByModalityResource(_TextResource):
 
     _required_params = ["Collection", "Modality"]
+    _record_type = _types.Patient
+    _categorical_fields = ["patient_sex", "collection"]
 
     def __init__(
         self,
@@ -292,74 +572,114 @@ class PatientsByModalityResource(_TextResource):
         *,
         resource="TCIA",
         endpoint="PatientsByModality",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(self, *, collection, modality):
-        self._params.update({"Collection": collection, "Modality": modality})
-        return self
+        return self._with_params(
+            {"Collection": collection, "Modality": modality}
+        )
 
-    def get(self):
-        data = super().get()
-        patient_by_modality = [
-            _types.PatientByModality(
-                patient_id=element.get("PatientID"),
-                patient_name=element.get("PatientName"),
-                patient_sex=element.get("PatientSex"),
-                collection=element.get("Collection"),
-            )
-            for element in data
-        ]
-        return patients
+    @staticmethod
+    def _make_record(element):
+        return _types.Patient(
+            patient_id=element.get("PatientID"),
+            patient_name=element.get("PatientName"),
+            patient_sex=element.get("PatientSex"),
+            collection=element.get("Collection"),
+        )
 
 
 class PatientStudiesResource(_TextResource):
+
+    _record_type = _types.PatientStudy
+    _categorical_fields = ["patient_age", "patient_sex", "collection"]
+
     def __init__(
-        self, api_key, base_url, *, resource="TCIA", endpoint="getPatientStudy"
+        self,
+        api_key,
+        base_url,
+        *,
+        resource="TCIA",
+        endpoint="getPatientStudy",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(
         self, *, collection=None, patient_id=None, study_instance_uid=None
     ):
-        self._params.update(
+        return self._with_params(
             {
                 "Collection": collection,
                 "PatientID": patient_id,
                 "StudyInstanceUID": study_instance_uid,
             }
         )
-        return self
 
-    def get(self):
-        data = super().get()
-        patient_studies = [
-            _types.PatientStudy(
-                study_instance_uid=element.get("StudyInstanceUID"),
-                study_date=element.get("StudyDate"),
-                study_description=element.get("StudyDescription"),
-                patient_age=element.get("PatientAge"),
-                patient_id=element.get("PatientID"),
-                patient_name=element.get("PatientName"),
-                patient_sex=element.get("PatientSex"),
-                collection=element.get("Collection"),
-                series_count=element.get("SeriesCount"),
-            )
-            for element in data
-        ]
-        return patient_studies
+    @staticmethod
+    def _make_record(element):
+        return _types.PatientStudy(
+            study_instance_uid=element.get("StudyInstanceUID"),
+            study_date=element.get("StudyDate"),
+            study_description=element.get("StudyDescription"),
+            patient_age=element.get("PatientAge"),
+            patient_id=element.get("PatientID"),
+            patient_name=element.get("PatientName"),
+            patient_sex=element.get("PatientSex"),
+            collection=element.get("Collection"),
+            series_count=element.get("SeriesCount"),
+        )
 
 
 class SeriesResource(_TextResource):
+
+    _record_type = _types.Series
+    _categorical_fields = [
+        "modality",
+        "protocol_name",
+        "body_part_examined",
+        "annotations_flag",
+        "collection",
+        "manufacturer",
+        "manufacturer_model_name",
+        "software_version",
+    ]
+
     def __init__(
-        self, api_key, base_url, *, resource="TCIA", endpoint="getSeries"
+        self,
+        api_key,
+        base_url,
+        *,
+        resource="TCIA",
+        endpoint="getSeries",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(
@@ -373,7 +693,7 @@ class SeriesResource(_TextResource):
         manufacturer_model_name=None,
         manufacturer=None,
     ):
-        self._params.update(
+        return self._with_params(
             {
                 "Collection": collection,
                 "StudyInstanceUID": study_instance_uid,
@@ -384,31 +704,26 @@ class SeriesResource(_TextResource):
                 "Manufacturer": manufacturer,
             }
         )
-        return self
 
-    def get(self):
-        data = super().get()
-        series_list = [
-            _types.Series(
-                series_instance_uid=element.get("SeriesInstanceUID"),
-                study_instance_uid=element.get("StudyInstanceUID"),
-                modality=element.get("Modality"),
-                protocol_name=element.get("ProtocolName"),
-                series_date=element.get("SeriesDate"),
-                series_description=element.get("SeriesDescription"),
-                body_part_examined=element.get("BodyPartExamined"),
-                series_number=element.get("SeriesNumber"),
-                annotations_flag=element.get("AnnotationsFlag"),
-                collection=element.get("Collection"),
-                patient_id=element.get("PatientID"),
-                manufacturer=element.get("Manufacturer"),
-                manufacturer_model_name=element.get("ManufacturerModelName"),
-                software_version=element.get("SoftwareVersion"),
-                image_count=element.get("ImageCount"),
-            )
-            for element in data
-        ]
-        return series_list
+    @staticmethod
+    def _make_record(element):
+        return _types.Series(
+            series_instance_uid=element.get("SeriesInstanceUID"),
+            study_instance_uid=element.get("StudyInstanceUID"),
+            modality=element.get("Modality"),
+            protocol_name=element.get("ProtocolName"),
+            series_date=element.get("SeriesDate"),
+            series_description=element.get("SeriesDescription"),
+            body_part_examined=element.get("BodyPartExamined"),
+            series_number=element.get("SeriesNumber"),
+            annotations_flag=element.get("AnnotationsFlag"),
+            collection=element.get("Collection"),
+            patient_id=element.get("PatientID"),
+            manufacturer=element.get("Manufacturer"),
+            manufacturer_model_name=element.get("ManufacturerModelName"),
+            software_version=element.get("SoftwareVersion"),
+            image_count=element.get("ImageCount"),
+        )
 
 
 class SeriesSizeResource(_TextResource):
@@ -416,26 +731,33 @@ class SeriesSizeResource(_TextResource):
     _required_params = ["SeriesInstanceUID"]
 
     def __init__(
-        self, api_key, base_url, *, resource="TCIA", endpoint="getSeriesSize"
+        self,
+        api_key,
+        base_url,
+        *,
+        resource="TCIA",
+        endpoint="getSeriesSize",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(self, *, series_instance_uid):
-        self._params.update({"SeriesInstanceUID": series_instance_uid})
-        return self
+        return self._with_params({"SeriesInstanceUID": series_instance_uid})
 
-    def get(self):
-        data = super().get()
-        series_sizes = [
-            _types.SeriesSize(
-                total_size_in_bytes=element.get("TotalSizeInBytes"),
-                object_count=element.get("ObjectCount"),
-            )
-            for element in data
-        ]
-        return series_sizes
+    @staticmethod
+    def _make_record(element):
+        return _types.SeriesSize(
+            total_size_in_bytes=element.get("TotalSizeInBytes"),
+            object_count=element.get("ObjectCount"),
+        )
 
 
 class ImagesResource(_BytesResource):
@@ -443,15 +765,49 @@ class ImagesResource(_BytesResource):
     _required_params = ["SeriesInstanceUID"]
 
     def __init__(
-        self, api_key, base_url, *, resource="TCIA", endpoint="getImage"
+        self,
+        api_key,
+        base_url,
+        *,
+        resource="TCIA",
+        endpoint="getImage",
+        transport=None,
+        store=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
         )
+        self._store = store
 
     def __call__(self, *, series_instance_uid):
-        self._params.update({"SeriesInstanceUID": series_instance_uid})
-        return self
+        return self._with_params({"SeriesInstanceUID": series_instance_uid})
+
+    def iter_files(self, chunk_size=65536):
+        content_iter = self._get_content_iter(chunk_size)
+
+        for name, data_iter in _zipstream.iter_members(content_iter):
+            if not name.endswith("/"):
+                yield name, b"".join(data_iter)
+
+    def extract(self, dest_dir, chunk_size=65536):
+        if self._store is None:
+            content_iter = self._get_content_iter(chunk_size)
+            return _zipstream.extract(content_iter, os.fspath(dest_dir))
+
+        self.__class__._check_required_params(self._params)
+        series_instance_uid = self._params["SeriesInstanceUID"]
+
+        if not self._store.has_series(series_instance_uid):
+            content_iter = self._get_content_iter(chunk_size)
+            self._store.add_series(
+                series_instance_uid, _zipstream.iter_members(content_iter)
+            )
+
+        return self._store.materialize(series_instance_uid, dest_dir)
 
 
 class NewPatientsInCollectionResource(_TextResource):
@@ -465,26 +821,27 @@ class NewPatientsInCollectionResource(_TextResource):
         *,
         resource="TCIA",
         endpoint="NewPatientsInCollection",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(self, *, date, collection):
-        self._params.update({"Date": date, "Collection": collection})
-        self._configured = True
-        return self
+        return self._with_params({"Date": date, "Collection": collection})
 
-    def get(self):
-        data = super().get()
-        new_patients_in_collection = [
-            _types.NewPatientInCollection(
-                patient_id=element.get("PatientID"),
-                collection=element.get("Collection"),
-            )
-            for element in data
-        ]
-        return new_patients_in_collection
+    @staticmethod
+    def _make_record(element):
+        return _types.NewPatientInCollection(
+            patient_id=element.get("PatientID"),
+            collection=element.get("Collection"),
+        )
 
 
 class NewStudiesInPatientCollectionResource(_TextResource):
@@ -498,33 +855,36 @@ class NewStudiesInPatientCollectionResource(_TextResource):
         *,
         resource="TCIA",
         endpoint="NewStudiesInPatientCollection",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(self, *, date, collection, patient_id=None):
-        self._params.update(
-            {"Date": date, "Collection": collection, "PateintID": patient_id}
+        return self._with_params(
+            {"Date": date, "Collection": collection, "PatientID": patient_id}
         )
-        return self
 
-    def get(self):
-        data = super().get()
-        new_studies_in_patient_collection = [
-            _types.NewStudyInPatientCollection(
-                patient_id=element.get("PatientID"),
-                collection=element.get("Collection"),
-                study_instance_uid=element.get("StudyInstanceUID"),
-            )
-            for element in data
-        ]
-        return new_studies_in_patient_collection
+    @staticmethod
+    def _make_record(element):
+        return _types.NewStudyInPatientCollection(
+            patient_id=element.get("PatientID"),
+            collection=element.get("Collection"),
+            study_instance_uid=element.get("StudyInstanceUID"),
+        )
 
 
 class SOPInstanceUIDsResource(_TextResource):
 
     _required_params = ["SeriesInstanceUID"]
+    _record_type = _types.SOPInstanceUID
 
     def __init__(
         self,
@@ -533,26 +893,28 @@ class SOPInstanceUIDsResource(_TextResource):
         *,
         resource="TCIA",
         endpoint="getSOPInstanceUIDs",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(self, *, series_instance_uid):
-        self._params.update({"SeriesInstanceUID": series_instance_uid})
-        return self
-
-    def get(self):
-        data = super().get()
-        sop_instance_uids = [
-            _types.SOPInstanceUID(
-                # API documentation inconsistent: "sop_instance_uid" not
-                #   "SOPInstanceUID". Reason unknown.
-                sop_instance_uid=element.get("sop_instance_uid")
-            )
-            for element in data
-        ]
-        return sop_instance_uids
+        return self._with_params({"SeriesInstanceUID": series_instance_uid})
+
+    @staticmethod
+    def _make_record(element):
+        return _types.SOPInstanceUID(
+            # API documentation inconsistent: "sop_instance_uid" not
+            #   "SOPInstanceUID". Reason unknown.
+            sop_instance_uid=element.get("sop_instance_uid")
+        )
 
 
 class SingleImageResource(_BytesResource):
@@ -560,20 +922,29 @@ class SingleImageResource(_BytesResource):
     _required_params = ["SeriesInstanceUID", "SOPInstanceUID"]
 
     def __init__(
-        self, api_key, base_url, *, resource="TCIA", endpoint="getSingleImage"
+        self,
+        api_key,
+        base_url,
+        *,
+        resource="TCIA",
+        endpoint="getSingleImage",
+        transport=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
         )
 
     def __call__(self, *, series_instance_uid, sop_instance_uid):
-        self._params.update(
+        return self._with_params(
             {
                 "SeriesInstanceUID": series_instance_uid,
                 "SOPInstanceUID": sop_instance_uid,
             }
         )
-        return self
 
 
 class ContentsByNameResource(_TextResource):
@@ -587,15 +958,17 @@ class ContentsByNameResource(_TextResource):
         *,
         resource="SharedList",
         endpoint="ContentsByName",
+        transport=None,
+        catalog=None,
     ):
         super().__init__(
-            api_key, base_url, resource=resource, endpoint=endpoint
+            api_key,
+            base_url,
+            resource=resource,
+            endpoint=endpoint,
+            transport=transport,
+            catalog=catalog,
         )
 
     def __call__(self, *, name):
-        self._params.update({"name": name})
-        return self
-
-    def get(self):
-        data = super().get()
-        return data
+        return self._with_params({"name": name})
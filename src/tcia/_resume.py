@@ -0,0 +1,142 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import json
+import os
+
+from tcia import _utils
+
+
+__all__ = ["download_resumable"]
+
+_PARTIAL_CONTENT = 206
+_RANGE_NOT_SATISFIABLE = 416
+
+
+def _read_journal(journal_path, url, params):
+    try:
+        with open(journal_path, mode="rt", encoding="utf-8") as buffer:
+            journal = json.load(buffer)
+    except (OSError, ValueError):
+        return None
+
+    # A journal left behind by a different request describes some other
+    # payload, so the partial file next to it cannot be resumed.
+    if journal.get("url") != url or journal.get("params") != params:
+        return None
+
+    return journal
+
+
+def _write_journal(journal_path, journal):
+    temp_path = f"{journal_path}.tmp"
+
+    with open(temp_path, mode="wt", encoding="utf-8") as buffer:
+        json.dump(journal, buffer)
+
+    os.replace(temp_path, journal_path)
+
+
+def _content_range_start(response):
+    # Content-Range: bytes <start>-<end>/<length or *>
+    try:
+        unit, range_ = response.headers["Content-Range"].split(" ", 1)
+        start = int(range_.split("-", 1)[0])
+    except (KeyError, ValueError):
+        return None
+
+    if unit != "bytes":
+        return None
+
+    return start
+
+
+def _request(transport, url, headers, params, offset, journal):
+    headers = dict(headers)
+
+    if offset > 0:
+        headers["Range"] = f"bytes={offset}-"
+        validator = journal.get("etag") or journal.get("last_modified")
+
+        if validator is not None:
+            headers["If-Range"] = validator
+
+    return transport.get_response(
+        url, headers=headers, params=params, stream=True
+    )
+
+
+def download_resumable(
+    transport, url, path, *, headers=None, params=None, chunk_size=None
+):
+    if chunk_size is not None and not chunk_size > 0:
+        raise ValueError("chunk size in bytes must be greater than zero")
+
+    if headers is None:
+        headers = {}
+
+    params = _utils._filter_none_from_dict({} if params is None else params)
+
+    # Only a completed download ever occupies the final path.
+    if os.path.exists(path):
+        return
+
+    part_path = f"{path}.part"
+    journal_path = f"{path}.part.json"
+    journal = _read_journal(journal_path, url, params)
+    offset = 0
+
+    if journal is not None and os.path.exists(part_path):
+        offset = os.path.getsize(part_path)
+
+    response = _request(transport, url, headers, params, offset, journal)
+
+    if offset > 0 and response.status_code == _RANGE_NOT_SATISFIABLE:
+        response.close()
+        offset = 0
+        response = _request(transport, url, headers, params, offset, journal)
+
+    _utils._raise_for_status(response)
+
+    # A server that ignores Range (or whose If-Range validator no longer
+    # matches) answers 200 with the whole body: start over from zero.
+    if offset > 0 and (
+        response.status_code != _PARTIAL_CONTENT
+        or _content_range_start(response) != offset
+    ):
+        if response.status_code == _PARTIAL_CONTENT:
+            response.close()
+            response = _request(transport, url, headers, params, 0, None)
+            _utils._raise_for_status(response)
+
+        offset = 0
+
+    _write_journal(
+        journal_path,
+        {
+            "url": url,
+            "params": params,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        },
+    )
+
+    with response, open(
+        part_path, mode="ab" if offset else "wb", buffering=0
+    ) as buffer:
+        buffer.truncate(offset)
+        _utils._copy_response_content(response, buffer, chunk_size)
+
+    os.replace(part_path, path)
+    os.remove(journal_path)
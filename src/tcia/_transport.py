@@ -0,0 +1,642 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import random
+import threading
+import time
+
+from tcia import _utils
+
+
+__all__ = ["RateLimiter", "RetryPolicy", "Transport"]
+
+
+def _parse_retry_after(value):
+    # Retry-After: <delay-seconds> | <HTTP-date>
+    if value is None:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    import email.utils
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    return max(0.0, date.timestamp() - time.time())
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        total=5,
+        *,
+        backoff_factor=0.5,
+        backoff_max=30.0,
+        statuses=(429, 500, 502, 503, 504),
+        respect_retry_after=True,
+    ):
+        if not total >= 0:
+            raise ValueError("total number of retries must not be negative")
+
+        if not backoff_factor >= 0:
+            raise ValueError("backoff factor must not be negative")
+
+        self._total = total
+        self._backoff_factor = backoff_factor
+        self._backoff_max = backoff_max
+        self._statuses = frozenset(statuses)
+        self._respect_retry_after = respect_retry_after
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({self._total}, "
+            f"backoff_factor={self._backoff_factor}, "
+            f"backoff_max={self._backoff_max}, "
+            f"statuses={sorted(self._statuses)}, "
+            f"respect_retry_after={self._respect_retry_after})"
+        )
+
+    @property
+    def total(self):
+        return self._total
+
+    @property
+    def statuses(self):
+        return self._statuses
+
+    def delay(self, attempt, retry_after=None):
+        if self._respect_retry_after:
+            seconds = _parse_retry_after(retry_after)
+
+            if seconds is not None:
+                return seconds
+
+        # "Full jitter": spreads retries of a thundering herd uniformly
+        # over the exponential window instead of synchronizing them.
+        ceiling = min(self._backoff_max, self._backoff_factor * 2**attempt)
+        return random.uniform(0, ceiling)
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        rate=10.0,
+        *,
+        burst=None,
+        concurrency=4,
+        min_concurrency=1,
+        max_concurrency=32,
+        target_latency=1.0,
+    ):
+        if not rate > 0:
+            raise ValueError(
+                "rate in requests per second must be greater than zero"
+            )
+
+        if not 0 < min_concurrency <= concurrency <= max_concurrency:
+            raise ValueError(
+                "concurrency must satisfy "
+                "0 < min_concurrency <= concurrency <= max_concurrency"
+            )
+
+        if burst is None:
+            burst = max(1.0, rate)
+
+        self._rate = rate
+        self._burst = burst
+        self._min_concurrency = min_concurrency
+        self._max_concurrency = max_concurrency
+        self._target_latency = target_latency
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._limit = float(concurrency)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}({self._rate}, burst={self._burst}, "
+            f"concurrency={self.concurrency}, "
+            f"min_concurrency={self._min_concurrency}, "
+            f"max_concurrency={self._max_concurrency}, "
+            f"target_latency={self._target_latency})"
+        )
+
+    def __getstate__(self):
+        # Unpickled, a limiter starts afresh in its own process: the
+        # limits then apply per process.
+        state = self.__dict__.copy()
+        state["_tokens"] = float(self._burst)
+        state["_in_flight"] = 0
+        del state["_updated"]
+        del state["_condition"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def concurrency(self):
+        return int(self._limit)
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self._burst,
+                    self._tokens + (now - self._updated) * self._rate,
+                )
+                self._updated = now
+
+                if self._in_flight < int(self._limit) and self._tokens >= 1:
+                    self._tokens -= 1
+                    self._in_flight += 1
+                    return
+
+                if self._tokens < 1:
+                    self._condition.wait((1 - self._tokens) / self._rate)
+                else:
+                    self._condition.wait()
+
+    def release(self, latency, *, throttled=False):
+        # AIMD on the concurrency limit: grow by about one slot per
+        # window of healthy responses, back off on slow or throttled ones.
+        with self._condition:
+            self._in_flight -= 1
+
+            if throttled:
+                self._limit *= 0.5
+            elif latency > self._target_latency:
+                self._limit *= 0.9
+            else:
+                self._limit += 1 / self._limit
+
+            self._limit = min(
+                self._max_concurrency, max(self._min_concurrency, self._limit)
+            )
+            self._condition.notify_all()
+
+
+class _Slot:
+    def __init__(self, rate_limiter, latency, throttled):
+        self._rate_limiter = rate_limiter
+        self._latency = latency
+        self._throttled = throttled
+        self._lock = threading.Lock()
+        self._released = False
+
+    def __del__(self):
+        # An abandoned stream must not hold its slot forever.
+        self.release()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+
+            self._released = True
+
+        self._rate_limiter.release(self._latency, throttled=self._throttled)
+
+
+class _HeldResponse:
+    # A streamed response occupies its rate-limiter slot until closed,
+    # so the concurrency limit covers body transfers, not just headers.
+    def __init__(self, response, slot):
+        self._response = response
+        self._slot = slot
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __iter__(self):
+        return iter(self._response)
+
+    def close(self):
+        try:
+            self._response.close()
+        finally:
+            self._slot.release()
+
+
+class _HeldIterator:
+    # As _HeldResponse, for the chunk iterators over a streamed body.
+    def __init__(self, iterator, slot):
+        self._iterator = iterator
+        self._slot = slot
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._iterator)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        try:
+            close = getattr(self._iterator, "close", None)
+
+            if close is not None:
+                close()
+        finally:
+            self._slot.release()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, function):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            call.result = function()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            # Later callers start a fresh flight rather than reuse this
+            # result: coalescing is not caching.
+            with self._lock:
+                del self._calls[key]
+
+            call.done.set()
+
+        return call.result
+
+
+def _flight_key(kind, url, params, headers):
+    return (
+        kind,
+        url,
+        tuple(sorted(_utils._filter_none_from_dict(params or {}).items())),
+        tuple(sorted(_utils._filter_none_from_dict(headers or {}).items())),
+    )
+
+
+class Transport:
+    def __init__(
+        self,
+        *,
+        pool_connections=10,
+        pool_maxsize=10,
+        pool_block=False,
+        keep_alive=True,
+        timeout=(3.05, 60.0),
+        retry=None,
+        rate_limiter=None,
+        cache=None,
+    ):
+        if not pool_connections > 0:
+            raise ValueError(
+                "number of connection pools must be greater than zero"
+            )
+
+        if not pool_maxsize > 0:
+            raise ValueError(
+                "number of connections per pool must be greater than zero"
+            )
+
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._pool_block = pool_block
+        self._keep_alive = keep_alive
+        if retry is None:
+            retry = RetryPolicy()
+
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._timeout = timeout
+        self._retry = retry
+        self._rate_limiter = rate_limiter
+        self._cache = cache
+        self._flights = _SingleFlight()
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}("
+            f"pool_connections={self._pool_connections}, "
+            f"pool_maxsize={self._pool_maxsize}, "
+            f"pool_block={self._pool_block}, "
+            f"keep_alive={self._keep_alive}, "
+            f"timeout={self._timeout}, "
+            f"retry={self._retry!r}, "
+            f"rate_limiter={self._rate_limiter!r}, "
+            f"cache={self._cache!r})"
+        )
+
+    def __getstate__(self):
+        # Sessions and locks are per process: an unpickled transport
+        # builds its own pool on first use.
+        state = self.__dict__.copy()
+        state["_session"] = None
+        del state["_session_lock"]
+        del state["_flights"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._session_lock = threading.Lock()
+        self._flights = _SingleFlight()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def pool_connections(self):
+        return self._pool_connections
+
+    @property
+    def pool_maxsize(self):
+        return self._pool_maxsize
+
+    @property
+    def pool_block(self):
+        return self._pool_block
+
+    @property
+    def keep_alive(self):
+        return self._keep_alive
+
+    @property
+    def session(self):
+        # requests is slow to import; defer it, and the pool, until the
+        # first request rather than paying for it at client creation.
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._make_session()
+        return self._session
+
+    def _make_session(self):
+        import requests
+        import requests.adapters
+
+        # One adapter per scheme: pool_connections bounds the number of
+        # distinct hosts kept alive, pool_maxsize the connections per host.
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self._pool_connections,
+            pool_maxsize=self._pool_maxsize,
+            pool_block=self._pool_block,
+        )
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+        if not self._keep_alive:
+            session.headers["Connection"] = "close"
+
+        return session
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @property
+    def retry(self):
+        return self._retry
+
+    @property
+    def rate_limiter(self):
+        return self._rate_limiter
+
+    @property
+    def cache(self):
+        return self._cache
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+
+    def _send(self, function, url, *, hold=False, **kwargs):
+        # With hold, returns the result together with its rate-limiter
+        # slot (None without a limiter) for the caller to release once
+        # the streamed body is done with.
+        import requests
+
+        session = self.session
+        attempt = 0
+
+        while True:
+            if self._rate_limiter is not None:
+                self._rate_limiter.acquire()
+
+            start = time.monotonic()
+            retry_after = None
+
+            try:
+                result = function(
+                    url, timeout=self._timeout, session=session, **kwargs
+                )
+            except requests.HTTPError as error:
+                status = error.response.status_code
+
+                if status not in self._retry.statuses:
+                    self._release(start, throttled=False)
+                    error.response.close()
+                    raise
+
+                self._release(start, throttled=status in (429, 503))
+                error.response.close()
+
+                if attempt >= self._retry.total:
+                    raise
+
+                retry_after = error.response.headers.get("Retry-After")
+            except (
+                requests.ConnectionError,
+                requests.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+            ):
+                self._release(start, throttled=True)
+
+                if attempt >= self._retry.total:
+                    raise
+            else:
+                status = getattr(result, "status_code", None)
+
+                if status not in self._retry.statuses:
+                    return self._finish(result, start, False, hold)
+
+                # Out of retries: hand back the last response as is.
+                if attempt >= self._retry.total:
+                    return self._finish(
+                        result, start, status in (429, 503), hold
+                    )
+
+                self._release(start, throttled=status in (429, 503))
+                retry_after = result.headers.get("Retry-After")
+                result.close()
+
+            time.sleep(self._retry.delay(attempt, retry_after))
+            attempt += 1
+
+    def _finish(self, result, start, throttled, hold):
+        if not hold or self._rate_limiter is None:
+            self._release(start, throttled=throttled)
+            return (result, None) if hold else result
+
+        # The limiter adapts to time to first byte: body transfer time
+        # says more about the payload than about the server.
+        slot = _Slot(self._rate_limiter, time.monotonic() - start, throttled)
+        return result, slot
+
+    def _release(self, start, *, throttled):
+        if self._rate_limiter is not None:
+            self._rate_limiter.release(
+                time.monotonic() - start, throttled=throttled
+            )
+
+    def get_response(self, url, *, headers=None, params=None, stream=False):
+        if not stream:
+            return self._send(
+                _utils.get_response, url, headers=headers, params=params
+            )
+
+        response, slot = self._send(
+            _utils.get_response,
+            url,
+            hold=True,
+            headers=headers,
+            params=params,
+            stream=True,
+        )
+
+        if slot is None:
+            return response
+
+        return _HeldResponse(response, slot)
+
+    def _send_iter(self, function, url, **kwargs):
+        iterator, slot = self._send(function, url, hold=True, **kwargs)
+
+        if slot is None:
+            return iterator
+
+        return _HeldIterator(iterator, slot)
+
+    def coalesce(self, kind, url, function, *, headers=None, params=None):
+        # Concurrent identical requests share one in-flight call and its
+        # result; kind keeps differently processed results apart.
+        return self._flights.do(
+            _flight_key(kind, url, params, headers), function
+        )
+
+    def get_text(self, url, *, headers=None, params=None):
+        if self._cache is not None:
+            text = self._cache.get(
+                url, params, api_key=(headers or {}).get("api_key")
+            )
+
+            if text is not None:
+                return text
+
+        text = self.coalesce(
+            "text",
+            url,
+            lambda: self._send(
+                _utils.get_text, url, headers=headers, params=params
+            ),
+            headers=headers,
+            params=params,
+        )
+
+        if self._cache is not None:
+            self._cache.set(
+                url, params, text, api_key=(headers or {}).get("api_key")
+            )
+
+        return text
+
+    def get_text_iter(
+        self, url, *, headers=None, params=None, chunk_size=65536
+    ):
+        # Streams bypass the cache on the way in (buffering them to store
+        # would defeat the point) but still take a cached copy when present.
+        if self._cache is not None:
+            text = self._cache.get(
+                url, params, api_key=(headers or {}).get("api_key")
+            )
+
+            if text is not None:
+                return iter([text])
+
+        return self._send_iter(
+            _utils.get_text_iter,
+            url,
+            headers=headers,
+            params=params,
+            chunk_size=chunk_size,
+        )
+
+    def get_content_iter(
+        self, url, *, headers=None, params=None, chunk_size=1024
+    ):
+        return self._send_iter(
+            _utils.get_content_iter,
+            url,
+            headers=headers,
+            params=params,
+            chunk_size=chunk_size,
+        )
@@ -17,15 +17,27 @@ import collections
 
 __all__ = [
     "Attribute",
+    "BatchResult",
     "BodyPartExamined",
+    "CacheStats",
+    "CatalogDelta",
     "Collection",
+    "DownloadPlan",
+    "DownloadReport",
+    "Instance",
     "Manufacturer",
     "Metadata",
+    "MirrorStatus",
     "Modality",
     "Patient",
     "PatientStudy",
     "Result",
     "Series",
+    "SeriesDownload",
+    "SeriesEstimate",
+    "SizeTotals",
+    "StoreStats",
+    "StoredInstance",
 ]
 
 Collection = collections.namedtuple("Collection", ["collection"])
@@ -108,3 +120,81 @@ NewStudyInPatientCollection = collections.namedtuple(
 )
 
 SOPInstanceUID = collections.namedtuple("SOPInstanceUID", ["sop_instance_uid"])
+
+SeriesDownload = collections.namedtuple(
+    "SeriesDownload",
+    ["series_instance_uid", "path", "size_in_bytes", "elapsed", "error"],
+)
+
+DownloadReport = collections.namedtuple(
+    "DownloadReport",
+    ["downloads", "succeeded", "failed", "size_in_bytes", "elapsed"],
+)
+
+CacheStats = collections.namedtuple(
+    "CacheStats", ["hits", "misses", "entries", "size_in_bytes"]
+)
+
+CatalogDelta = collections.namedtuple(
+    "CatalogDelta",
+    ["collection", "since", "patients", "patient_studies", "series"],
+)
+
+Instance = collections.namedtuple(
+    "Instance", ["series_instance_uid", "filename", "data"]
+)
+
+SeriesEstimate = collections.namedtuple(
+    "SeriesEstimate",
+    [
+        "series_instance_uid",
+        "collection",
+        "patient_id",
+        "modality",
+        "object_count",
+        "size_in_bytes",
+    ],
+)
+
+SizeTotals = collections.namedtuple(
+    "SizeTotals", ["series_count", "object_count", "size_in_bytes"]
+)
+
+DownloadPlan = collections.namedtuple(
+    "DownloadPlan",
+    [
+        "series",
+        "failed",
+        "totals",
+        "by_collection",
+        "by_patient",
+        "by_modality",
+        "batches",
+        "free_size_in_bytes",
+        "fits",
+    ],
+)
+
+StoredInstance = collections.namedtuple(
+    "StoredInstance",
+    ["series_instance_uid", "filename", "sha256", "size_in_bytes"],
+)
+
+StoreStats = collections.namedtuple(
+    "StoreStats",
+    [
+        "series_count",
+        "object_count",
+        "size_in_bytes",
+        "unique_size_in_bytes",
+    ],
+)
+
+MirrorStatus = collections.namedtuple(
+    "MirrorStatus",
+    ["completed", "failed", "missing", "unexpected", "size_in_bytes"],
+)
+
+BatchResult = collections.namedtuple(
+    "BatchResult", ["records", "results", "failed"]
+)
@@ -12,22 +12,47 @@
 # implied. See the License for the specific language governing
 # permissions and limitations under the License.
 # ----------------------------------------------------------------------
-import requests
+import codecs
+import itertools
+import json
+import os
+import re
 
 
 __all__ = [
+    "get_response",
     "get_text",
+    "get_text_iter",
     "get_content_iter",
+    "iter_json_array",
     "write_text",
+    "write_text_iter",
     "write_streaming_content",
+    "write_response_content",
 ]
 
 
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DELIMITERS = frozenset(",] \t\n\r")
+
+# Bounds of the adaptive read window used by write_response_content.
+_MIN_CHUNK_SIZE = 64 * 1024
+_MAX_CHUNK_SIZE = 4 * 1024**2
+
+
 def _filter_none_from_dict(dict_):
     return {key: value for key, value in dict_.items() if value is not None}
 
 
-def get_text(url, *, headers=None, params=None):
+def get_response(
+    url,
+    *,
+    headers=None,
+    params=None,
+    stream=False,
+    timeout=None,
+    session=None,
+):
     if headers is None:
         headers = {}
 
@@ -37,25 +62,184 @@ def get_text(url, *, headers=None, params=None):
     headers = _filter_none_from_dict(headers)
     params = _filter_none_from_dict(params)
 
-    response = requests.get(url, headers=headers, params=params)
+    if session is None:
+        import requests
+
+        session = requests
+
+    get = session.get
+    return get(
+        url, headers=headers, params=params, stream=stream, timeout=timeout
+    )
+
+
+def _raise_for_status(response):
+    # A streamed body holds its connection, and any rate-limiter slot,
+    # until it is closed; an error status must not leave that to the
+    # garbage collector.
+    try:
+        response.raise_for_status()
+    except Exception:
+        response.close()
+        raise
+
+
+def get_text(url, *, headers=None, params=None, timeout=None, session=None):
+    response = get_response(
+        url, headers=headers, params=params, timeout=timeout, session=session
+    )
+    response.raise_for_status()
     return response.text
 
 
-def get_content_iter(url, *, headers=None, params=None, chunk_size=1024):
+def get_content_iter(
+    url,
+    *,
+    headers=None,
+    params=None,
+    chunk_size=1024,
+    timeout=None,
+    session=None,
+):
     if not chunk_size > 0:
         raise ValueError("chunk size in bytes must be greater than zero")
 
-    if headers is None:
-        headers = {}
+    response = get_response(
+        url,
+        headers=headers,
+        params=params,
+        stream=True,
+        timeout=timeout,
+        session=session,
+    )
+    _raise_for_status(response)
+    return response.iter_content(chunk_size=chunk_size)
 
-    if params is None:
-        params = {}
 
-    headers = _filter_none_from_dict(headers)
-    params = _filter_none_from_dict(params)
+def get_text_iter(
+    url,
+    *,
+    headers=None,
+    params=None,
+    chunk_size=65536,
+    timeout=None,
+    session=None,
+):
+    if not chunk_size > 0:
+        raise ValueError("chunk size in bytes must be greater than zero")
 
-    response = requests.get(url, headers=headers, params=params, stream=True)
-    return response.iter_content(chunk_size=chunk_size)
+    # Exports compress several-fold; ask for it even from a session
+    # whose default headers were replaced. iter_content() decodes it.
+    headers = {"Accept-Encoding": "gzip, deflate", **(headers or {})}
+    response = get_response(
+        url,
+        headers=headers,
+        params=params,
+        stream=True,
+        timeout=timeout,
+        session=session,
+    )
+    _raise_for_status(response)
+    return _decode_content_iter(response, chunk_size)
+
+
+def _decode_content_iter(response, chunk_size):
+    # JSON, CSV and XML responses rarely declare a charset; fall back to
+    # UTF-8 rather than to the ISO-8859-1 requests assumes for text/*.
+    encoding = response.encoding
+
+    if "charset" not in response.headers.get("Content-Type", "").lower():
+        encoding = None
+
+    decoder = codecs.getincrementaldecoder(encoding or "utf-8")(
+        errors="replace"
+    )
+
+    with response:
+        for bytes_ in response.iter_content(chunk_size=chunk_size):
+            text = decoder.decode(bytes_)
+
+            if text:
+                yield text
+
+    text = decoder.decode(b"", final=True)
+
+    if text:
+        yield text
+
+
+def iter_json_array(text_iter):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    # start -> first -> (value -> next)* -> end
+    state = "start"
+
+    for text in itertools.chain(text_iter, [None]):
+        final = text is None
+
+        if not final:
+            buffer = buffer[position:] + text
+            position = 0
+
+        while True:
+            position = _WHITESPACE.match(buffer, position).end()
+
+            if position == len(buffer):
+                break
+
+            char = buffer[position]
+
+            if state == "end":
+                raise ValueError("unexpected data after JSON array")
+
+            if state == "start":
+                if char != "[":
+                    raise ValueError("expected a JSON array")
+
+                state = "first"
+                position += 1
+            elif state == "next":
+                if char == ",":
+                    state = "value"
+                elif char == "]":
+                    state = "end"
+                else:
+                    raise ValueError("expected ',' or ']' in JSON array")
+
+                position += 1
+            elif state == "first" and char == "]":
+                state = "end"
+                position += 1
+            elif char in ",]":
+                raise ValueError("expected a value in JSON array")
+            else:
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                except ValueError:
+                    if final:
+                        raise
+                    break
+
+                # Strings and containers end on their closing character,
+                # but a number or literal may continue in the next chunk
+                # ("-2500." + "0"), so it needs a delimiter after it.
+                if (
+                    not final
+                    and char not in '"[{'
+                    and (end == len(buffer) or buffer[end] not in _DELIMITERS)
+                ):
+                    break
+
+                yield value
+                state = "next"
+                position = end
+
+    if state == "start":
+        raise ValueError("expected a JSON array")
+
+    if state != "end":
+        raise ValueError("unterminated JSON array")
 
 
 def write_text(text, path_or_buffer, *, mode="wt", encoding="utf-8"):
@@ -68,19 +252,153 @@ def write_text(text, path_or_buffer, *, mode="wt", encoding="utf-8"):
         path_or_buffer.flush()
 
 
-def write_streaming_content(content_iter, path_or_buffer, *, mode="wb"):
-    bytes_ = next(content_iter)
+def write_text_iter(text_iter, path_or_buffer, *, mode="wt", encoding="utf-8"):
+    if not isinstance(path_or_buffer, (str, os.PathLike)):
+        for text in text_iter:
+            path_or_buffer.write(text)
 
-    try:
-        path_or_buffer.write(bytes_)
-    except AttributeError:
-        with open(path_or_buffer, mode=mode) as buffer:
-            buffer.write(bytes_)
+        path_or_buffer.flush()
+        return
+
+    with open(path_or_buffer, mode=mode, encoding=encoding) as buffer:
+        for text in text_iter:
+            buffer.write(text)
 
-            for bytes_ in content_iter:
-                buffer.write(bytes_)
+
+def _open_journal(path):
+    # A writer killed mid-line leaves a torn tail; appending after it
+    # would fuse the next entry onto it, so cut back to the last newline.
+    try:
+        buffer = open(path, mode="r+b")
+    except FileNotFoundError:
+        pass
     else:
+        with buffer:
+            end = buffer.seek(0, os.SEEK_END)
+            size = end
+
+            while end > 0:
+                start = max(0, end - 65536)
+                buffer.seek(start)
+                index = buffer.read(end - start).rfind(b"\n")
+
+                if index >= 0:
+                    end = start + index + 1
+                    break
+
+                end = start
+
+            if end != size:
+                buffer.truncate(end)
+
+    return open(path, mode="at", encoding="utf-8")
+
+
+def write_streaming_content(content_iter, path_or_buffer, *, mode="wb"):
+    if not isinstance(path_or_buffer, (str, os.PathLike)):
+        for bytes_ in content_iter:
+            path_or_buffer.write(bytes_)
+
+        path_or_buffer.flush()
+        return
+
+    with open(path_or_buffer, mode=mode) as buffer:
         for bytes_ in content_iter:
             buffer.write(bytes_)
 
-        buffer.flush()
+
+def _get_reader(response):
+    import http.client
+
+    raw = response.raw
+    encoding = response.headers.get("Content-Encoding", "identity")
+
+    # Without a content coding, read from http.client directly: it fills
+    # the caller's buffer from the socket, where urllib3's readinto()
+    # allocates an intermediate bytes object per call. raw._fp is private
+    # to urllib3, so any other layout falls back to the public readinto().
+    if encoding.lower() in ("", "identity") and callable(
+        getattr(raw, "release_conn", None)
+    ):
+        fp = getattr(raw, "_fp", None)
+
+        if isinstance(fp, http.client.HTTPResponse) and not fp.closed:
+            return fp, True
+
+    raw.decode_content = True
+    return raw, False
+
+
+def _write_all(buffer, view):
+    while view:
+        written = buffer.write(view)
+
+        # Raw files may write short; buffered ones return None or all.
+        if written is None:
+            return
+
+        view = view[written:]
+
+
+def _copy_response_content(response, buffer, chunk_size):
+    reader, direct = _get_reader(response)
+    length = response.headers.get("Content-Length")
+
+    if chunk_size is None:
+        maximum = _MAX_CHUNK_SIZE
+
+        if length is not None and length.isdigit():
+            maximum = max(_MIN_CHUNK_SIZE, min(maximum, int(length)))
+
+        window = min(_MIN_CHUNK_SIZE, maximum)
+    else:
+        maximum = window = chunk_size
+
+    # One buffer for the whole body; each read fills a view of it.
+    view = memoryview(bytearray(maximum))
+    size = 0
+
+    while True:
+        count = reader.readinto(view[:window])
+
+        if not count:
+            break
+
+        _write_all(buffer, view[:count])
+        size += count
+
+        # Widen the window while reads keep filling it, so small bodies
+        # stay cheap and large ones need few Python-level iterations.
+        if count == window and window < maximum:
+            window = min(window * 2, maximum)
+
+    if direct:
+        # http.client leaves a short body undetected; urllib3, which is
+        # bypassed here, would otherwise have raised.
+        if length is not None and length.isdigit() and size != int(length):
+            import http.client
+
+            raise http.client.IncompleteRead(b"", int(length) - size)
+
+        # Hand the drained connection back to the pool instead of
+        # letting Response.close() tear it down.
+        response.raw.release_conn()
+
+    return size
+
+
+def write_response_content(
+    response, path_or_buffer, *, mode="wb", chunk_size=None
+):
+    if chunk_size is not None and not chunk_size > 0:
+        raise ValueError("chunk size in bytes must be greater than zero")
+
+    with response:
+        if not isinstance(path_or_buffer, (str, os.PathLike)):
+            size = _copy_response_content(response, path_or_buffer, chunk_size)
+            path_or_buffer.flush()
+            return size
+
+        # Unbuffered, so each filled view goes to the OS in one write.
+        with open(path_or_buffer, mode=mode, buffering=0) as buffer:
+            return _copy_response_content(response, buffer, chunk_size)
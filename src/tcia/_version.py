@@ -12,12 +12,16 @@
 # implied. See the License for the specific language governing
 # permissions and limitations under the License.
 # ----------------------------------------------------------------------
-import pkg_resources
+import os
 
 
 __all__ = ["get_version"]
 
 
 def get_version():
-    bytes_ = pkg_resources.resource_string("tcia", "VERSION")
-    return bytes_.decode("utf-8")
+    # Read next to the module: pkg_resources scans every installed
+    # distribution on import, which dominated package import time.
+    path = os.path.join(os.path.dirname(__file__), "VERSION")
+
+    with open(path, mode="rt", encoding="utf-8") as buffer:
+        return buffer.read().strip()
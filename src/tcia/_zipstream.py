@@ -0,0 +1,318 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import os
+import struct
+import zlib
+
+
+__all__ = ["iter_members", "extract"]
+
+_LOCAL_FILE_HEADER = b"PK\x03\x04"
+_CENTRAL_DIRECTORY_HEADER = b"PK\x01\x02"
+_END_OF_CENTRAL_DIRECTORY = b"PK\x05\x06"
+_ZIP64_END_OF_CENTRAL_DIRECTORY = b"PK\x06\x06"
+_DATA_DESCRIPTOR = b"PK\x07\x08"
+
+_FLAG_ENCRYPTED = 0x0001
+_FLAG_DATA_DESCRIPTOR = 0x0008
+_FLAG_UTF8 = 0x0800
+
+_STORED = 0
+_DEFLATED = 8
+
+_ZIP64_EXTRA = 0x0001
+_ZIP64_LIMIT = 0xFFFFFFFF
+
+_READ_SIZE = 64 * 1024
+
+
+class _Reader:
+    def __init__(self, content_iter):
+        self._content_iter = iter(content_iter)
+        self._buffer = bytearray()
+
+    def _fill(self, size):
+        while len(self._buffer) < size:
+            try:
+                self._buffer += next(self._content_iter)
+            except StopIteration:
+                return False
+        return True
+
+    def read(self, size):
+        # Up to size bytes; b"" only at the end of the stream.
+        if not self._buffer:
+            self._fill(1)
+
+        bytes_ = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return bytes_
+
+    def read_exactly(self, size):
+        if not self._fill(size):
+            raise ValueError("truncated zip stream")
+
+        bytes_ = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return bytes_
+
+    def unread(self, bytes_):
+        self._buffer[:0] = bytes_
+
+    def drain(self):
+        self._buffer.clear()
+
+        for _ in self._content_iter:
+            pass
+
+
+def _parse_zip64_extra(extra, compressed_size, uncompressed_size):
+    position = 0
+
+    while position + 4 <= len(extra):
+        id_, size = struct.unpack_from("<HH", extra, position)
+        position += 4
+
+        if id_ == _ZIP64_EXTRA:
+            # Only the fields saturated in the header are present, in
+            # this fixed order.
+            values = extra[position : position + size]
+            offset = 0
+
+            if uncompressed_size == _ZIP64_LIMIT:
+                (uncompressed_size,) = struct.unpack_from("<Q", values, offset)
+                offset += 8
+
+            if compressed_size == _ZIP64_LIMIT:
+                (compressed_size,) = struct.unpack_from("<Q", values, offset)
+
+            return compressed_size, uncompressed_size, True
+
+        position += size
+
+    return compressed_size, uncompressed_size, False
+
+
+def _iter_stored(reader, size):
+    remaining = size
+
+    while remaining > 0:
+        bytes_ = reader.read(min(remaining, _READ_SIZE))
+
+        if not bytes_:
+            raise ValueError("truncated zip stream")
+
+        remaining -= len(bytes_)
+        yield bytes_
+
+
+def _iter_stored_with_descriptor(reader, zip64):
+    # Without sizes up front, the member ends at the first descriptor
+    # whose CRC-32 and size match the bytes before it.
+    size_format = "<QQ" if zip64 else "<II"
+    length = 8 + struct.calcsize(size_format)
+    crc = 0
+    size = 0
+    pending = bytearray()
+    start = 0
+
+    while True:
+        index = pending.find(_DATA_DESCRIPTOR, start)
+
+        if index >= 0 and len(pending) >= index + length:
+            (descriptor_crc,) = struct.unpack_from("<I", pending, index + 4)
+            _, descriptor_size = struct.unpack_from(
+                size_format, pending, index + 8
+            )
+            bytes_ = bytes(pending[:index])
+
+            if (
+                zlib.crc32(bytes_, crc) == descriptor_crc
+                and size + index == descriptor_size
+            ):
+                if bytes_:
+                    yield bytes_
+
+                reader.unread(pending[index:])
+                return
+
+            start = index + 1
+            continue
+
+        # Hold back anything that may still begin a descriptor.
+        flush = index if index >= 0 else max(len(pending) - 3, start)
+
+        if flush:
+            bytes_ = bytes(pending[:flush])
+            crc = zlib.crc32(bytes_, crc)
+            size += flush
+            del pending[:flush]
+            start = max(start - flush, 0)
+            yield bytes_
+
+        bytes_ = reader.read(_READ_SIZE)
+
+        if not bytes_:
+            raise ValueError("truncated zip stream")
+
+        pending += bytes_
+
+
+def _iter_deflated(reader):
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+    while not decompressor.eof:
+        bytes_ = reader.read(_READ_SIZE)
+
+        if not bytes_:
+            raise ValueError("truncated zip stream")
+
+        try:
+            data = decompressor.decompress(bytes_)
+        except zlib.error as error:
+            raise ValueError(f"corrupt zip member: {error}")
+
+        if data:
+            yield data
+
+    # The compressed stream ends inside the last read; hand the rest back.
+    reader.unread(decompressor.unused_data)
+
+
+def _read_data_descriptor(reader, zip64):
+    signature = reader.read_exactly(4)
+
+    # The descriptor signature is optional: without it these four bytes
+    # already are the CRC-32.
+    if signature == _DATA_DESCRIPTOR:
+        (crc,) = struct.unpack("<I", reader.read_exactly(4))
+    else:
+        (crc,) = struct.unpack("<I", signature)
+
+    if zip64:
+        _, uncompressed_size = struct.unpack("<QQ", reader.read_exactly(16))
+    else:
+        _, uncompressed_size = struct.unpack("<II", reader.read_exactly(8))
+
+    return crc, uncompressed_size
+
+
+def _iter_member_data(
+    reader, flags, method, crc, compressed_size, size, zip64
+):
+    if method == _STORED and flags & _FLAG_DATA_DESCRIPTOR:
+        data_iter = _iter_stored_with_descriptor(reader, zip64)
+    elif method == _STORED:
+        data_iter = _iter_stored(reader, compressed_size)
+    elif method == _DEFLATED:
+        data_iter = _iter_deflated(reader)
+    else:
+        raise ValueError(f"unsupported zip compression method {method}")
+
+    actual_crc = 0
+    actual_size = 0
+
+    for data in data_iter:
+        actual_crc = zlib.crc32(data, actual_crc)
+        actual_size += len(data)
+        yield data
+
+    if flags & _FLAG_DATA_DESCRIPTOR:
+        crc, size = _read_data_descriptor(reader, zip64)
+
+    if actual_crc != crc or actual_size != size:
+        raise ValueError("zip member failed its CRC-32 or size check")
+
+
+def iter_members(content_iter):
+    reader = _Reader(content_iter)
+
+    while True:
+        signature = reader.read_exactly(4)
+
+        if signature in (
+            _CENTRAL_DIRECTORY_HEADER,
+            _ZIP64_END_OF_CENTRAL_DIRECTORY,
+            _END_OF_CENTRAL_DIRECTORY,
+        ):
+            # Everything after the last member only indexes what has
+            # already been read.
+            reader.drain()
+            return
+
+        if signature != _LOCAL_FILE_HEADER:
+            raise ValueError("not a zip stream")
+
+        (
+            _,
+            flags,
+            method,
+            _,
+            _,
+            crc,
+            compressed_size,
+            size,
+            name_length,
+            extra_length,
+        ) = struct.unpack("<HHHHHIIIHH", reader.read_exactly(26))
+        name = reader.read_exactly(name_length)
+        extra = reader.read_exactly(extra_length)
+        name = name.decode("utf-8" if flags & _FLAG_UTF8 else "cp437")
+        compressed_size, size, zip64 = _parse_zip64_extra(
+            extra, compressed_size, size
+        )
+
+        if flags & _FLAG_ENCRYPTED:
+            raise ValueError("encrypted zip members are not supported")
+
+        data_iter = _iter_member_data(
+            reader, flags, method, crc, compressed_size, size, zip64
+        )
+        yield name, data_iter
+
+        # Skip whatever the consumer left unread of this member.
+        for _ in data_iter:
+            pass
+
+
+def _safe_path(dest_dir, name):
+    path = os.path.normpath(os.path.join(dest_dir, name))
+
+    if os.path.commonpath([dest_dir, path]) != dest_dir:
+        raise ValueError(f"zip member '{name}' escapes destination directory")
+
+    return path
+
+
+def extract(content_iter, dest_dir):
+    dest_dir = os.path.abspath(dest_dir)
+    paths = []
+
+    for name, data_iter in iter_members(content_iter):
+        path = _safe_path(dest_dir, name)
+
+        if name.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+            continue
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with open(path, mode="wb") as buffer:
+            for data in data_iter:
+                buffer.write(data)
+
+        paths.append(path)
+
+    return paths
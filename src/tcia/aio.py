@@ -0,0 +1,524 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import asyncio
+import codecs
+import functools
+import json
+import os
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from tcia import _resources
+from tcia import _transport
+from tcia import _utils
+
+
+__all__ = ["AsyncClient"]
+
+
+# Writes are batched to about this many bytes (or characters) so that
+# each hop to the executor carries a worthwhile amount of work.
+_WRITE_SIZE = 1024**2
+
+
+async def _run_blocking(function, *args, **kwargs):
+    # Disk and SQLite calls run on the default executor; on the event
+    # loop they would stall every other request in flight.
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        None, functools.partial(function, *args, **kwargs)
+    )
+
+
+async def _write_iter(chunk_iter, path_or_buffer, join, **open_kwargs):
+    if isinstance(path_or_buffer, (str, os.PathLike)):
+        buffer = await _run_blocking(open, path_or_buffer, **open_kwargs)
+    else:
+        buffer = path_or_buffer
+
+    try:
+        pending = []
+        size = 0
+
+        async for chunk in chunk_iter:
+            pending.append(chunk)
+            size += len(chunk)
+
+            if size >= _WRITE_SIZE:
+                await _run_blocking(buffer.write, join(pending))
+                pending = []
+                size = 0
+
+        if pending:
+            await _run_blocking(buffer.write, join(pending))
+
+        await _run_blocking(buffer.flush)
+    finally:
+        if buffer is not path_or_buffer:
+            await _run_blocking(buffer.close)
+
+
+def _filter_params(params):
+    # aiohttp only accepts str, int and float query values.
+    return {
+        key: value if isinstance(value, (str, int, float)) else str(value)
+        for key, value in _utils._filter_none_from_dict(params).items()
+    }
+
+
+class AsyncTransport:
+    def __init__(
+        self,
+        *,
+        limit=100,
+        limit_per_host=0,
+        keep_alive=True,
+        timeout=(3.05, 60.0),
+        retry=None,
+        cache=None,
+    ):
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncClient requires aiohttp: install it with "
+                "'pip install tcia[async]'"
+            )
+
+        if not limit >= 0:
+            raise ValueError("connection limit must not be negative")
+
+        if not limit_per_host >= 0:
+            raise ValueError("per-host connection limit must not be negative")
+
+        if retry is None:
+            retry = _transport.RetryPolicy()
+
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._keep_alive = keep_alive
+        self._timeout = timeout
+        self._retry = retry
+        self._cache = cache
+        self._session = None
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(limit={self._limit}, "
+            f"limit_per_host={self._limit_per_host}, "
+            f"keep_alive={self._keep_alive}, timeout={self._timeout}, "
+            f"retry={self._retry!r}, cache={self._cache!r})"
+        )
+
+    @property
+    def timeout(self):
+        return self._timeout
+
+    @property
+    def retry(self):
+        return self._retry
+
+    @property
+    def cache(self):
+        return self._cache
+
+    @property
+    def session(self):
+        # aiohttp binds the session to the running event loop, so it is
+        # created on first use rather than in __init__.
+        if self._session is None:
+            connector = aiohttp.TCPConnector(
+                limit=self._limit,
+                limit_per_host=self._limit_per_host,
+                force_close=not self._keep_alive,
+            )
+            connect, read = self._timeout
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(
+                    sock_connect=connect, sock_read=read
+                ),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def get_response(self, url, *, headers=None, params=None):
+        if headers is None:
+            headers = {}
+
+        if params is None:
+            params = {}
+
+        return self.session.get(
+            url,
+            headers=_utils._filter_none_from_dict(headers),
+            params=_filter_params(params),
+        )
+
+    async def get_text(self, url, *, headers=None, params=None):
+        if self._cache is not None:
+            text = await _run_blocking(
+                self._cache.get,
+                url,
+                params,
+                api_key=(headers or {}).get("api_key"),
+            )
+
+            if text is not None:
+                return text
+
+        attempt = 0
+
+        while True:
+            retry_after = None
+
+            try:
+                async with self.get_response(
+                    url, headers=headers, params=params
+                ) as response:
+                    if (
+                        response.status not in self._retry.statuses
+                        or attempt >= self._retry.total
+                    ):
+                        response.raise_for_status()
+                        text = await response.text()
+                        break
+
+                    retry_after = response.headers.get("Retry-After")
+            except (
+                aiohttp.ClientConnectionError,
+                aiohttp.ClientPayloadError,
+                asyncio.TimeoutError,
+            ):
+                if attempt >= self._retry.total:
+                    raise
+
+            await asyncio.sleep(self._retry.delay(attempt, retry_after))
+            attempt += 1
+
+        if self._cache is not None:
+            await _run_blocking(
+                self._cache.set,
+                url,
+                params,
+                text,
+                api_key=(headers or {}).get("api_key"),
+            )
+
+        return text
+
+
+class _AsyncResource:
+    def __init__(self, resource):
+        self._resource = resource
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self._resource!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, _AsyncResource):
+            return NotImplemented
+        return self._resource == other._resource
+
+    def __hash__(self):
+        return hash(self._resource)
+
+    def __call__(self, *args, **kwargs):
+        return self.__class__(self._resource(*args, **kwargs))
+
+    @property
+    def metadata(self):
+        return self._get_metadata()
+
+    async def _get_metadata(self):
+        resource = self._resource
+        key = (resource._base_url, resource._resource, resource._endpoint)
+        metadata = _resources._metadata_cache.get(key)
+
+        if metadata is None:
+            text = await resource._transport.get_text(
+                f"{resource._url}/metadata", headers=resource._headers
+            )
+            metadata = _resources._parse_metadata(json.loads(text))
+
+            with _resources._metadata_lock:
+                metadata = _resources._metadata_cache.setdefault(key, metadata)
+
+        return metadata
+
+
+class _AsyncTextResource(_AsyncResource):
+    async def get(self):
+        resource = self._resource
+        resource.__class__._check_required_params(resource._params)
+        text = await resource._transport.get_text(
+            resource._url,
+            headers=resource._headers,
+            params={**resource._params, "format": "json"},
+        )
+        data = json.loads(text)
+        return [resource._make_record(element) for element in data]
+
+    async def iter_text(self, format_="csv", chunk_size=65536):
+        if not chunk_size > 0:
+            raise ValueError("chunk size in bytes must be greater than zero")
+
+        resource = self._resource
+        resource.__class__._check_required_params(resource._params)
+        resource.__class__._check_format(format_)
+
+        async with resource._transport.get_response(
+            resource._url,
+            headers=resource._headers,
+            params={**resource._params, "format": format_},
+        ) as response:
+            response.raise_for_status()
+            decoder = codecs.getincrementaldecoder(
+                response.charset or "utf-8"
+            )(errors="replace")
+
+            async for bytes_ in response.content.iter_chunked(chunk_size):
+                text = decoder.decode(bytes_)
+
+                if text:
+                    yield text
+
+        text = decoder.decode(b"", final=True)
+
+        if text:
+            yield text
+
+    async def download(
+        self,
+        path_or_buffer,
+        format_="csv",
+        *,
+        mode="wt",
+        encoding="utf-8",
+        chunk_size=65536,
+    ):
+        await _write_iter(
+            self.iter_text(format_, chunk_size),
+            path_or_buffer,
+            "".join,
+            mode=mode,
+            encoding=encoding,
+        )
+
+
+class _AsyncBytesResource(_AsyncResource):
+    async def iter_content(self, chunk_size=None):
+        # None matches the sync client's default read size.
+        if chunk_size is None:
+            chunk_size = 65536
+
+        if not chunk_size > 0:
+            raise ValueError("chunk size in bytes must be greater than zero")
+
+        resource = self._resource
+        resource.__class__._check_required_params(resource._params)
+
+        async with resource._transport.get_response(
+            resource._url, headers=resource._headers, params=resource._params
+        ) as response:
+            response.raise_for_status()
+
+            async for bytes_ in response.content.iter_chunked(chunk_size):
+                yield bytes_
+
+    async def download(self, path_or_buffer, chunk_size=None, *, mode="wb"):
+        await _write_iter(
+            self.iter_content(chunk_size),
+            path_or_buffer,
+            b"".join,
+            mode=mode,
+        )
+
+
+def _wrap(resource):
+    if isinstance(resource, _resources._BytesResource):
+        return _AsyncBytesResource(resource)
+    return _AsyncTextResource(resource)
+
+
+class AsyncClient:
+    def __init__(
+        self,
+        api_key=None,
+        *,
+        base_url="https://services.cancerimagingarchive.net/services/v3",
+        limit=100,
+        limit_per_host=0,
+        keep_alive=True,
+        timeout=(3.05, 60.0),
+        retry=None,
+        cache=None,
+    ):
+        if api_key is None:
+            try:
+                api_key = os.environ["TCIA_API_KEY"]
+            except KeyError:
+                raise TypeError(
+                    (
+                        "environmental variable 'TCIA_API_KEY' must be set or "
+                        "keyword argument 'api_key' must not be None"
+                    )
+                )
+        self._api_key = api_key
+        self._base_url = base_url
+        self._resources = {}
+        self._transport = AsyncTransport(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            keep_alive=keep_alive,
+            timeout=timeout,
+            retry=retry,
+            cache=cache,
+        )
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self._api_key}')"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    @property
+    def api_key(self):
+        return self._api_key
+
+    @property
+    def base_url(self):
+        return self._base_url
+
+    @property
+    def transport(self):
+        return self._transport
+
+    @property
+    def cache(self):
+        return self._transport.cache
+
+    async def close(self):
+        await self._transport.close()
+
+    async def preload_metadata(self):
+        resources = [
+            self.collections,
+            self.modalities,
+            self.body_parts_examined,
+            self.manufacturers,
+            self.patients,
+            self.patients_by_modality,
+            self.patient_studies,
+            self.series,
+            self.series_size,
+            self.images,
+            self.new_patients_in_collection,
+            self.new_studies_in_patient_collection,
+            self.sop_instance_uids,
+            self.single_image,
+            self.contents_by_name,
+        ]
+        return await asyncio.gather(
+            *(resource.metadata for resource in resources)
+        )
+
+    def invalidate_metadata(self):
+        _resources.invalidate_metadata(self.base_url)
+
+    def _resource(self, class_):
+        # Queries are immutable, so each endpoint's unfiltered query is
+        # built once and shared.
+        resource = self._resources.get(class_)
+
+        if resource is None:
+            resource = self._resources.setdefault(
+                class_,
+                _wrap(
+                    class_(
+                        self.api_key, self.base_url, transport=self.transport
+                    )
+                ),
+            )
+
+        return resource
+
+    @property
+    def collections(self):
+        return self._resource(_resources.CollectionsResource)
+
+    @property
+    def modalities(self):
+        return self._resource(_resources.ModalitiesResource)
+
+    @property
+    def body_parts_examined(self):
+        return self._resource(_resources.BodyPartsExaminedResource)
+
+    @property
+    def manufacturers(self):
+        return self._resource(_resources.ManufacturersResource)
+
+    @property
+    def patients(self):
+        return self._resource(_resources.PatientsResource)
+
+    @property
+    def patients_by_modality(self):
+        return self._resource(_resources.PatientsByModalityResource)
+
+    @property
+    def patient_studies(self):
+        return self._resource(_resources.PatientStudiesResource)
+
+    @property
+    def series(self):
+        return self._resource(_resources.SeriesResource)
+
+    @property
+    def series_size(self):
+        return self._resource(_resources.SeriesSizeResource)
+
+    @property
+    def images(self):
+        return self._resource(_resources.ImagesResource)
+
+    @property
+    def new_patients_in_collection(self):
+        return self._resource(_resources.NewPatientsInCollectionResource)
+
+    @property
+    def new_studies_in_patient_collection(self):
+        return self._resource(_resources.NewStudiesInPatientCollectionResource)
+
+    @property
+    def sop_instance_uids(self):
+        return self._resource(_resources.SOPInstanceUIDsResource)
+
+    @property
+    def single_image(self):
+        return self._resource(_resources.SingleImageResource)
+
+    @property
+    def contents_by_name(self):
+        return self._resource(_resources.ContentsByNameResource)
@@ -12,12 +12,18 @@
 # implied. See the License for the specific language governing
 # permissions and limitations under the License.
 # ----------------------------------------------------------------------
+import concurrent.futures
 import os
 
+from tcia import _download
+from tcia import _plan
 from tcia import _resources
+from tcia import _transport
+from tcia._transport import RateLimiter
+from tcia._transport import RetryPolicy
 
 
-__all__ = ["Client"]
+__all__ = ["Client", "RateLimiter", "RetryPolicy"]
 
 
 class Client:
@@ -26,6 +32,16 @@ class Client:
         api_key=None,
         *,
         base_url="https://services.cancerimagingarchive.net/services/v3",
+        pool_connections=10,
+        pool_maxsize=10,
+        pool_block=False,
+        keep_alive=True,
+        timeout=(3.05, 60.0),
+        retry=None,
+        rate_limiter=None,
+        cache=None,
+        catalog=None,
+        store=None,
     ):
         if api_key is None:
             try:
@@ -39,10 +55,35 @@ class Client:
                 )
         self._api_key = api_key
         self._base_url = base_url
+        self._catalog = catalog
+        self._store = store
+        self._resources = {}
+        self._transport = _transport.Transport(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            keep_alive=keep_alive,
+            timeout=timeout,
+            retry=retry,
+            rate_limiter=rate_limiter,
+            cache=cache,
+        )
 
     def __repr__(self):
         return f"{self.__class__.__name__}('{self._api_key}')"
 
+    def __getstate__(self):
+        # Pickles as its configuration; cached queries are rebuilt.
+        state = self.__dict__.copy()
+        state["_resources"] = {}
+        return state
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     @property
     def api_key(self):
         return self._api_key
@@ -51,70 +92,206 @@ class Client:
     def base_url(self):
         return self._base_url
 
+    @property
+    def transport(self):
+        return self._transport
+
+    @property
+    def cache(self):
+        return self._transport.cache
+
+    @property
+    def catalog(self):
+        return self._catalog
+
+    @property
+    def store(self):
+        return self._store
+
+    def close(self):
+        self._transport.close()
+
+    def _resource(self, class_, **kwargs):
+        # Queries are immutable, so each endpoint's unfiltered query is
+        # built once and shared.
+        resource = self._resources.get(class_)
+
+        if resource is None:
+            resource = self._resources.setdefault(
+                class_,
+                class_(
+                    self.api_key,
+                    self.base_url,
+                    transport=self.transport,
+                    **kwargs,
+                ),
+            )
+
+        return resource
+
+    def download_series(
+        self,
+        series_instance_uids,
+        dest_dir,
+        *,
+        max_workers=4,
+        chunk_size=None,
+        resume=False,
+        extract=False,
+        strategy="zip",
+        instance_workers=8,
+        fan_out_min_objects=2,
+        fan_out_min_object_size_in_bytes=1024**2,
+        fan_out_min_size_in_bytes=16 * 1024**2,
+        callback=None,
+    ):
+        return _download.download_series(
+            self,
+            series_instance_uids,
+            dest_dir,
+            max_workers=max_workers,
+            chunk_size=chunk_size,
+            resume=resume,
+            extract=extract,
+            strategy=strategy,
+            instance_workers=instance_workers,
+            fan_out_min_objects=fan_out_min_objects,
+            fan_out_min_object_size_in_bytes=fan_out_min_object_size_in_bytes,
+            fan_out_min_size_in_bytes=fan_out_min_size_in_bytes,
+            callback=callback,
+        )
+
+    def plan_download(
+        self,
+        series,
+        *,
+        dest_dir=None,
+        batches=1,
+        headroom=0.05,
+        max_workers=16,
+    ):
+        return _plan.plan_download(
+            self,
+            series,
+            dest_dir=dest_dir,
+            batches=batches,
+            headroom=headroom,
+            max_workers=max_workers,
+        )
+
+    def preload_metadata(self, *, max_workers=16):
+        if not max_workers > 0:
+            raise ValueError(
+                "maximum number of workers must be greater than zero"
+            )
+
+        resources = [
+            self.collections,
+            self.modalities,
+            self.body_parts_examined,
+            self.manufacturers,
+            self.patients,
+            self.patients_by_modality,
+            self.patient_studies,
+            self.series,
+            self.series_size,
+            self.images,
+            self.new_patients_in_collection,
+            self.new_studies_in_patient_collection,
+            self.sop_instance_uids,
+            self.single_image,
+            self.contents_by_name,
+        ]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            return list(
+                executor.map(lambda resource: resource.metadata, resources)
+            )
+
+    def invalidate_metadata(self):
+        _resources.invalidate_metadata(self.base_url)
+
     @property
     def collections(self):
-        return _resources.CollectionsResource(self.api_key, self.base_url)
+        return self._resource(
+            _resources.CollectionsResource, catalog=self.catalog
+        )
 
     @property
     def modalities(self):
-        return _resources.ModalitiesResource(self.api_key, self.base_url)
+        return self._resource(
+            _resources.ModalitiesResource, catalog=self.catalog
+        )
 
     @property
     def body_parts_examined(self):
-        return _resources.BodyPartsExaminedResource(
-            self.api_key, self.base_url
+        return self._resource(
+            _resources.BodyPartsExaminedResource, catalog=self.catalog
         )
 
     @property
     def manufacturers(self):
-        return _resources.ManufacturersResource(self.api_key, self.base_url)
+        return self._resource(
+            _resources.ManufacturersResource, catalog=self.catalog
+        )
 
     @property
     def patients(self):
-        return _resources.PatientsResource(self.api_key, self.base_url)
+        return self._resource(
+            _resources.PatientsResource, catalog=self.catalog
+        )
 
     @property
     def patients_by_modality(self):
-        return _resources.PatientsByModalityResource(
-            self.api_key, self.base_url
+        return self._resource(
+            _resources.PatientsByModalityResource, catalog=self.catalog
         )
 
     @property
     def patient_studies(self):
-        return _resources.PatientStudiesResource(self.api_key, self.base_url)
+        return self._resource(
+            _resources.PatientStudiesResource, catalog=self.catalog
+        )
 
     @property
     def series(self):
-        return _resources.SeriesResource(self.api_key, self.base_url)
+        return self._resource(_resources.SeriesResource, catalog=self.catalog)
 
     @property
     def series_size(self):
-        return _resources.SeriesSizeResource(self.api_key, self.base_url)
+        return self._resource(
+            _resources.SeriesSizeResource, catalog=self.catalog
+        )
 
     @property
     def images(self):
-        return _resources.ImagesResource(self.api_key, self.base_url)
+        return self._resource(_resources.ImagesResource, store=self.store)
 
     @property
     def new_patients_in_collection(self):
-        return _resources.NewPatientsInCollectionResource(
-            self.api_key, self.base_url
+        return self._resource(
+            _resources.NewPatientsInCollectionResource, catalog=self.catalog
         )
 
     @property
     def new_studies_in_patient_collection(self):
-        return _resources.NewStudiesInPatientCollectionResource(
-            self.api_key, self.base_url
+        return self._resource(
+            _resources.NewStudiesInPatientCollectionResource,
+            catalog=self.catalog,
         )
 
     @property
     def sop_instance_uids(self):
-        return _resources.SOPInstanceUIDsResource(self.api_key, self.base_url)
+        return self._resource(
+            _resources.SOPInstanceUIDsResource, catalog=self.catalog
+        )
 
     @property
     def single_image(self):
-        return _resources.SingleImageResource(self.api_key, self.base_url)
+        return self._resource(_resources.SingleImageResource)
 
     @property
     def contents_by_name(self):
-        return _resources.ContentsByNameResource(self.api_key, self.base_url)
+        return self._resource(
+            _resources.ContentsByNameResource, catalog=self.catalog
+        )
@@ -0,0 +1,247 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from tcia import _types
+
+
+__all__ = ["ResponseCache"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    endpoint TEXT NOT NULL,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed);
+CREATE INDEX IF NOT EXISTS responses_endpoint ON responses (endpoint);
+"""
+
+
+def _endpoint_from_url(url):
+    # .../<resource>/query/<endpoint>[/metadata]
+    return url.rsplit("/query/", 1)[-1]
+
+
+def _make_key(url, params, api_key):
+    items = sorted(
+        (key, str(value)) for key, value in params.items() if value is not None
+    )
+
+    # Keys can see different collections, so a response is only served
+    # back to the key that fetched it. Only a digest is stored.
+    if api_key is not None:
+        api_key = hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    return json.dumps([url, items, api_key], separators=(",", ":"))
+
+
+class ResponseCache:
+    def __init__(
+        self, path, *, ttl=3600, ttls=None, max_size_in_bytes=64 * 1024**2
+    ):
+        if not ttl > 0:
+            raise ValueError(
+                "time to live in seconds must be greater than zero"
+            )
+
+        if not max_size_in_bytes > 0:
+            raise ValueError("maximum size in bytes must be greater than zero")
+
+        if ttls is None:
+            ttls = {}
+
+        if path != ":memory:":
+            path = os.fspath(path)
+
+        self._path = path
+        self._ttl = ttl
+        self._ttls = dict(ttls)
+        self._max_size_in_bytes = max_size_in_bytes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        self._size_in_bytes = self._total_size()
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}('{self._path}', ttl={self._ttl}, "
+            f"ttls={self._ttls}, max_size_in_bytes={self._max_size_in_bytes})"
+        )
+
+    def __getstate__(self):
+        # A database handle is per process: unpickling reopens the file.
+        return {
+            "path": self._path,
+            "ttl": self._ttl,
+            "ttls": self._ttls,
+            "max_size_in_bytes": self._max_size_in_bytes,
+        }
+
+    def __setstate__(self, state):
+        state = dict(state)
+        self.__init__(state.pop("path"), **state)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def ttl(self):
+        return self._ttl
+
+    @property
+    def ttls(self):
+        return dict(self._ttls)
+
+    @property
+    def max_size_in_bytes(self):
+        return self._max_size_in_bytes
+
+    @property
+    def stats(self):
+        with self._lock:
+            entries, size_in_bytes = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+            return _types.CacheStats(
+                hits=self._hits,
+                misses=self._misses,
+                entries=entries,
+                size_in_bytes=size_in_bytes,
+            )
+
+    def ttl_for(self, url):
+        return self._ttls.get(_endpoint_from_url(url), self._ttl)
+
+    def get(self, url, params=None, *, api_key=None):
+        key = _make_key(url, {} if params is None else params, api_key)
+        now = time.time()
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT text FROM responses WHERE key = ? AND expires > ?",
+                (key, now),
+            ).fetchone()
+
+            if row is None:
+                self._misses += 1
+                return None
+
+            self._connection.execute(
+                "UPDATE responses SET accessed = ? WHERE key = ?", (now, key)
+            )
+            self._hits += 1
+            return row[0]
+
+    def set(self, url, params, text, *, api_key=None):
+        key = _make_key(url, {} if params is None else params, api_key)
+        size = len(text.encode("utf-8"))
+        now = time.time()
+
+        # An entry that can never fit would only flush the whole cache.
+        if size > self._max_size_in_bytes:
+            return
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    key,
+                    _endpoint_from_url(url),
+                    text,
+                    size,
+                    now + self.ttl_for(url),
+                    now,
+                ),
+            )
+            self._size_in_bytes += size - (0 if row is None else row[0])
+
+            # A running total spares each set() a scan of the table.
+            # Other processes sharing the file are only seen by the
+            # recount once this total goes over the limit.
+            if self._size_in_bytes > self._max_size_in_bytes:
+                self._evict(now)
+
+    def _total_size(self):
+        (total,) = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        return total
+
+    def _evict(self, now):
+        # get() already skips expired entries; they only take up space.
+        self._connection.execute(
+            "DELETE FROM responses WHERE expires <= ?", (now,)
+        )
+        total = self._size_in_bytes = self._total_size()
+
+        if total <= self._max_size_in_bytes:
+            return
+
+        # Least recently used first, until the store fits again.
+        keys = []
+        rows = self._connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed"
+        ).fetchall()
+
+        for key, size in rows:
+            if total <= self._max_size_in_bytes:
+                break
+            keys.append((key,))
+            total -= size
+
+        self._connection.executemany(
+            "DELETE FROM responses WHERE key = ?", keys
+        )
+        self._size_in_bytes = total
+
+    def invalidate(self, endpoint=None):
+        with self._lock:
+            if endpoint is None:
+                self._connection.execute("DELETE FROM responses")
+            else:
+                self._connection.execute(
+                    "DELETE FROM responses WHERE endpoint = ?", (endpoint,)
+                )
+
+            self._size_in_bytes = self._total_size()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
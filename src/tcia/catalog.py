@@ -0,0 +1,782 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import concurrent.futures
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from tcia import _resources
+from tcia import _types
+
+
+__all__ = ["Catalog"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS collections (
+    collection TEXT PRIMARY KEY,
+    synced REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id TEXT NOT NULL,
+    patient_name TEXT,
+    patient_sex TEXT,
+    collection TEXT NOT NULL,
+    PRIMARY KEY (collection, patient_id)
+);
+CREATE TABLE IF NOT EXISTS patient_studies (
+    study_instance_uid TEXT PRIMARY KEY,
+    study_date TEXT,
+    study_description TEXT,
+    patient_age TEXT,
+    patient_id TEXT,
+    patient_name TEXT,
+    patient_sex TEXT,
+    collection TEXT,
+    series_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS patient_studies_patient
+    ON patient_studies (collection, patient_id);
+CREATE TABLE IF NOT EXISTS series (
+    series_instance_uid TEXT PRIMARY KEY,
+    study_instance_uid TEXT,
+    modality TEXT,
+    protocol_name TEXT,
+    series_date TEXT,
+    series_description TEXT,
+    body_part_examined TEXT,
+    series_number,
+    annotations_flag,
+    collection TEXT,
+    patient_id TEXT,
+    manufacturer TEXT,
+    manufacturer_model_name TEXT,
+    software_version TEXT,
+    image_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS series_filters
+    ON series (collection, modality, body_part_examined, manufacturer);
+CREATE INDEX IF NOT EXISTS series_modality
+    ON series (modality, body_part_examined, manufacturer);
+CREATE INDEX IF NOT EXISTS series_patient ON series (collection, patient_id);
+CREATE INDEX IF NOT EXISTS series_study ON series (study_instance_uid);
+CREATE TABLE IF NOT EXISTS series_sizes (
+    series_instance_uid TEXT PRIMARY KEY,
+    total_size_in_bytes INTEGER,
+    object_count INTEGER
+);
+CREATE TABLE IF NOT EXISTS sop_instance_uids (
+    series_instance_uid TEXT NOT NULL,
+    sop_instance_uid TEXT NOT NULL,
+    PRIMARY KEY (series_instance_uid, sop_instance_uid)
+);
+CREATE TABLE IF NOT EXISTS sop_instance_uids_synced (
+    series_instance_uid TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    collection TEXT PRIMARY KEY,
+    high_water TEXT NOT NULL
+);
+"""
+
+# Fields the API returns with mixed JSON types (a number or a string, a
+# boolean). SQLite would coerce them, so they are stored as JSON text in
+# columns without affinity and read back as the API returned them.
+_JSON_FIELDS = frozenset(["series_number", "annotations_flag"])
+
+# REST query parameter -> catalog column, per endpoint the catalog can
+# answer locally.
+_PARAMS = {
+    "getPatient": {"Collection": "collection"},
+    "getPatientStudy": {
+        "Collection": "collection",
+        "PatientID": "patient_id",
+        "StudyInstanceUID": "study_instance_uid",
+    },
+    "getSeries": {
+        "Collection": "collection",
+        "StudyInstanceUID": "study_instance_uid",
+        "PatientID": "patient_id",
+        "SeriesInstanceUID": "series_instance_uid",
+        "Modality": "modality",
+        "ManufacturerModelName": "manufacturer_model_name",
+        "Manufacturer": "manufacturer",
+    },
+}
+
+
+def _where(conditions):
+    clauses = []
+    values = []
+
+    for column, value in conditions.items():
+        if value is None:
+            continue
+
+        if isinstance(value, (list, set, tuple)):
+            value = list(value)
+            placeholders = ", ".join("?" for _ in value)
+            clauses.append(f"{column} IN ({placeholders})")
+            values.extend(value)
+        else:
+            clauses.append(f"{column} = ?")
+            values.append(value)
+
+    if not clauses:
+        return "", values
+
+    return " WHERE " + " AND ".join(clauses), values
+
+
+class Catalog:
+    def __init__(self, path):
+        if path != ":memory:":
+            path = os.fspath(path)
+
+        self._path = path
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}('{self._path}')"
+
+    def __getstate__(self):
+        # A database handle is per process: unpickling reopens the file.
+        return {"path": self._path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def path(self):
+        return self._path
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _select(self, table, record_type, conditions, order_by):
+        where, values = _where(conditions)
+        columns = ", ".join(record_type._fields)
+
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {columns} FROM {table}{where} ORDER BY {order_by}",
+                values,
+            ).fetchall()
+
+        json_indices = [
+            index
+            for index, field in enumerate(record_type._fields)
+            if field in _JSON_FIELDS
+        ]
+
+        if json_indices:
+            rows = [list(row) for row in rows]
+
+            for row in rows:
+                for index in json_indices:
+                    if row[index] is not None:
+                        row[index] = json.loads(row[index])
+
+        return [record_type(*row) for row in rows]
+
+    def _insert(self, table, records):
+        if not records:
+            return
+
+        fields = records[0]._fields
+        json_fields = _JSON_FIELDS.intersection(fields)
+
+        if json_fields:
+            records = [
+                record._replace(
+                    **{
+                        field: json.dumps(getattr(record, field))
+                        for field in json_fields
+                        if getattr(record, field) is not None
+                    }
+                )
+                for record in records
+            ]
+
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        self._connection.executemany(
+            f"INSERT OR REPLACE INTO {table} ({columns}) "
+            f"VALUES ({placeholders})",
+            records,
+        )
+
+    def is_synced(self, collection):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM collections WHERE collection = ?", (collection,)
+            ).fetchone()
+
+        return row is not None
+
+    def collections(self):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT collection FROM collections ORDER BY collection"
+            ).fetchall()
+
+        return [_types.Collection(collection=row[0]) for row in rows]
+
+    def patients(self, *, collection=None, patient_id=None, patient_sex=None):
+        return self._select(
+            "patients",
+            _types.Patient,
+            {
+                "collection": collection,
+                "patient_id": patient_id,
+                "patient_sex": patient_sex,
+            },
+            "collection, patient_id",
+        )
+
+    def patient_studies(
+        self, *, collection=None, patient_id=None, study_instance_uid=None
+    ):
+        return self._select(
+            "patient_studies",
+            _types.PatientStudy,
+            {
+                "collection": collection,
+                "patient_id": patient_id,
+                "study_instance_uid": study_instance_uid,
+            },
+            "collection, patient_id, study_instance_uid",
+        )
+
+    def series(
+        self,
+        *,
+        collection=None,
+        patient_id=None,
+        study_instance_uid=None,
+        series_instance_uid=None,
+        modality=None,
+        body_part_examined=None,
+        manufacturer=None,
+        manufacturer_model_name=None,
+    ):
+        return self._select(
+            "series",
+            _types.Series,
+            {
+                "collection": collection,
+                "patient_id": patient_id,
+                "study_instance_uid": study_instance_uid,
+                "series_instance_uid": series_instance_uid,
+                "modality": modality,
+                "body_part_examined": body_part_examined,
+                "manufacturer": manufacturer,
+                "manufacturer_model_name": manufacturer_model_name,
+            },
+            "collection, patient_id, study_instance_uid, series_instance_uid",
+        )
+
+    def series_size(self, series_instance_uid):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT total_size_in_bytes, object_count FROM series_sizes "
+                "WHERE series_instance_uid = ?",
+                (series_instance_uid,),
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return _types.SeriesSize(*row)
+
+    def sop_instance_uids(self, series_instance_uid):
+        with self._lock:
+            synced = self._connection.execute(
+                "SELECT 1 FROM sop_instance_uids_synced "
+                "WHERE series_instance_uid = ?",
+                (series_instance_uid,),
+            ).fetchone()
+
+            if synced is None:
+                return None
+
+            rows = self._connection.execute(
+                "SELECT sop_instance_uid FROM sop_instance_uids "
+                "WHERE series_instance_uid = ? ORDER BY sop_instance_uid",
+                (series_instance_uid,),
+            ).fetchall()
+
+        return [_types.SOPInstanceUID(sop_instance_uid=row[0]) for row in rows]
+
+    def image_counts_by_patient(
+        self,
+        *,
+        collection=None,
+        modality=None,
+        body_part_examined=None,
+        manufacturer=None,
+    ):
+        where, values = _where(
+            {
+                "collection": collection,
+                "modality": modality,
+                "body_part_examined": body_part_examined,
+                "manufacturer": manufacturer,
+            }
+        )
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT collection, patient_id, SUM(image_count) FROM series"
+                f"{where} GROUP BY collection, patient_id "
+                "ORDER BY collection, patient_id",
+                values,
+            ).fetchall()
+
+        return {(row[0], row[1]): row[2] for row in rows}
+
+    def _store_collection(
+        self, collection, patients, studies, series_list, high_water
+    ):
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN")
+
+            try:
+                for table in ["patients", "patient_studies", "series"]:
+                    connection.execute(
+                        f"DELETE FROM {table} WHERE collection = ?",
+                        (collection,),
+                    )
+
+                self._insert("patients", patients)
+                self._insert("patient_studies", studies)
+                self._insert("series", series_list)
+                self._mark_synced(collection, high_water)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+            connection.execute("COMMIT")
+
+    def _mark_synced(self, collection, high_water):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO collections VALUES (?, ?)",
+            (collection, time.time()),
+        )
+        self._connection.execute(
+            "INSERT OR REPLACE INTO sync_state VALUES (?, ?)",
+            (collection, high_water),
+        )
+
+    def _store_delta(
+        self, collection, patients, studies, series_by_study, high_water
+    ):
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN")
+
+            try:
+                # Patients only known from the new-patient feed carry no
+                # details, which must not blank out those already stored.
+                connection.executemany(
+                    "UPDATE patients SET "
+                    "patient_name = COALESCE(?, patient_name), "
+                    "patient_sex = COALESCE(?, patient_sex) "
+                    "WHERE collection = ? AND patient_id = ?",
+                    [
+                        (
+                            record.patient_name,
+                            record.patient_sex,
+                            record.collection,
+                            record.patient_id,
+                        )
+                        for record in patients
+                    ],
+                )
+                connection.executemany(
+                    "INSERT OR IGNORE INTO patients "
+                    f"({', '.join(_types.Patient._fields)}) "
+                    "VALUES (?, ?, ?, ?)",
+                    patients,
+                )
+                self._insert("patient_studies", studies)
+
+                # A touched study is refreshed as a whole, so series that
+                # disappeared from it upstream disappear here too.
+                for study_instance_uid, series_list in series_by_study.items():
+                    connection.execute(
+                        "DELETE FROM series WHERE study_instance_uid = ?",
+                        (study_instance_uid,),
+                    )
+                    self._insert("series", series_list)
+
+                self._mark_synced(collection, high_water)
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+            connection.execute("COMMIT")
+
+    def _store_series_size(self, series_instance_uid, series_size):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO series_sizes VALUES (?, ?, ?)",
+                (series_instance_uid, *series_size),
+            )
+
+    def _store_sop_instance_uids(self, series_instance_uid, sop_instance_uids):
+        with self._lock:
+            connection = self._connection
+            connection.execute("BEGIN")
+
+            try:
+                connection.execute(
+                    "DELETE FROM sop_instance_uids "
+                    "WHERE series_instance_uid = ?",
+                    (series_instance_uid,),
+                )
+                connection.executemany(
+                    "INSERT OR REPLACE INTO sop_instance_uids VALUES (?, ?)",
+                    [
+                        (series_instance_uid, record.sop_instance_uid)
+                        for record in sop_instance_uids
+                    ],
+                )
+                connection.execute(
+                    "INSERT OR REPLACE INTO sop_instance_uids_synced "
+                    "VALUES (?)",
+                    (series_instance_uid,),
+                )
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+            connection.execute("COMMIT")
+
+    def _resource(self, client, class_):
+        # Syncing must always see the archive, never this catalog.
+        return class_(
+            client.api_key, client.base_url, transport=client.transport
+        )
+
+    def high_water(self, collection):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT high_water FROM sync_state WHERE collection = ?",
+                (collection,),
+            ).fetchone()
+
+        return None if row is None else row[0]
+
+    def sync_collection(
+        self,
+        client,
+        collection,
+        *,
+        series_sizes=False,
+        sop_instance_uids=False,
+        max_workers=8,
+    ):
+        if not max_workers > 0:
+            raise ValueError(
+                "maximum number of workers must be greater than zero"
+            )
+
+        # Anything published from today on is picked up by the next
+        # incremental sync; re-reading today is harmless since deltas
+        # are applied as upserts.
+        high_water = datetime.date.today().isoformat()
+        patients = self._resource(client, _resources.PatientsResource)
+        studies = self._resource(client, _resources.PatientStudiesResource)
+        series = self._resource(client, _resources.SeriesResource)
+        series_list = series(collection=collection).get()
+        self._store_collection(
+            collection,
+            patients(collection=collection).get(),
+            studies(collection=collection).get(),
+            series_list,
+            high_water,
+        )
+        self._sync_series_details(
+            client,
+            [record.series_instance_uid for record in series_list],
+            series_sizes=series_sizes,
+            sop_instance_uids=sop_instance_uids,
+            max_workers=max_workers,
+        )
+
+    def sync_incremental(
+        self,
+        client,
+        collection,
+        *,
+        since=None,
+        series_sizes=False,
+        sop_instance_uids=False,
+        max_workers=8,
+    ):
+        if not max_workers > 0:
+            raise ValueError(
+                "maximum number of workers must be greater than zero"
+            )
+
+        if since is None:
+            since = self.high_water(collection)
+
+        if since is None:
+            self.sync_collection(
+                client,
+                collection,
+                series_sizes=series_sizes,
+                sop_instance_uids=sop_instance_uids,
+                max_workers=max_workers,
+            )
+            return _types.CatalogDelta(
+                collection=collection,
+                since=None,
+                patients=self.patients(collection=collection),
+                patient_studies=self.patient_studies(collection=collection),
+                series=self.series(collection=collection),
+            )
+
+        if isinstance(since, datetime.date):
+            since = since.isoformat()
+
+        high_water = datetime.date.today().isoformat()
+        new_patients = self._resource(
+            client, _resources.NewPatientsInCollectionResource
+        )
+        new_studies = self._resource(
+            client, _resources.NewStudiesInPatientCollectionResource
+        )
+        studies = self._resource(client, _resources.PatientStudiesResource)
+        series = self._resource(client, _resources.SeriesResource)
+
+        def patient_studies(patient):
+            return studies(
+                collection=collection, patient_id=patient.patient_id
+            ).get()
+
+        def study(new_study):
+            return studies(
+                collection=collection,
+                patient_id=new_study.patient_id,
+                study_instance_uid=new_study.study_instance_uid,
+            ).get()
+
+        def study_series(study_instance_uid):
+            return series(study_instance_uid=study_instance_uid).get()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            new_patient_list = new_patients(
+                date=since, collection=collection
+            ).get()
+            new_study_list = new_studies(
+                date=since, collection=collection
+            ).get()
+
+            # New patients bring all of their studies; new studies of
+            # known patients are fetched one by one.
+            study_list = {}
+
+            for records in executor.map(patient_studies, new_patient_list):
+                for record in records:
+                    study_list[record.study_instance_uid] = record
+
+            for records in executor.map(
+                study,
+                [
+                    new_study
+                    for new_study in new_study_list
+                    if new_study.study_instance_uid not in study_list
+                ],
+            ):
+                for record in records:
+                    study_list[record.study_instance_uid] = record
+
+            series_by_study = dict(
+                zip(
+                    study_list,
+                    executor.map(study_series, list(study_list)),
+                )
+            )
+
+        patient_list = {}
+
+        for record in study_list.values():
+            patient_list.setdefault(
+                record.patient_id,
+                _types.Patient(
+                    patient_id=record.patient_id,
+                    patient_name=record.patient_name,
+                    patient_sex=record.patient_sex,
+                    collection=collection,
+                ),
+            )
+
+        for record in new_patient_list:
+            patient_list.setdefault(
+                record.patient_id,
+                _types.Patient(
+                    patient_id=record.patient_id,
+                    patient_name=None,
+                    patient_sex=None,
+                    collection=collection,
+                ),
+            )
+
+        series_list = [
+            record
+            for records in series_by_study.values()
+            for record in records
+        ]
+        self._store_delta(
+            collection,
+            list(patient_list.values()),
+            list(study_list.values()),
+            series_by_study,
+            high_water,
+        )
+        self._sync_series_details(
+            client,
+            [record.series_instance_uid for record in series_list],
+            series_sizes=series_sizes,
+            sop_instance_uids=sop_instance_uids,
+            max_workers=max_workers,
+        )
+        return _types.CatalogDelta(
+            collection=collection,
+            since=since,
+            patients=list(patient_list.values()),
+            patient_studies=list(study_list.values()),
+            series=series_list,
+        )
+
+    def _sync_series_details(
+        self,
+        client,
+        series_instance_uids,
+        *,
+        series_sizes,
+        sop_instance_uids,
+        max_workers,
+    ):
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            if series_sizes:
+                list(
+                    executor.map(
+                        lambda uid: self._sync_series_size(client, uid),
+                        series_instance_uids,
+                    )
+                )
+
+            if sop_instance_uids:
+                list(
+                    executor.map(
+                        lambda uid: self._sync_sop_instance_uids(client, uid),
+                        series_instance_uids,
+                    )
+                )
+
+    def _sync_series_size(self, client, series_instance_uid):
+        resource = self._resource(client, _resources.SeriesSizeResource)
+        records = resource(series_instance_uid=series_instance_uid).get()
+
+        for record in records:
+            self._store_series_size(series_instance_uid, record)
+
+    def _sync_sop_instance_uids(self, client, series_instance_uid):
+        resource = self._resource(client, _resources.SOPInstanceUIDsResource)
+        records = resource(series_instance_uid=series_instance_uid).get()
+        self._store_sop_instance_uids(series_instance_uid, records)
+
+    def _resolve_collections(self, table, column, value):
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT DISTINCT collection FROM {table} WHERE {column} = ?",
+                (value,),
+            ).fetchall()
+
+        return [row[0] for row in rows]
+
+    def lookup(self, endpoint, params):
+        if endpoint == "getSeriesSize":
+            series_size = self.series_size(params.get("SeriesInstanceUID"))
+            return None if series_size is None else [series_size]
+
+        if endpoint == "getSOPInstanceUIDs":
+            return self.sop_instance_uids(params.get("SeriesInstanceUID"))
+
+        try:
+            columns = _PARAMS[endpoint]
+        except KeyError:
+            return None
+
+        conditions = {
+            column: params.get(param) for param, column in columns.items()
+        }
+
+        # Only answer when every collection the query can touch has been
+        # materialized completely; otherwise fall through to the archive.
+        if conditions["collection"] is not None:
+            collections = [conditions["collection"]]
+        elif conditions.get("series_instance_uid") is not None:
+            collections = self._resolve_collections(
+                "series",
+                "series_instance_uid",
+                conditions["series_instance_uid"],
+            )
+        elif conditions.get("study_instance_uid") is not None:
+            collections = self._resolve_collections(
+                "patient_studies",
+                "study_instance_uid",
+                conditions["study_instance_uid"],
+            )
+        else:
+            collections = []
+
+        if not collections or not all(map(self.is_synced, collections)):
+            return None
+
+        if endpoint == "getPatient":
+            return self.patients(**conditions)
+
+        if endpoint == "getPatientStudy":
+            return self.patient_studies(**conditions)
+
+        return self.series(**conditions)
+
+    def store(self, endpoint, params, records):
+        if endpoint == "getSeriesSize":
+            for record in records:
+                self._store_series_size(params["SeriesInstanceUID"], record)
+        elif endpoint == "getSOPInstanceUIDs":
+            self._store_sop_instance_uids(params["SeriesInstanceUID"], records)
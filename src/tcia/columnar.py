@@ -0,0 +1,488 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import array
+
+
+__all__ = ["Categorical", "Strings", "Table"]
+
+# Imported on first use: numpy is optional and slow to import, and this
+# module is loaded with every client.
+numpy = None
+
+
+def _require_numpy():
+    global numpy
+
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError(
+                "columnar results require numpy: install it with "
+                "'pip install tcia[columnar]'"
+            )
+
+
+def _to_object_array(values):
+    array_ = numpy.empty(len(values), dtype=object)
+    array_[:] = values
+    return array_
+
+
+def _to_array(values):
+    if values and all(
+        isinstance(value, int) and not isinstance(value, bool)
+        for value in values
+    ):
+        return numpy.array(values, dtype=numpy.int64)
+
+    if all(value is None or isinstance(value, str) for value in values):
+        return Strings.from_values(values)
+
+    return _to_object_array(values)
+
+
+def _to_indices(key, length):
+    if isinstance(key, slice):
+        return numpy.arange(length)[key]
+
+    key = numpy.asarray(key)
+
+    if key.size == 0:
+        return numpy.zeros(0, dtype=numpy.intp)
+
+    if key.dtype == bool:
+        if key.shape != (length,):
+            raise IndexError("boolean index must have one value per row")
+        return numpy.flatnonzero(key)
+
+    return numpy.arange(length)[key]
+
+
+class Strings:
+    def __init__(self, offsets, data, valid):
+        _require_numpy()
+        # Arrow's string layout: row i is data[offsets[i]:offsets[i + 1]]
+        # as UTF-8, so to_arrow() can wrap the buffers without copying.
+        self._offsets = numpy.asarray(offsets)
+        self._data = numpy.asarray(data, dtype=numpy.uint8)
+        self._valid = numpy.asarray(valid, dtype=bool)
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}(<{len(self)} values>)"
+
+    def __len__(self):
+        return len(self._valid)
+
+    def __iter__(self):
+        return iter(self.tolist())
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, numpy.integer)):
+            index = range(len(self))[key]
+
+            if not self._valid[index]:
+                return None
+
+            start, end = self._offsets[index], self._offsets[index + 1]
+            return self._data[start:end].tobytes().decode("utf-8")
+
+        return self._take(_to_indices(key, len(self)))
+
+    @classmethod
+    def from_values(cls, values):
+        _require_numpy()
+        encoded = [
+            b"" if value is None else value.encode("utf-8") for value in values
+        ]
+        lengths = numpy.fromiter(
+            (len(value) for value in encoded),
+            dtype=numpy.int64,
+            count=len(encoded),
+        )
+        data = b"".join(encoded)
+        # 32-bit offsets halve their size for all but enormous columns.
+        dtype = numpy.int32 if len(data) < 2**31 else numpy.int64
+        offsets = numpy.zeros(len(encoded) + 1, dtype=dtype)
+        numpy.cumsum(lengths, out=offsets[1:])
+        return cls(
+            offsets,
+            numpy.frombuffer(data, dtype=numpy.uint8),
+            numpy.fromiter(
+                (value is not None for value in values),
+                dtype=bool,
+                count=len(values),
+            ),
+        )
+
+    @property
+    def offsets(self):
+        return self._offsets
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def valid(self):
+        return self._valid
+
+    @property
+    def nbytes(self):
+        return self._offsets.nbytes + self._data.nbytes + self._valid.nbytes
+
+    def _take(self, indices):
+        starts = self._offsets[:-1][indices]
+        lengths = self._offsets[1:][indices] - starts
+        offsets = numpy.zeros(len(indices) + 1, dtype=self._offsets.dtype)
+        numpy.cumsum(lengths, out=offsets[1:])
+        # Source position of every byte of the result, in order.
+        positions = numpy.repeat(starts - offsets[:-1], lengths)
+        positions += numpy.arange(offsets[-1], dtype=positions.dtype)
+        return self.__class__(
+            offsets, self._data[positions], self._valid[indices]
+        )
+
+    def tolist(self):
+        data = self._data.tobytes()
+        offsets = self._offsets.tolist()
+        return [
+            (
+                data[offsets[index] : offsets[index + 1]].decode("utf-8")
+                if valid
+                else None
+            )
+            for index, valid in enumerate(self._valid.tolist())
+        ]
+
+    def to_numpy(self):
+        return _to_object_array(self.tolist())
+
+
+class Categorical:
+    def __init__(self, codes, categories):
+        _require_numpy()
+        # Code -1 marks a missing (None) value.
+        self._codes = numpy.asarray(codes, dtype=numpy.int32)
+        self._categories = list(categories)
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(<{len(self)} values>, "
+            f"categories={self._categories})"
+        )
+
+    def __len__(self):
+        return len(self._codes)
+
+    def __iter__(self):
+        categories = self._categories
+        return (
+            categories[code] if code >= 0 else None
+            for code in self._codes.tolist()
+        )
+
+    def __getitem__(self, key):
+        codes = self._codes[key]
+
+        if numpy.ndim(codes) == 0:
+            return self._categories[codes] if codes >= 0 else None
+
+        return self.__class__(codes, self._categories)
+
+    @property
+    def codes(self):
+        return self._codes
+
+    @property
+    def categories(self):
+        return list(self._categories)
+
+    def isin(self, values):
+        lookup = {
+            category: code for code, category in enumerate(self._categories)
+        }
+        codes = [lookup[value] for value in values if value in lookup]
+
+        if None in values:
+            codes.append(-1)
+
+        return numpy.isin(self._codes, codes)
+
+    def value_counts(self):
+        counts = numpy.bincount(
+            self._codes + 1, minlength=len(self._categories) + 1
+        )
+        value_counts = {
+            category: int(count)
+            for category, count in zip(self._categories, counts[1:])
+            if count
+        }
+
+        if counts[0]:
+            value_counts[None] = int(counts[0])
+
+        return value_counts
+
+    @property
+    def nbytes(self):
+        return self._codes.nbytes
+
+    def to_numpy(self):
+        return _to_object_array(list(self))
+
+
+class Table:
+    def __init__(self, columns, *, record_type=None):
+        _require_numpy()
+        lengths = {len(column) for column in columns.values()}
+
+        if len(lengths) > 1:
+            raise ValueError("all columns must have the same length")
+
+        self._columns = dict(columns)
+        self._record_type = record_type
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(<{len(self)} rows>, "
+            f"columns={self.columns})"
+        )
+
+    def __len__(self):
+        for column in self._columns.values():
+            return len(column)
+        return 0
+
+    def __getitem__(self, name):
+        return self._columns[name]
+
+    def __iter__(self):
+        values = zip(
+            *(
+                (
+                    list(column)
+                    if isinstance(column, Categorical)
+                    else column.tolist()
+                )
+                for column in self._columns.values()
+            )
+        )
+
+        if self._record_type is None:
+            return values
+
+        return (self._record_type(*row) for row in values)
+
+    @classmethod
+    def from_records(cls, records, record_type, *, categorical=()):
+        _require_numpy()
+        fields = record_type._fields
+        categorical = [field for field in fields if field in categorical]
+        indices = {field: index for index, field in enumerate(fields)}
+        plain = [field for field in fields if field not in categorical]
+        values = {field: [] for field in plain}
+        codes = {field: array.array("i") for field in categorical}
+        lookups = {field: {} for field in categorical}
+
+        # Dictionary-encode categorical fields while the records stream
+        # in, so repeated strings are never materialized per row.
+        for record in records:
+            for field in plain:
+                values[field].append(record[indices[field]])
+
+            for field in categorical:
+                value = record[indices[field]]
+
+                if value is None:
+                    codes[field].append(-1)
+                else:
+                    lookup = lookups[field]
+                    codes[field].append(lookup.setdefault(value, len(lookup)))
+
+        columns = {}
+
+        for field in fields:
+            if field in codes:
+                columns[field] = Categorical(
+                    numpy.frombuffer(codes[field], dtype=numpy.int32),
+                    list(lookups[field]),
+                )
+            else:
+                columns[field] = _to_array(values[field])
+
+        return cls(columns, record_type=record_type)
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self._columns.values())
+
+    @property
+    def record_type(self):
+        return self._record_type
+
+    def filter(self, mask):
+        mask = numpy.asarray(mask, dtype=bool)
+
+        if mask.shape != (len(self),):
+            raise ValueError("mask must have one boolean per row")
+
+        return self.__class__(
+            {name: column[mask] for name, column in self._columns.items()},
+            record_type=self._record_type,
+        )
+
+    def mask(self, **conditions):
+        mask = numpy.ones(len(self), dtype=bool)
+
+        for name, value in conditions.items():
+            column = self._columns[name]
+            values = (
+                set(value)
+                if isinstance(value, (list, set, tuple))
+                else {value}
+            )
+
+            if isinstance(column, Categorical):
+                mask &= column.isin(values)
+            else:
+                mask &= numpy.fromiter(
+                    (item in values for item in column.tolist()),
+                    dtype=bool,
+                    count=len(column),
+                )
+
+        return mask
+
+    def where(self, **conditions):
+        return self.filter(self.mask(**conditions))
+
+    def take(self, indices):
+        return self.__class__(
+            {name: column[indices] for name, column in self._columns.items()},
+            record_type=self._record_type,
+        )
+
+    def group_by(self, name):
+        column = self._columns[name]
+
+        if isinstance(column, Categorical):
+            keys = column.codes
+        elif not isinstance(column, Strings) and column.dtype != object:
+            keys = column
+        else:
+            lookup = {}
+            keys = numpy.fromiter(
+                (
+                    lookup.setdefault(value, len(lookup))
+                    for value in column.tolist()
+                ),
+                dtype=numpy.int64,
+                count=len(column),
+            )
+
+        # A stable sort keeps each group's rows in their original order.
+        order = numpy.argsort(keys, kind="stable")
+        boundaries = numpy.flatnonzero(numpy.diff(keys[order])) + 1
+        groups = {}
+
+        for indices in numpy.split(order, boundaries):
+            if len(indices):
+                key = column[indices[0]]
+
+                if isinstance(key, numpy.generic):
+                    key = key.item()
+
+                groups[key] = self.take(indices)
+
+        return groups
+
+    def value_counts(self, name):
+        column = self._columns[name]
+
+        if isinstance(column, Categorical):
+            return column.value_counts()
+
+        value_counts = {}
+
+        for value in column.tolist():
+            value_counts[value] = value_counts.get(value, 0) + 1
+
+        return value_counts
+
+    def to_pandas(self):
+        import pandas
+
+        return pandas.DataFrame(
+            {
+                name: (
+                    pandas.Categorical.from_codes(
+                        column.codes, column.categories
+                    )
+                    if isinstance(column, Categorical)
+                    else (
+                        column.to_numpy()
+                        if isinstance(column, Strings)
+                        else column
+                    )
+                )
+                for name, column in self._columns.items()
+            },
+            copy=False,
+        )
+
+    def to_arrow(self):
+        import pyarrow
+
+        arrays = []
+
+        for column in self._columns.values():
+            if isinstance(column, Categorical):
+                arrays.append(
+                    pyarrow.DictionaryArray.from_arrays(
+                        pyarrow.array(column.codes, mask=column.codes < 0),
+                        pyarrow.array(
+                            column.categories, type=pyarrow.string()
+                        ),
+                    )
+                )
+            elif isinstance(column, Strings):
+                arrays.append(
+                    pyarrow.Array.from_buffers(
+                        (
+                            pyarrow.string()
+                            if column.offsets.dtype == numpy.int32
+                            else pyarrow.large_string()
+                        ),
+                        len(column),
+                        [
+                            pyarrow.py_buffer(
+                                numpy.packbits(column.valid, bitorder="little")
+                            ),
+                            pyarrow.py_buffer(column.offsets),
+                            pyarrow.py_buffer(column.data),
+                        ],
+                    )
+                )
+            elif column.dtype == object:
+                arrays.append(pyarrow.array(column.tolist()))
+            else:
+                arrays.append(pyarrow.array(column))
+
+        return pyarrow.Table.from_arrays(arrays, names=self.columns)
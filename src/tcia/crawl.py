@@ -0,0 +1,245 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import json
+import queue
+import threading
+
+from tcia import _types
+from tcia import _utils
+
+
+__all__ = ["crawl_series"]
+
+_LEVELS = ["collection", "patient", "study"]
+
+_DONE = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def _list_patients(client, collection):
+    return [
+        patient.patient_id
+        for patient in client.patients(collection=collection).get()
+    ]
+
+
+def _list_studies(client, key):
+    collection, patient_id = key
+    return [
+        study.study_instance_uid
+        for study in client.patient_studies(
+            collection=collection, patient_id=patient_id
+        ).get()
+    ]
+
+
+def _list_series(client, study_instance_uid):
+    return [
+        series._asdict()
+        for series in client.series(
+            study_instance_uid=study_instance_uid
+        ).get()
+    ]
+
+
+_LISTS = {
+    "collection": _list_patients,
+    "patient": _list_studies,
+    "study": _list_series,
+}
+
+
+def _child_key(level, key, child):
+    # Patient IDs are only unique within a collection.
+    if level == "collection":
+        return (key, child)
+    return child
+
+
+def _read_checkpoint(path):
+    completed = {}
+
+    try:
+        buffer = open(path, mode="rt", encoding="utf-8")
+    except FileNotFoundError:
+        return completed
+
+    with buffer:
+        for line in buffer:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A crawl killed mid-write leaves a torn last line.
+                continue
+
+            key = entry["key"]
+
+            if isinstance(key, list):
+                key = tuple(key)
+
+            completed[(entry["level"], key)] = entry["children"]
+
+    return completed
+
+
+def _crawl(client, collections, workers, prefetch, checkpoint):
+    completed = {} if checkpoint is None else _read_checkpoint(checkpoint)
+    journal = None if checkpoint is None else _utils._open_journal(checkpoint)
+    tasks = {level: queue.Queue() for level in _LEVELS}
+    # Only the output is bounded: queued tasks are just identifiers,
+    # while a slow consumer should hold back the series requests.
+    items = queue.Queue(prefetch)
+    stop = threading.Event()
+    lock = threading.Lock()
+    state = {"pending": 0, "seen": set()}
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def submit(level, key):
+        with lock:
+            if (level, key) in state["seen"]:
+                return
+
+            state["seen"].add((level, key))
+            state["pending"] += 1
+
+        tasks[level].put(key)
+
+    def record(level, key, children):
+        line = json.dumps({"level": level, "key": key, "children": children})
+
+        # Flushed per branch, so a crashed crawl loses at most the
+        # requests in flight.
+        with lock:
+            if not journal.closed:
+                journal.write(line + "\n")
+                journal.flush()
+
+    def run(level, key):
+        children = completed.get((level, key))
+
+        if children is None:
+            children = _LISTS[level](client, key)
+
+            if journal is not None:
+                record(level, key, children)
+
+        if level == "study":
+            for entry in children:
+                if not put(_types.Series(**entry)):
+                    return
+        else:
+            child_level = _LEVELS[_LEVELS.index(level) + 1]
+
+            for child in children:
+                submit(child_level, _child_key(level, key, child))
+
+    def work(level):
+        while not stop.is_set():
+            try:
+                key = tasks[level].get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            try:
+                run(level, key)
+            except Exception as error:
+                put(_Failure(error))
+                return
+            finally:
+                # Children are submitted before their parent finishes, so
+                # nothing is pending only once every branch has ended.
+                with lock:
+                    state["pending"] -= 1
+                    finished = state["pending"] == 0
+
+                if finished:
+                    put(_DONE)
+
+    threads = [
+        threading.Thread(target=work, args=(level,), daemon=True)
+        for level in _LEVELS
+        for _ in range(workers[level])
+    ]
+
+    try:
+        collections = list(dict.fromkeys(collections))
+
+        if not collections:
+            return
+
+        for collection in collections:
+            submit("collection", collection)
+
+        for thread in threads:
+            thread.start()
+
+        while True:
+            item = items.get()
+
+            if item is _DONE:
+                return
+
+            if isinstance(item, _Failure):
+                raise item.error
+
+            yield item
+    finally:
+        # Workers notice at their next queue poll or put; a request
+        # already in flight is left to finish on its daemon thread.
+        stop.set()
+
+        if journal is not None:
+            with lock:
+                journal.close()
+
+
+def crawl_series(
+    client,
+    collections,
+    *,
+    patient_workers=2,
+    study_workers=8,
+    series_workers=16,
+    prefetch=256,
+    checkpoint=None,
+):
+    workers = {
+        "collection": patient_workers,
+        "patient": study_workers,
+        "study": series_workers,
+    }
+
+    for name, count in zip(["patient", "study", "series"], workers.values()):
+        if not count > 0:
+            raise ValueError(
+                f"number of {name} workers must be greater than zero"
+            )
+
+    if not prefetch > 0:
+        raise ValueError("prefetch queue size must be greater than zero")
+
+    return _crawl(client, collections, workers, prefetch, checkpoint)
@@ -0,0 +1,258 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import datetime
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+
+from tcia import _download
+from tcia import _plan
+from tcia import _types
+from tcia import _utils
+
+
+__all__ = [
+    "build_manifest",
+    "merge",
+    "read_manifest",
+    "run_shard",
+    "write_manifest",
+]
+
+_MANIFEST_VERSION = 1
+
+
+def _shard_score(series_instance_uid, shard):
+    digest = hashlib.sha256(
+        f"{shard}:{series_instance_uid}".encode("utf-8")
+    ).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def _assign_shard(series_instance_uid, shards):
+    # Rendezvous hashing: each series goes to the shard that scores it
+    # highest. The choice depends on the UID and shard count alone, so
+    # adding or dropping series never moves the others, and a change of
+    # shard count only moves the series the new or dropped shard wins.
+    # Every byte lands on each shard with equal odds, which balances
+    # sizes in expectation rather than exactly.
+    return max(
+        range(shards),
+        key=lambda shard: _shard_score(series_instance_uid, shard),
+    )
+
+
+def build_manifest(client, collections, *, shards, max_workers=16):
+    if not shards > 0:
+        raise ValueError("number of shards must be greater than zero")
+
+    collections = list(collections)
+    series = []
+
+    for collection in collections:
+        series.extend(client.series(collection=collection).get())
+
+    plan = _plan.plan_download(client, series, max_workers=max_workers)
+    estimates = list(plan.series)
+
+    # A series that could not be sized is still mirrored; it is recorded
+    # with unknown sizes.
+    for item in series:
+        if item.series_instance_uid in plan.failed:
+            estimates.append(
+                _types.SeriesEstimate(
+                    series_instance_uid=item.series_instance_uid,
+                    collection=item.collection,
+                    patient_id=item.patient_id,
+                    modality=item.modality,
+                    object_count=0,
+                    size_in_bytes=0,
+                )
+            )
+
+    entries = []
+
+    for estimate in estimates:
+        entry = estimate._asdict()
+
+        if estimate.series_instance_uid in plan.failed:
+            entry["object_count"] = None
+            entry["size_in_bytes"] = None
+
+        entry["shard"] = _assign_shard(estimate.series_instance_uid, shards)
+        entries.append(entry)
+
+    entries.sort(key=lambda entry: entry["series_instance_uid"])
+    return {
+        "version": _MANIFEST_VERSION,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "collections": collections,
+        "shards": shards,
+        "series": entries,
+    }
+
+
+def write_manifest(manifest, path):
+    path = os.fspath(path)
+    temporary_path = f"{path}.tmp"
+
+    with open(temporary_path, mode="wt", encoding="utf-8") as buffer:
+        json.dump(manifest, buffer, indent=2)
+
+    os.replace(temporary_path, path)
+
+
+def read_manifest(path):
+    with open(path, mode="rt", encoding="utf-8") as buffer:
+        manifest = json.load(buffer)
+
+    if manifest.get("version") != _MANIFEST_VERSION:
+        raise ValueError(
+            f"unsupported manifest version {manifest.get('version')}"
+        )
+
+    return manifest
+
+
+def _read_journal(path):
+    try:
+        buffer = open(path, mode="rt", encoding="utf-8")
+    except FileNotFoundError:
+        return
+
+    with buffer:
+        for line in buffer:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # A node killed mid-write leaves a torn last line.
+                continue
+
+
+def _journal_path(dest_dir, shard):
+    return os.path.join(dest_dir, f"shard-{shard}.journal.jsonl")
+
+
+def run_shard(
+    client,
+    manifest,
+    shard,
+    dest_dir,
+    *,
+    journal=None,
+    node=None,
+    max_workers=4,
+    chunk_size=None,
+    resume=False,
+    extract=False,
+    strategy="zip",
+):
+    if not 0 <= shard < manifest["shards"]:
+        raise ValueError(
+            f"shard must be in the range [0, {manifest['shards']})"
+        )
+
+    if journal is None:
+        journal = _journal_path(dest_dir, shard)
+
+    if node is None:
+        node = socket.gethostname()
+
+    os.makedirs(dest_dir, exist_ok=True)
+    completed = {
+        entry["series_instance_uid"]
+        for entry in _read_journal(journal)
+        if entry.get("error") is None
+    }
+    series_instance_uids = [
+        entry["series_instance_uid"]
+        for entry in manifest["series"]
+        if entry["shard"] == shard
+        and entry["series_instance_uid"] not in completed
+    ]
+    lock = threading.Lock()
+
+    with _utils._open_journal(journal) as buffer:
+
+        def record(download):
+            line = json.dumps(
+                {
+                    "series_instance_uid": download.series_instance_uid,
+                    "shard": shard,
+                    "node": node,
+                    "path": download.path,
+                    "size_in_bytes": download.size_in_bytes,
+                    "error": (
+                        None
+                        if download.error is None
+                        else repr(download.error)
+                    ),
+                    "time": time.time(),
+                }
+            )
+
+            # One durable line per series, so a crashed node resumes
+            # where it stopped.
+            with lock:
+                buffer.write(line + "\n")
+                buffer.flush()
+                os.fsync(buffer.fileno())
+
+        return _download.download_series(
+            client,
+            series_instance_uids,
+            dest_dir,
+            max_workers=max_workers,
+            chunk_size=chunk_size,
+            resume=resume,
+            extract=extract,
+            strategy=strategy,
+            callback=record,
+        )
+
+
+def merge(manifest, journals):
+    completed = {}
+    failed = {}
+
+    for journal in journals:
+        for entry in _read_journal(journal):
+            series_instance_uid = entry["series_instance_uid"]
+
+            if entry.get("error") is None:
+                completed[series_instance_uid] = entry
+                failed.pop(series_instance_uid, None)
+            elif series_instance_uid not in completed:
+                failed[series_instance_uid] = entry["error"]
+
+    expected = {entry["series_instance_uid"] for entry in manifest["series"]}
+    return _types.MirrorStatus(
+        completed=sorted(set(completed) & expected),
+        failed={
+            series_instance_uid: error
+            for series_instance_uid, error in sorted(failed.items())
+            if series_instance_uid in expected
+        },
+        missing=sorted(expected - set(completed) - set(failed)),
+        unexpected=sorted((set(completed) | set(failed)) - expected),
+        size_in_bytes=sum(
+            entry["size_in_bytes"]
+            for series_instance_uid, entry in completed.items()
+            if series_instance_uid in expected
+        ),
+    )
@@ -0,0 +1,372 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import hashlib
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from tcia import _types
+from tcia import _zipstream
+
+
+__all__ = ["ImageStore"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS instances (
+    series_instance_uid TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (series_instance_uid, filename)
+);
+CREATE INDEX IF NOT EXISTS instances_sha256 ON instances (sha256);
+CREATE TABLE IF NOT EXISTS series (
+    series_instance_uid TEXT PRIMARY KEY,
+    object_count INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    stored REAL NOT NULL
+);
+"""
+
+_LINKS = ["hard", "reflink", "copy"]
+
+# Linux FICLONE ioctl: share extents copy-on-write (btrfs, XFS).
+_FICLONE = 0x40049409
+
+
+def _reflink(source, path):
+    if fcntl is None:
+        return False
+
+    try:
+        with open(source, mode="rb") as source_buffer:
+            with open(path, mode="wb") as buffer:
+                fcntl.ioctl(buffer.fileno(), _FICLONE, source_buffer.fileno())
+    except OSError:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return False
+
+    return True
+
+
+class ImageStore:
+    def __init__(self, path, *, link="hard"):
+        if link not in _LINKS:
+            raise ValueError(
+                f"link '{link}' is not one of {', '.join(_LINKS)}"
+            )
+
+        path = os.fspath(path)
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+        os.makedirs(os.path.join(path, "tmp"), exist_ok=True)
+        self._path = path
+        self._link = link
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            os.path.join(path, "index.sqlite"),
+            check_same_thread=False,
+            isolation_level=None,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}('{self._path}', link='{self._link}')"
+        )
+
+    def __getstate__(self):
+        # A database handle is per process: unpickling reopens the store.
+        return {"path": self._path, "link": self._link}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], link=state["link"])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def link(self):
+        return self._link
+
+    @property
+    def stats(self):
+        with self._lock:
+            series_count, object_count, size_in_bytes = (
+                self._connection.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(object_count), 0), "
+                    "COALESCE(SUM(size), 0) FROM series"
+                ).fetchone()
+            )
+            (unique_size_in_bytes,) = self._connection.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM "
+                "(SELECT DISTINCT sha256, size FROM instances)"
+            ).fetchone()
+            return _types.StoreStats(
+                series_count=series_count,
+                object_count=object_count,
+                size_in_bytes=size_in_bytes,
+                unique_size_in_bytes=unique_size_in_bytes,
+            )
+
+    def _object_path(self, sha256):
+        return os.path.join(self._path, "objects", sha256[:2], sha256[2:])
+
+    def has_series(self, series_instance_uid):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT 1 FROM series WHERE series_instance_uid = ?",
+                (series_instance_uid,),
+            ).fetchone()
+        return row is not None
+
+    def instances(self, series_instance_uid):
+        if not self.has_series(series_instance_uid):
+            return None
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT series_instance_uid, filename, sha256, size "
+                "FROM instances WHERE series_instance_uid = ? "
+                "ORDER BY filename",
+                (series_instance_uid,),
+            ).fetchall()
+
+        return [_types.StoredInstance(*row) for row in rows]
+
+    def add_instance(self, series_instance_uid, filename, data_iter):
+        sha256 = hashlib.sha256()
+        size = 0
+        descriptor, temporary_path = tempfile.mkstemp(
+            dir=os.path.join(self._path, "tmp")
+        )
+
+        try:
+            with os.fdopen(descriptor, mode="wb") as buffer:
+                for data in data_iter:
+                    sha256.update(data)
+                    size += len(data)
+                    buffer.write(data)
+
+            sha256 = sha256.hexdigest()
+            path = self._object_path(sha256)
+
+            # Placing the object and referencing it form one write
+            # transaction, so prune() - in this or another process - sees
+            # either both or neither, never an object about to be used.
+            with self._lock:
+                connection = self._connection
+                connection.execute("BEGIN IMMEDIATE")
+
+                try:
+                    # Identical content is kept once. Objects are
+                    # read-only since hard links into destinations share
+                    # them.
+                    if os.path.exists(path):
+                        os.remove(temporary_path)
+                    else:
+                        os.makedirs(os.path.dirname(path), exist_ok=True)
+                        os.chmod(temporary_path, 0o444)
+                        os.replace(temporary_path, path)
+
+                    connection.execute(
+                        "INSERT OR REPLACE INTO instances VALUES (?, ?, ?, ?)",
+                        (series_instance_uid, filename, sha256, size),
+                    )
+                except BaseException:
+                    connection.execute("ROLLBACK")
+                    raise
+
+                connection.execute("COMMIT")
+        except BaseException:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            raise
+
+        return _types.StoredInstance(
+            series_instance_uid=series_instance_uid,
+            filename=filename,
+            sha256=sha256,
+            size_in_bytes=size,
+        )
+
+    def mark_complete(self, series_instance_uid):
+        with self._lock:
+            object_count, size = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM instances "
+                "WHERE series_instance_uid = ?",
+                (series_instance_uid,),
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO series VALUES (?, ?, ?, ?)",
+                (series_instance_uid, object_count, size, time.time()),
+            )
+
+    def add_series(self, series_instance_uid, members):
+        # Start from scratch so instances left by an interrupted attempt
+        # are not counted into the finished series.
+        self.remove_series(series_instance_uid)
+        stored = [
+            self.add_instance(series_instance_uid, filename, data_iter)
+            for filename, data_iter in members
+            if not filename.endswith("/")
+        ]
+        self.mark_complete(series_instance_uid)
+        return stored
+
+    def remove_series(self, series_instance_uid):
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM series WHERE series_instance_uid = ?",
+                (series_instance_uid,),
+            )
+            self._connection.execute(
+                "DELETE FROM instances WHERE series_instance_uid = ?",
+                (series_instance_uid,),
+            )
+
+    def materialize(self, series_instance_uid, dest_dir):
+        instances = self.instances(series_instance_uid)
+
+        if instances is None:
+            raise KeyError(series_instance_uid)
+
+        dest_dir = os.path.abspath(dest_dir)
+        paths = []
+
+        for instance in instances:
+            source = self._object_path(instance.sha256)
+            path = _zipstream._safe_path(dest_dir, instance.filename)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            if os.path.lexists(path):
+                os.remove(path)
+
+            self._link_or_copy(source, path)
+            paths.append(path)
+
+        return paths
+
+    def _link_or_copy(self, source, path):
+        if self._link == "hard":
+            try:
+                os.link(source, path)
+                return
+            except OSError:
+                # Another file system, or no hard link support.
+                pass
+        elif self._link == "reflink":
+            if _reflink(source, path):
+                return
+
+        shutil.copyfile(source, path)
+
+    def verify(self, series_instance_uid, series_size, *, deep=False):
+        instances = self.instances(series_instance_uid)
+
+        if instances is None:
+            return False
+
+        # The service reports sizes as decimal strings, e.g. "1234.0".
+        if len(instances) != int(float(series_size.object_count or 0)):
+            return False
+
+        if sum(instance.size_in_bytes for instance in instances) != int(
+            float(series_size.total_size_in_bytes or 0)
+        ):
+            return False
+
+        if not deep:
+            return True
+
+        for instance in instances:
+            sha256 = hashlib.sha256()
+
+            with open(self._object_path(instance.sha256), mode="rb") as buffer:
+                for data in iter(lambda: buffer.read(1024**2), b""):
+                    sha256.update(data)
+
+            if sha256.hexdigest() != instance.sha256:
+                return False
+
+        return True
+
+    def prune(self):
+        with self._lock:
+            referenced = {
+                row[0]
+                for row in self._connection.execute(
+                    "SELECT DISTINCT sha256 FROM instances"
+                )
+            }
+
+        objects = os.path.join(self._path, "objects")
+        candidates = [
+            (prefix, name)
+            for prefix in os.listdir(objects)
+            for name in os.listdir(os.path.join(objects, prefix))
+            if prefix + name not in referenced
+        ]
+        removed = 0
+
+        for prefix, name in candidates:
+            # add_instance() may have referenced the object since the
+            # scan; check again under its write lock before unlinking.
+            with self._lock:
+                connection = self._connection
+                connection.execute("BEGIN IMMEDIATE")
+
+                try:
+                    row = connection.execute(
+                        "SELECT 1 FROM instances WHERE sha256 = ? LIMIT 1",
+                        (prefix + name,),
+                    ).fetchone()
+
+                    if row is None:
+                        try:
+                            os.remove(os.path.join(objects, prefix, name))
+                        except FileNotFoundError:
+                            pass
+                        else:
+                            removed += 1
+                finally:
+                    connection.execute("COMMIT")
+
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
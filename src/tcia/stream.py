@@ -0,0 +1,263 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import queue
+import threading
+
+from tcia import _types
+from tcia import _zipstream
+
+
+__all__ = ["InstanceDataset", "iter_series_instances", "iter_single_images"]
+
+_DONE = object()
+
+# Looked up on the first InstanceDataset: torch is optional and takes
+# seconds to import, which iterating without it should never pay.
+torch_data = None
+
+_TorchInstanceDataset = None
+
+
+def _find_torch_data():
+    global torch_data
+
+    if torch_data is None:
+        try:
+            import torch.utils.data as torch_data
+        except ImportError:
+            torch_data = False
+
+    return torch_data or None
+
+
+def _dataset_class():
+    global _TorchInstanceDataset
+
+    data = _find_torch_data()
+
+    if data is None:
+        return InstanceDataset
+
+    if _TorchInstanceDataset is None:
+        _TorchInstanceDataset = type(
+            "InstanceDataset",
+            (InstanceDataset, data.IterableDataset),
+            {"__module__": __name__},
+        )
+
+    return _TorchInstanceDataset
+
+
+def _restore_dataset(state):
+    dataset = InstanceDataset.__new__(InstanceDataset)
+    dataset.__dict__.update(state)
+    return dataset
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def _check_prefetch(prefetch, max_workers):
+    if not prefetch > 0:
+        raise ValueError("prefetch queue size must be greater than zero")
+
+    if not max_workers > 0:
+        raise ValueError("maximum number of workers must be greater than zero")
+
+
+def _prefetch(tasks, produce, prefetch, max_workers):
+    tasks = iter(tasks)
+    tasks_lock = threading.Lock()
+    # At most prefetch queued items plus one in flight per worker are
+    # held in memory at any time.
+    items = queue.Queue(prefetch)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def work():
+        try:
+            while not stop.is_set():
+                with tasks_lock:
+                    task = next(tasks, _DONE)
+
+                if task is _DONE:
+                    break
+
+                for item in produce(task):
+                    if not put(item):
+                        return
+        except Exception as error:
+            put(_Failure(error))
+        finally:
+            put(_DONE)
+
+    workers = [
+        threading.Thread(target=work, daemon=True) for _ in range(max_workers)
+    ]
+
+    for worker in workers:
+        worker.start()
+
+    try:
+        running = len(workers)
+
+        while running:
+            item = items.get()
+
+            if item is _DONE:
+                running -= 1
+            elif isinstance(item, _Failure):
+                raise item.error
+            else:
+                yield item
+    finally:
+        # Closing the generator early releases the workers at their next
+        # put instead of leaving them blocked on a full queue.
+        stop.set()
+
+
+def _iter_series(client, series_instance_uid, chunk_size):
+    content_iter = client.images(
+        series_instance_uid=series_instance_uid
+    )._get_content_iter(chunk_size)
+
+    for name, data_iter in _zipstream.iter_members(content_iter):
+        if not name.endswith("/"):
+            yield _types.Instance(
+                series_instance_uid=series_instance_uid,
+                filename=name,
+                data=b"".join(data_iter),
+            )
+
+
+def iter_series_instances(
+    client,
+    series_instance_uids,
+    *,
+    prefetch=8,
+    max_workers=1,
+    chunk_size=65536,
+):
+    _check_prefetch(prefetch, max_workers)
+    return _prefetch(
+        series_instance_uids,
+        lambda uid: _iter_series(client, uid, chunk_size),
+        prefetch,
+        max_workers,
+    )
+
+
+def _iter_single_image(client, instance, chunk_size):
+    series_instance_uid, sop_instance_uid = instance
+    data = client.single_image(
+        series_instance_uid=series_instance_uid,
+        sop_instance_uid=sop_instance_uid,
+    ).read(chunk_size)
+    yield _types.Instance(
+        series_instance_uid=series_instance_uid,
+        filename=f"{sop_instance_uid}.dcm",
+        data=data,
+    )
+
+
+def iter_single_images(
+    client, instances, *, prefetch=8, max_workers=4, chunk_size=65536
+):
+    _check_prefetch(prefetch, max_workers)
+    return _prefetch(
+        instances,
+        lambda instance: _iter_single_image(client, instance, chunk_size),
+        prefetch,
+        max_workers,
+    )
+
+
+class InstanceDataset:
+    def __new__(cls, *args, **kwargs):
+        # Becomes a torch IterableDataset when torch is installed, so data
+        # loaders accept it, without importing torch with this module.
+        if cls is InstanceDataset:
+            cls = _dataset_class()
+
+        return super().__new__(cls)
+
+    def __init__(
+        self,
+        client,
+        series_instance_uids,
+        *,
+        transform=None,
+        prefetch=8,
+        max_workers=1,
+        chunk_size=65536,
+    ):
+        _check_prefetch(prefetch, max_workers)
+        self._client = client
+        self._series_instance_uids = list(series_instance_uids)
+        self._transform = transform
+        self._prefetch = prefetch
+        self._max_workers = max_workers
+        self._chunk_size = chunk_size
+
+    def __repr__(self):
+        return (
+            f"{self.__class__.__name__}(<{len(self._series_instance_uids)} "
+            f"series>, prefetch={self._prefetch}, "
+            f"max_workers={self._max_workers})"
+        )
+
+    def __reduce__(self):
+        # Unpickling goes through __new__ again, which a dynamically
+        # built torch subclass could not be looked up by name for. The
+        # client pickles as its configuration, so each data loader
+        # worker opens its own sessions and database handles.
+        return _restore_dataset, (self.__dict__.copy(),)
+
+    def __iter__(self):
+        series_instance_uids = self._series_instance_uids
+
+        data = _find_torch_data()
+
+        if data is not None:
+            worker_info = data.get_worker_info()
+
+            # Shard series across loader workers so none is fetched twice.
+            if worker_info is not None:
+                series_instance_uids = series_instance_uids[
+                    worker_info.id :: worker_info.num_workers
+                ]
+
+        instances = iter_series_instances(
+            self._client,
+            series_instance_uids,
+            prefetch=self._prefetch,
+            max_workers=self._max_workers,
+            chunk_size=self._chunk_size,
+        )
+
+        if self._transform is None:
+            return instances
+
+        return (self._transform(instance) for instance in instances)
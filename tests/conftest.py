@@ -11,4 +11,198 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
 # implied. See the License for the specific language governing
 # permissions and limitations under the License.
-# ----------------------------------------------------------------------
\ No newline at end of file
+# ----------------------------------------------------------------------
+import collections
+import http.server
+import io
+import json
+import socketserver
+import threading
+import time
+import urllib.parse
+import zipfile
+
+import pytest
+
+from tcia import api
+
+Request = collections.namedtuple(
+    "Request", ["endpoint", "path", "params", "headers", "connection"]
+)
+
+
+class Response:
+    def __init__(self, body=b"", *, status=200, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = {} if headers is None else dict(headers)
+
+
+def _encode(body):
+    if isinstance(body, Response):
+        return body
+
+    if isinstance(body, bytes):
+        return Response(body)
+
+    if isinstance(body, str):
+        return Response(body.encode("utf-8"))
+
+    return Response(
+        json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+
+
+class _HTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    # The default backlog of 5 drops connection bursts, which then stall
+    # for a full SYN retransmit.
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def make_zip(members, *, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+
+    with zipfile.ZipFile(buffer, mode="w", compression=compression) as zip_:
+        for name, data in members.items():
+            zip_.writestr(name, data)
+
+    return buffer.getvalue()
+
+
+# A local stand-in for the TCIA API. Routes map an endpoint name (the
+# last path segment, e.g. "getSeries") to a body, a Response, or a
+# callable taking the Request and returning either; latency (seconds per
+# request) and bandwidth (bytes per second) shape every response.
+class StubServer:
+    def __init__(self, *, latency=0.0, bandwidth=None):
+        self.routes = {}
+        self.requests = []
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self._connections = 0
+        self._lock = threading.Lock()
+        self._server = _HTTPServer(("127.0.0.1", 0), self._make_handler())
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, args=(0.05,), daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/services/v3"
+
+    @property
+    def connections(self):
+        return self._connections
+
+    def route(self, endpoint, response):
+        self.routes[endpoint] = response
+
+    def requests_to(self, endpoint):
+        return [
+            request
+            for request in self.requests
+            if request.endpoint == endpoint
+        ]
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _respond(self, request):
+        response = self.routes.get(request.endpoint)
+
+        if response is None:
+            return Response(b"not found", status=404)
+
+        if callable(response):
+            response = response(request)
+
+        return _encode(response)
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; with Nagle on,
+            # each keep-alive response waits out a delayed ACK.
+            disable_nagle_algorithm = True
+
+            def setup(self):
+                super().setup()
+
+                with server._lock:
+                    server._connections += 1
+                    self.connection_number = server._connections
+
+            def log_message(self, format_, *args):
+                pass
+
+            def do_GET(self):
+                url = urllib.parse.urlsplit(self.path)
+                segments = url.path.rstrip("/").split("/")
+                endpoint = segments[-1]
+
+                if endpoint == "metadata":
+                    endpoint = f"{segments[-2]}/metadata"
+
+                request = Request(
+                    endpoint=endpoint,
+                    path=url.path,
+                    params=dict(urllib.parse.parse_qsl(url.query)),
+                    headers=dict(self.headers),
+                    connection=self.connection_number,
+                )
+
+                with server._lock:
+                    server.requests.append(request)
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                response = server._respond(request)
+                self.send_response(response.status)
+
+                for name, value in response.headers.items():
+                    self.send_header(name, value)
+
+                if "Content-Length" not in response.headers:
+                    self.send_header("Content-Length", str(len(response.body)))
+
+                self.end_headers()
+                self._write(response.body)
+
+            def _write(self, body):
+                if server.bandwidth is None:
+                    self.wfile.write(body)
+                    return
+
+                chunk_size = max(1, int(server.bandwidth / 100))
+
+                for start in range(0, len(body), chunk_size):
+                    self.wfile.write(body[start : start + chunk_size])
+                    time.sleep(chunk_size / server.bandwidth)
+
+        return Handler
+
+
+@pytest.fixture
+def server():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def client(server):
+    client = api.Client(
+        "test-key",
+        base_url=server.url,
+        retry=api.RetryPolicy(2, backoff_factor=0),
+    )
+    yield client
+    client.close()
@@ -0,0 +1,166 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import asyncio
+import io
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("aiohttp")
+
+from tcia import aio
+from tcia import api
+from tcia import cache
+from tests.conftest import Response
+
+COLLECTIONS = [{"Collection": "A"}, {"Collection": "B"}]
+
+
+def _run(server, function, **kwargs):
+    async def main():
+        async with aio.AsyncClient(
+            "test-key",
+            base_url=server.url,
+            retry=api.RetryPolicy(2, backoff_factor=0),
+            **kwargs,
+        ) as client:
+            return await function(client)
+
+    # asyncio.run() needs Python 3.7.
+    loop = asyncio.new_event_loop()
+
+    try:
+        return loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+
+class _RecordingCache(cache.ResponseCache):
+    def __init__(self):
+        super().__init__(":memory:")
+        self.threads = []
+
+    def get(self, *args, **kwargs):
+        self.threads.append(threading.get_ident())
+        return super().get(*args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        self.threads.append(threading.get_ident())
+        return super().set(*args, **kwargs)
+
+
+class _RecordingBuffer(io.BytesIO):
+    def __init__(self):
+        super().__init__()
+        self.threads = []
+
+    def write(self, data):
+        self.threads.append(threading.get_ident())
+        return super().write(data)
+
+
+def test_get_returns_records(server):
+    server.route("getCollectionValues", COLLECTIONS)
+    records = _run(server, lambda client: client.collections().get())
+    assert [record.collection for record in records] == ["A", "B"]
+
+
+def test_get_retries_retryable_statuses(server):
+    responses = [Response(status=503), Response(status=503), COLLECTIONS]
+    server.route("getCollectionValues", lambda request: responses.pop(0))
+    records = _run(server, lambda client: client.collections().get())
+    assert len(records) == 2
+    assert len(server.requests) == 3
+
+
+def test_many_queries_run_concurrently_on_one_loop(server):
+    server.route("getPatient", lambda request: [request.params])
+    server.latency = 0.05
+
+    async def query(client):
+        return await asyncio.gather(
+            *(client.patients(collection=str(i)).get() for i in range(100))
+        )
+
+    start = time.perf_counter()
+    results = _run(server, query)
+    assert len(results) == 100
+    # Serially this would take at least 5 s.
+    assert time.perf_counter() - start < 2.5
+
+
+def test_cache_is_used_off_the_event_loop(server):
+    server.route("getCollectionValues", COLLECTIONS)
+    response_cache = _RecordingCache()
+
+    async def query(client):
+        loop_thread = threading.get_ident()
+        await client.collections().get()
+        await client.collections().get()
+        return loop_thread
+
+    loop_thread = _run(server, query, cache=response_cache)
+    assert len(server.requests) == 1
+    assert len(response_cache.threads) == 3
+    assert loop_thread not in response_cache.threads
+
+
+def test_download_writes_off_the_event_loop(server, tmp_path):
+    payload = bytes(range(256)) * 20000
+    server.route("getImage", payload)
+    buffer = _RecordingBuffer()
+
+    async def download(client):
+        loop_thread = threading.get_ident()
+        images = client.images(series_instance_uid="1.2.3")
+        await images.download(buffer)
+        await images.download(str(tmp_path / "series.zip"))
+        return loop_thread
+
+    loop_thread = _run(server, download)
+    assert buffer.getvalue() == payload
+    assert (tmp_path / "series.zip").read_bytes() == payload
+    assert buffer.threads
+    assert loop_thread not in buffer.threads
+
+
+def test_iter_content_defaults_to_large_chunks(server):
+    server.route("getImage", bytes(1024**2))
+
+    async def sizes(client):
+        images = client.images(series_instance_uid="1.2.3")
+        return [len(chunk) async for chunk in images.iter_content()]
+
+    sizes = _run(server, sizes)
+    assert sum(sizes) == 1024**2
+    assert max(sizes) > 1024
+
+
+def test_text_download_streams(server, tmp_path):
+    text = "".join(f"1.2.{i},Ä\n" for i in range(50000))
+    server.route(
+        "getSOPInstanceUIDs",
+        Response(text.encode("utf-8"), headers={"Content-Type": "text/csv"}),
+    )
+    path = tmp_path / "uids.csv"
+
+    async def download(client):
+        await client.sop_instance_uids(series_instance_uid="1").download(
+            str(path), chunk_size=7
+        )
+
+    _run(server, download)
+    assert path.read_text(encoding="utf-8") == text
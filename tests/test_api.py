@@ -11,4 +11,259 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
 # implied. See the License for the specific language governing
 # permissions and limitations under the License.
-# ----------------------------------------------------------------------
\ No newline at end of file
+# ----------------------------------------------------------------------
+import concurrent.futures
+
+import pytest
+
+from tcia import api
+from tests.conftest import Response
+from tests.conftest import make_zip
+
+COLLECTIONS = [{"Collection": "A"}, {"Collection": "B"}]
+
+
+def test_client_requires_api_key(monkeypatch):
+    monkeypatch.delenv("TCIA_API_KEY", raising=False)
+
+    with pytest.raises(TypeError):
+        api.Client()
+
+
+def test_client_reads_api_key_from_environment(monkeypatch):
+    monkeypatch.setenv("TCIA_API_KEY", "from-env")
+    assert api.Client().api_key == "from-env"
+
+
+def test_queries_share_one_connection(server, client):
+    server.route("getCollectionValues", COLLECTIONS)
+    server.route("getModalityValues", [{"Modality": "CT"}])
+
+    for _ in range(20):
+        client.collections().get()
+        client.modalities().get()
+
+    assert len(server.requests) == 40
+    assert server.connections == 1
+    assert {request.connection for request in server.requests} == {1}
+
+
+def test_concurrent_queries_are_bounded_by_pool(server):
+    server.route("getPatient", [])
+    server.latency = 0.02
+
+    with api.Client("test-key", base_url=server.url, pool_maxsize=4) as client:
+        with concurrent.futures.ThreadPoolExecutor(4) as executor:
+            list(
+                executor.map(
+                    lambda i: client.patients(collection=str(i)).get(),
+                    range(40),
+                )
+            )
+
+    assert len(server.requests) == 40
+    assert server.connections <= 4
+
+
+def test_identical_concurrent_queries_share_one_request(server, client):
+    server.route("getCollectionValues", COLLECTIONS)
+    server.route("getPatient", [{"PatientID": "P0"}])
+    server.latency = 0.2
+
+    with concurrent.futures.ThreadPoolExecutor(20) as executor:
+        collections = list(
+            executor.map(lambda _: client.collections().get(), range(10))
+        )
+        patients = list(
+            executor.map(
+                lambda i: client.patients(collection=str(i % 2)).get(),
+                range(10),
+            )
+        )
+
+    assert len(server.requests_to("getCollectionValues")) == 1
+    assert len(server.requests_to("getPatient")) == 2
+    assert all(records == collections[0] for records in collections)
+    # Each caller gets its own list, safe to modify.
+    assert len({id(records) for records in collections}) == 10
+    assert all(len(records) == 1 for records in patients)
+
+
+def test_keep_alive_false_opens_a_connection_per_query(server):
+    server.route("getCollectionValues", COLLECTIONS)
+
+    with api.Client(
+        "test-key", base_url=server.url, keep_alive=False
+    ) as client:
+        for _ in range(5):
+            client.collections().get()
+
+    assert server.connections == 5
+
+
+def test_api_key_header_is_sent(server, client):
+    server.route("getCollectionValues", COLLECTIONS)
+    client.collections().get()
+    (request,) = server.requests
+    assert request.headers["api_key"] == "test-key"
+
+
+def _route_images(server, series):
+    def images(request):
+        uid = request.params["SeriesInstanceUID"]
+
+        if uid not in series:
+            return Response(b"gone", status=404)
+
+        return series[uid]
+
+    server.route("getImage", images)
+
+
+def test_download_series_writes_one_zip_per_series(server, client, tmp_path):
+    series = {
+        f"1.2.{i}": make_zip({f"{i}.dcm": bytes([i]) * 100}) for i in range(5)
+    }
+    _route_images(server, series)
+    report = client.download_series(
+        list(series) + ["1.2.0"], tmp_path, max_workers=3
+    )
+
+    assert [download.series_instance_uid for download in report.downloads] == (
+        list(series)
+    )
+    assert not report.failed
+    assert report.size_in_bytes == sum(len(data) for data in series.values())
+
+    for uid, data in series.items():
+        assert (tmp_path / f"{uid}.zip").read_bytes() == data
+
+    assert len(server.requests_to("getImage")) == 5
+
+
+def test_download_series_isolates_failures(server, client, tmp_path):
+    _route_images(server, {"1.2.1": make_zip({"a.dcm": b"a"})})
+    report = client.download_series(["1.2.1", "missing"], tmp_path)
+
+    assert [download.series_instance_uid for download in report.succeeded] == [
+        "1.2.1"
+    ]
+    (failure,) = report.failed
+    assert failure.series_instance_uid == "missing"
+    assert failure.path is None
+    assert not (tmp_path / "missing.zip").exists()
+
+
+@pytest.mark.parametrize("resume", [False, True])
+def test_failed_series_release_their_rate_limiter_slot(
+    server, tmp_path, resume
+):
+    _route_images(server, {})
+    limiter = api.RateLimiter(
+        100, concurrency=1, min_concurrency=1, max_concurrency=1
+    )
+
+    with api.Client(
+        "test-key", base_url=server.url, rate_limiter=limiter
+    ) as client:
+        # With a single slot, a leaked one would block every later
+        # request; the report keeps the failed response referenced.
+        report = client.download_series(["a"], tmp_path, resume=resume)
+        assert limiter.in_flight == 0
+        report = client.download_series(
+            ["b", "c"], tmp_path, max_workers=1, resume=resume
+        )
+
+    assert len(report.failed) == 2
+    assert limiter.in_flight == 0
+
+
+def test_download_series_calls_back_per_series(server, client, tmp_path):
+    series = {f"1.2.{i}": make_zip({"a.dcm": b"a"}) for i in range(4)}
+    _route_images(server, series)
+    seen = []
+    client.download_series(series, tmp_path, callback=seen.append)
+    assert sorted(download.series_instance_uid for download in seen) == (
+        sorted(series)
+    )
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"max_workers": 0},
+        {"instance_workers": 0},
+        {"strategy": "bogus"},
+        {"resume": True, "extract": True},
+        {"strategy": "instances"},
+    ],
+)
+def test_download_series_rejects_bad_options(client, tmp_path, kwargs):
+    with pytest.raises(ValueError):
+        client.download_series(["1.2.3"], tmp_path, **kwargs)
+
+
+def _route_instances(server, members):
+    server.route("getImage", make_zip(members))
+    server.route(
+        "getSeriesSize",
+        [
+            {
+                "TotalSizeInBytes": sum(map(len, members.values())),
+                "ObjectCount": len(members),
+            }
+        ],
+    )
+    server.route(
+        "getSOPInstanceUIDs",
+        [{"sop_instance_uid": name[: -len(".dcm")]} for name in members],
+    )
+    server.route(
+        "getSingleImage",
+        lambda request: members[f"{request.params['SOPInstanceUID']}.dcm"],
+    )
+
+
+def test_instances_strategy_fetches_each_instance(server, client, tmp_path):
+    members = {f"1.2.3.{i}.dcm": bytes([i]) * 1000 for i in range(10)}
+    _route_instances(server, members)
+    report = client.download_series(
+        ["1.2.3"], tmp_path, extract=True, strategy="instances"
+    )
+
+    assert report.size_in_bytes == 10000
+    assert len(server.requests_to("getSingleImage")) == 10
+    assert server.requests_to("getImage") == []
+
+    for name, data in members.items():
+        assert (tmp_path / "1.2.3" / name).read_bytes() == data
+
+
+@pytest.mark.parametrize(
+    "objects, object_size, fan_out",
+    [
+        (4, 4 * 1024**2, True),
+        (400, 512 * 1024, False),
+        (1, 64 * 1024**2, False),
+        (8, 1024**2, False),
+    ],
+)
+def test_auto_strategy_fans_out_large_objects(
+    server, client, tmp_path, objects, object_size, fan_out
+):
+    # Only the reported size drives the choice; keep the bodies small.
+    members = {f"1.2.3.{i}.dcm": b"x" for i in range(objects)}
+    _route_instances(server, members)
+    server.route(
+        "getSeriesSize",
+        [
+            {
+                "TotalSizeInBytes": objects * object_size,
+                "ObjectCount": str(objects),
+            }
+        ],
+    )
+    client.download_series(["1.2.3"], tmp_path, extract=True, strategy="auto")
+
+    assert bool(server.requests_to("getSingleImage")) is fan_out
+    assert bool(server.requests_to("getImage")) is not fan_out
@@ -0,0 +1,176 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import sqlite3
+import time
+
+import pytest
+
+from tcia import api
+from tcia import cache
+
+COLLECTIONS = [{"Collection": "A"}, {"Collection": "B"}]
+
+
+@pytest.fixture
+def response_cache():
+    with cache.ResponseCache(":memory:") as response_cache:
+        yield response_cache
+
+
+def _client(server, response_cache, api_key="test-key"):
+    return api.Client(api_key, base_url=server.url, cache=response_cache)
+
+
+def test_cached_query_is_served_without_a_request(server, response_cache):
+    server.route("getCollectionValues", COLLECTIONS)
+
+    with _client(server, response_cache) as client:
+        first = client.collections().get()
+        second = client.collections().get()
+
+    assert first == second
+    assert len(server.requests) == 1
+    assert response_cache.stats.hits == 1
+    assert response_cache.stats.misses == 1
+
+
+def test_cache_is_keyed_by_params(server, response_cache):
+    server.route("getPatient", lambda request: [request.params])
+
+    with _client(server, response_cache) as client:
+        client.patients(collection="A").get()
+        client.patients(collection="B").get()
+        client.patients(collection="A").get()
+
+    assert len(server.requests) == 2
+
+
+def test_cache_is_keyed_by_api_key(server, response_cache):
+    server.route(
+        "getCollectionValues",
+        lambda request: [{"Collection": request.headers["api_key"]}],
+    )
+
+    with _client(server, response_cache, "key-1") as client:
+        (first,) = client.collections().get()
+
+    with _client(server, response_cache, "key-2") as client:
+        (second,) = client.collections().get()
+
+    assert first.collection == "key-1"
+    assert second.collection == "key-2"
+    assert len(server.requests) == 2
+
+
+def test_cache_does_not_store_api_key(tmp_path):
+    path = tmp_path / "cache.sqlite"
+
+    with cache.ResponseCache(path) as response_cache:
+        response_cache.set("u/query/e", {}, "[]", api_key="secret-key")
+        assert response_cache.get("u/query/e", api_key="secret-key") == "[]"
+        assert response_cache.get("u/query/e", api_key="other") is None
+        assert response_cache.get("u/query/e") is None
+
+    connection = sqlite3.connect(path)
+    (key,) = connection.execute("SELECT key FROM responses").fetchone()
+    connection.close()
+    assert "secret-key" not in key
+
+
+def test_entries_expire(monkeypatch, response_cache):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    response_cache.set("u/query/e", {}, "[]")
+    assert response_cache.get("u/query/e") == "[]"
+    now[0] += response_cache.ttl + 1
+    assert response_cache.get("u/query/e") is None
+
+
+def test_per_endpoint_ttls():
+    response_cache = cache.ResponseCache(":memory:", ttl=10, ttls={"e": 99})
+    assert response_cache.ttl_for("u/query/e") == 99
+    assert response_cache.ttl_for("u/query/other") == 10
+
+
+def test_least_recently_used_entries_are_evicted(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    response_cache = cache.ResponseCache(":memory:", max_size_in_bytes=10)
+
+    for name in ["a", "b", "c"]:
+        now[0] += 1
+        response_cache.set(f"u/query/{name}", {}, "xxxx")
+
+    assert response_cache.get("u/query/a") is None
+    assert response_cache.get("u/query/c") == "xxxx"
+    assert response_cache.stats.size_in_bytes <= 10
+
+
+def test_set_keeps_a_running_size_without_scanning(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    response_cache = cache.ResponseCache(":memory:", max_size_in_bytes=10)
+    statements = []
+    response_cache._connection.set_trace_callback(statements.append)
+
+    for name, text in [("a", "xxxx"), ("a", "xx"), ("b", "xxx")]:
+        now[0] += 1
+        response_cache.set(f"u/query/{name}", {}, text)
+
+    assert response_cache._size_in_bytes == 5
+    assert not any("SUM(" in statement for statement in statements)
+
+    now[0] += 1
+    response_cache.set("u/query/c", {}, "xxxxxx")
+    assert response_cache.get("u/query/a") is None
+    assert response_cache._size_in_bytes == 9
+    assert response_cache.stats.size_in_bytes == 9
+
+
+def test_size_counts_entries_already_in_the_file(tmp_path):
+    path = tmp_path / "cache.sqlite"
+
+    with cache.ResponseCache(path) as response_cache:
+        response_cache.set("u/query/a", {}, "xxxx")
+
+    with cache.ResponseCache(path, max_size_in_bytes=6) as response_cache:
+        assert response_cache._size_in_bytes == 4
+        response_cache.set("u/query/b", {}, "xxxx")
+        assert response_cache.get("u/query/a") is None
+        assert response_cache.stats.size_in_bytes == 4
+
+
+def test_oversized_entries_are_not_stored():
+    response_cache = cache.ResponseCache(":memory:", max_size_in_bytes=4)
+    response_cache.set("u/query/e", {}, "too large")
+    assert response_cache.stats.entries == 0
+
+
+def test_invalidate_by_endpoint(response_cache):
+    response_cache.set("u/query/a", {}, "1")
+    response_cache.set("u/query/b", {}, "2")
+    response_cache.invalidate("a")
+    assert response_cache.get("u/query/a") is None
+    assert response_cache.get("u/query/b") == "2"
+    assert response_cache._size_in_bytes == 1
+    response_cache.invalidate()
+    assert response_cache.stats.entries == 0
+    assert response_cache._size_in_bytes == 0
+
+
+@pytest.mark.parametrize("kwargs", [{"ttl": 0}, {"max_size_in_bytes": 0}])
+def test_rejects_invalid_limits(kwargs):
+    with pytest.raises(ValueError):
+        cache.ResponseCache(":memory:", **kwargs)
@@ -0,0 +1,326 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import datetime
+
+import pytest
+
+from tcia import api
+from tcia import catalog
+
+
+def _series(uid, study, patient, modality, body_part, manufacturer, images):
+    return {
+        "SeriesInstanceUID": uid,
+        "StudyInstanceUID": study,
+        "Modality": modality,
+        "BodyPartExamined": body_part,
+        "Collection": "C",
+        "PatientID": patient,
+        "Manufacturer": manufacturer,
+        "ImageCount": images,
+    }
+
+
+class Archive:
+    def __init__(self, server):
+        self.patients = [
+            {"PatientID": "P0", "PatientSex": "F", "Collection": "C"},
+            {"PatientID": "P1", "PatientSex": "M", "Collection": "C"},
+        ]
+        self.studies = [
+            {"StudyInstanceUID": "S0", "PatientID": "P0", "Collection": "C"},
+            {"StudyInstanceUID": "S1", "PatientID": "P1", "Collection": "C"},
+        ]
+        self.series = [
+            _series("1.0", "S0", "P0", "CT", "CHEST", "GE", 100),
+            _series("1.1", "S0", "P0", "MR", "CHEST", "GE", 20),
+            _series("1.2", "S1", "P1", "CT", "CHEST", "SIEMENS", 50),
+            _series("1.3", "S1", "P1", "CT", "HEAD", "GE", 7),
+        ]
+        # The API returns these with mixed JSON types.
+        for series, number, flag in zip(
+            self.series, [3, "3", 1.5, None], [True, False, "NO", None]
+        ):
+            series["SeriesNumber"] = number
+            series["AnnotationsFlag"] = flag
+
+        self.new_patients = []
+        self.new_studies = []
+        server.route("getPatient", self._filter(lambda: self.patients))
+        server.route("getPatientStudy", self._filter(lambda: self.studies))
+        server.route("getSeries", self._filter(lambda: self.series))
+        server.route(
+            "NewPatientsInCollection", self._filter(lambda: self.new_patients)
+        )
+        server.route(
+            "NewStudiesInPatientCollection",
+            self._filter(lambda: self.new_studies),
+        )
+        server.route(
+            "getSeriesSize",
+            lambda request: [{"TotalSizeInBytes": 1000, "ObjectCount": 10}],
+        )
+        server.route(
+            "getSOPInstanceUIDs",
+            lambda request: [
+                {
+                    "sop_instance_uid": f"{request.params['SeriesInstanceUID']}.1"
+                }
+            ],
+        )
+
+    @staticmethod
+    def _filter(records):
+        def respond(request):
+            params = {
+                name: value
+                for name, value in request.params.items()
+                if name not in ("format", "Date")
+            }
+            return [
+                record
+                for record in records()
+                if all(
+                    record.get(name) == value for name, value in params.items()
+                )
+            ]
+
+        return respond
+
+
+@pytest.fixture
+def archive(server):
+    return Archive(server)
+
+
+@pytest.fixture
+def local():
+    with catalog.Catalog(":memory:") as local:
+        yield local
+
+
+def test_sync_collection_materializes_the_hierarchy(archive, client, local):
+    local.sync_collection(client, "C")
+
+    assert local.is_synced("C")
+    assert not local.is_synced("D")
+    assert [record.collection for record in local.collections()] == ["C"]
+    assert [record.patient_id for record in local.patients()] == ["P0", "P1"]
+    assert [
+        record.study_instance_uid
+        for record in local.patient_studies(patient_id="P1")
+    ] == ["S1"]
+    assert [
+        record.series_instance_uid
+        for record in local.series(
+            modality="CT", body_part_examined="CHEST", manufacturer="GE"
+        )
+    ] == ["1.0"]
+    assert [
+        record.series_instance_uid
+        for record in local.series(modality=["CT", "MR"], patient_id="P1")
+    ] == ["1.2", "1.3"]
+    assert local.image_counts_by_patient(collection="C") == {
+        ("C", "P0"): 120,
+        ("C", "P1"): 57,
+    }
+    assert local.image_counts_by_patient(modality="CT") == {
+        ("C", "P0"): 100,
+        ("C", "P1"): 57,
+    }
+
+
+def test_sync_collection_replaces_previous_contents(archive, client, local):
+    local.sync_collection(client, "C")
+    del archive.series[1:]
+    local.sync_collection(client, "C")
+    assert [record.series_instance_uid for record in local.series()] == ["1.0"]
+
+
+def test_sync_collection_fetches_series_details(
+    archive, server, client, local
+):
+    local.sync_collection(
+        client, "C", series_sizes=True, sop_instance_uids=True
+    )
+
+    assert local.series_size("1.2") == (1000, 10)
+    assert local.series_size("9.9") is None
+    assert [
+        record.sop_instance_uid for record in local.sop_instance_uids("1.3")
+    ] == ["1.3.1"]
+    assert local.sop_instance_uids("9.9") is None
+    assert len(server.requests_to("getSeriesSize")) == 4
+
+
+def test_catalog_persists_to_disk(archive, client, tmp_path):
+    path = tmp_path / "catalog.sqlite"
+
+    with catalog.Catalog(path) as local:
+        local.sync_collection(client, "C")
+
+    with catalog.Catalog(path) as local:
+        assert local.is_synced("C")
+        assert len(local.series(collection="C")) == 4
+
+
+def test_client_reads_through_a_synced_catalog(archive, server, local):
+    with api.Client("test-key", base_url=server.url, catalog=local) as client:
+        local.sync_collection(client, "C")
+        del server.requests[:]
+
+        series = client.series(collection="C", modality="CT").get()
+        studies = client.patient_studies(study_instance_uid="S0").get()
+        patients = client.patients(collection="C").get()
+
+        assert [record.series_instance_uid for record in series] == [
+            "1.0",
+            "1.2",
+            "1.3",
+        ]
+        assert [record.patient_id for record in studies] == ["P0"]
+        assert len(patients) == 2
+        assert server.requests == []
+
+        # Unsynced collections fall through to the archive.
+        assert client.series(collection="D").get() == []
+        assert len(server.requests_to("getSeries")) == 1
+
+
+def test_catalog_records_equal_rest_records(archive, server, tmp_path):
+    with api.Client("test-key", base_url=server.url) as client:
+        rest = client.series(collection="C").get()
+
+        with catalog.Catalog(tmp_path / "catalog.sqlite") as local:
+            local.sync_collection(client, "C")
+
+    with catalog.Catalog(tmp_path / "catalog.sqlite") as local:
+        with api.Client(
+            "test-key", base_url=server.url, catalog=local
+        ) as client:
+            del server.requests[:]
+            cached = client.series(collection="C").get()
+            assert server.requests == []
+
+    # repr() tells True from 1 and "3" from 3, which == does not.
+    assert repr(cached) == repr(rest)
+    assert [
+        (record.series_number, record.annotations_flag) for record in cached
+    ] == [(3, True), ("3", False), (1.5, "NO"), (None, None)]
+
+
+def test_client_stores_series_sizes_in_the_catalog(archive, server, local):
+    with api.Client("test-key", base_url=server.url, catalog=local) as client:
+        client.series_size(series_instance_uid="1.0").get()
+        assert local.series_size("1.0") == (1000, 10)
+        client.series_size(series_instance_uid="1.0").get()
+
+    assert len(server.requests_to("getSeriesSize")) == 1
+
+
+def test_sync_rejects_zero_workers(client, local):
+    with pytest.raises(ValueError):
+        local.sync_collection(client, "C", max_workers=0)
+
+
+def test_first_incremental_sync_is_a_full_sync(archive, client, local):
+    delta = local.sync_incremental(client, "C")
+
+    assert delta.since is None
+    assert len(delta.series) == 4
+    assert local.high_water("C") == datetime.date.today().isoformat()
+
+
+def test_incremental_sync_pulls_only_new_patients_and_studies(
+    archive, server, client, local
+):
+    local.sync_collection(client, "C")
+    archive.patients.append(
+        {"PatientID": "P2", "PatientSex": "F", "Collection": "C"}
+    )
+    archive.studies += [
+        {"StudyInstanceUID": "S2", "PatientID": "P2", "Collection": "C"},
+        {"StudyInstanceUID": "S3", "PatientID": "P0", "Collection": "C"},
+    ]
+    archive.series += [
+        _series("1.4", "S2", "P2", "PT", "CHEST", "GE", 30),
+        _series("1.5", "S3", "P0", "CT", "HEAD", "GE", 5),
+    ]
+    archive.new_patients = [{"PatientID": "P2", "Collection": "C"}]
+    archive.new_studies = [
+        {"StudyInstanceUID": "S2", "PatientID": "P2", "Collection": "C"},
+        {"StudyInstanceUID": "S3", "PatientID": "P0", "Collection": "C"},
+    ]
+    del server.requests[:]
+
+    delta = local.sync_incremental(client, "C", since="2020-01-01")
+
+    assert delta.since == "2020-01-01"
+    assert [record.patient_id for record in delta.patients] == ["P2", "P0"]
+    assert sorted(
+        record.study_instance_uid for record in delta.patient_studies
+    ) == [
+        "S2",
+        "S3",
+    ]
+    assert sorted(record.series_instance_uid for record in delta.series) == [
+        "1.4",
+        "1.5",
+    ]
+    assert {
+        request.params["Date"]
+        for request in server.requests_to("NewPatientsInCollection")
+        + server.requests_to("NewStudiesInPatientCollection")
+    } == {"2020-01-01"}
+    assert server.requests_to("getPatient") == []
+    assert {
+        request.params["StudyInstanceUID"]
+        for request in server.requests_to("getSeries")
+    } == {"S2", "S3"}
+    assert len(local.series(collection="C")) == 6
+    assert local.image_counts_by_patient()[("C", "P0")] == 125
+    # Known patients keep the details from the full sync.
+    assert local.patients(patient_id="P0")[0].patient_sex == "F"
+
+
+def test_incremental_sync_starts_from_the_high_water_date(
+    archive, server, client, local
+):
+    local.sync_collection(client, "C")
+    del server.requests[:]
+    local.sync_incremental(client, "C")
+
+    (request,) = server.requests_to("NewPatientsInCollection")
+    assert request.params["Date"] == local.high_water("C")
+    assert server.requests_to("getSeries") == []
+
+
+def test_incremental_sync_refreshes_touched_studies(archive, client, local):
+    local.sync_collection(client, "C")
+    archive.series = [
+        record
+        for record in archive.series
+        if record["SeriesInstanceUID"] != "1.3"
+    ]
+    archive.new_studies = [
+        {"StudyInstanceUID": "S1", "PatientID": "P1", "Collection": "C"}
+    ]
+
+    local.sync_incremental(client, "C", since=datetime.date(2020, 1, 1))
+
+    assert [
+        record.series_instance_uid
+        for record in local.series(study_instance_uid="S1")
+    ] == ["1.2"]
@@ -11,4 +11,173 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
 # implied. See the License for the specific language governing
 # permissions and limitations under the License.
-# ----------------------------------------------------------------------
\ No newline at end of file
+# ----------------------------------------------------------------------
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from tcia import _cli
+from tests.conftest import Response
+from tests.conftest import make_zip
+
+
+@pytest.fixture
+def run(server, monkeypatch):
+    monkeypatch.delenv("TCIA_API_KEY", raising=False)
+
+    def run(*args, input_=None):
+        return CliRunner().invoke(
+            _cli.main,
+            ["--api-key", "test-key", "--base-url", server.url, *args],
+            input=input_,
+        )
+
+    return run
+
+
+def test_help_needs_no_api_key(monkeypatch):
+    monkeypatch.delenv("TCIA_API_KEY", raising=False)
+    result = CliRunner().invoke(_cli.main, ["series", "--help"])
+
+    assert result.exit_code == 0
+    assert "--modality" in result.output
+
+
+def test_query_without_api_key_is_a_usage_error(monkeypatch):
+    monkeypatch.delenv("TCIA_API_KEY", raising=False)
+    result = CliRunner().invoke(_cli.main, ["collections"])
+
+    assert result.exit_code == 2
+    assert "API key" in result.output
+
+
+def test_query_streams_the_requested_format(server, run):
+    server.route("getSeries", "SeriesInstanceUID\n1.2.3\n")
+    result = run("series", "--collection", "C", "--modality", "CT")
+
+    assert result.exit_code == 0, result.output
+    assert result.output == "SeriesInstanceUID\n1.2.3\n"
+    (request,) = server.requests
+    assert request.params == {
+        "Collection": "C",
+        "Modality": "CT",
+        "format": "csv",
+    }
+    assert request.headers["api_key"] == "test-key"
+
+
+def test_query_writes_json_lines(server, run):
+    server.route("getPatient", [{"PatientID": "P0"}, {"PatientID": "P1"}])
+    result = run("patients", "--format", "jsonl")
+
+    assert result.exit_code == 0, result.output
+    assert [
+        json.loads(line)["patient_id"] for line in result.output.splitlines()
+    ] == ["P0", "P1"]
+
+
+def test_required_query_options_are_enforced(run):
+    result = run("series-size")
+
+    assert result.exit_code == 2
+    assert "--series-instance-uid" in result.output
+
+
+def test_single_image_writes_bytes(server, run, tmp_path):
+    server.route("getSingleImage", b"DICM")
+    result = run(
+        "single-image",
+        "--series-instance-uid",
+        "1.2",
+        "--sop-instance-uid",
+        "1.2.1",
+        "-o",
+        str(tmp_path / "1.dcm"),
+    )
+
+    assert result.exit_code == 0, result.output
+    assert (tmp_path / "1.dcm").read_bytes() == b"DICM"
+
+
+def _route_images(server, uids):
+    server.route(
+        "getImage",
+        lambda request: (
+            make_zip({"a.dcm": b"a"})
+            if request.params["SeriesInstanceUID"] in uids
+            else Response(status=404)
+        ),
+    )
+
+
+def test_download_series_reads_uids_from_arguments_and_input(
+    server, run, tmp_path
+):
+    _route_images(server, {"1.1", "1.2", "1.3"})
+    result = run(
+        "download-series",
+        "1.1",
+        "1.2",
+        "-i",
+        "-",
+        "-d",
+        str(tmp_path),
+        "--extract",
+        input_="1.3\n\n1.1\n",
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "3 of 3 series" in result.output
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "1.1",
+        "1.2",
+        "1.3",
+    ]
+
+
+def test_download_series_fails_on_failed_series(server, run, tmp_path):
+    _route_images(server, {"1.1"})
+    result = run("download-series", "1.1", "9.9", "-d", str(tmp_path))
+
+    assert result.exit_code == 1
+    assert "failed: 9.9" in result.output
+    assert (tmp_path / "1.1.zip").exists()
+
+
+@pytest.mark.parametrize(
+    "args, message",
+    [
+        (["--resume", "--extract"], "--resume and --extract"),
+        (["--strategy", "instances"], "requires --extract"),
+    ],
+)
+@pytest.mark.parametrize("command", ["download-series", "download-collection"])
+def test_download_rejects_conflicting_options(
+    server, run, tmp_path, command, args, message
+):
+    result = run(command, "1.1", "-d", str(tmp_path), *args)
+
+    assert result.exit_code == 2
+    assert message in result.output
+    assert server.requests == []
+
+
+def test_download_collection_filters_series(server, run, tmp_path):
+    server.route(
+        "getSeries",
+        [{"SeriesInstanceUID": "1.1"}, {"SeriesInstanceUID": "1.2"}],
+    )
+    _route_images(server, {"1.1", "1.2"})
+    result = run(
+        "download-collection", "C", "--modality", "MR", "-d", str(tmp_path)
+    )
+
+    assert result.exit_code == 0, result.output
+    (request,) = server.requests_to("getSeries")
+    assert request.params["Collection"] == "C"
+    assert request.params["Modality"] == "MR"
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "1.1.zip",
+        "1.2.zip",
+    ]
@@ -0,0 +1,118 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import collections
+import sys
+
+import pytest
+
+from tcia import columnar
+
+numpy = pytest.importorskip("numpy")
+
+Record = collections.namedtuple("Record", ["uid", "count", "modality"])
+
+RECORDS = [
+    Record("1.2.1", 3, "CT"),
+    Record("1.2.2", 1, "MR"),
+    Record(None, 4, "CT"),
+    Record("é😀", 1, None),
+    Record("", 5, "CT"),
+]
+
+
+def _table(records=RECORDS):
+    return columnar.Table.from_records(
+        records, Record, categorical=["modality"]
+    )
+
+
+def test_string_columns_are_stored_as_offsets_and_bytes():
+    column = _table()["uid"]
+    assert isinstance(column, columnar.Strings)
+    assert column.data.dtype == numpy.uint8
+    assert column.data.tobytes() == "1.2.11.2.2é😀".encode("utf-8")
+    assert column.offsets.tolist() == [0, 5, 10, 10, 16, 16]
+    assert column.valid.tolist() == [True, True, False, True, True]
+
+
+def test_table_round_trips_records():
+    assert list(_table()) == RECORDS
+    assert list(_table([])) == []
+
+
+def test_strings_index_like_a_sequence():
+    column = _table()["uid"]
+    assert column[0] == "1.2.1"
+    assert column[-2] == "é😀"
+    assert column[2] is None
+    assert column[numpy.int64(4)] == ""
+    assert column[1:4].tolist() == ["1.2.2", None, "é😀"]
+    assert column[[3, 0, 3]].tolist() == ["é😀", "1.2.1", "é😀"]
+    assert column[[]].tolist() == []
+
+    with pytest.raises(IndexError):
+        column[5]
+
+
+def test_filter_where_and_take():
+    table = _table()
+    assert list(table.where(modality="CT", count=[3, 5])) == [
+        RECORDS[0],
+        RECORDS[4],
+    ]
+    assert list(table.where(uid=[None, "é😀"])) == [RECORDS[2], RECORDS[3]]
+    assert list(table.take([4, 1])) == [RECORDS[4], RECORDS[1]]
+    assert list(table.filter(numpy.zeros(len(table), dtype=bool))) == []
+
+
+def test_group_by_and_value_counts_on_strings():
+    table = _table(RECORDS + [Record("1.2.1", 9, "MR")])
+    groups = table.group_by("uid")
+    assert list(groups) == ["1.2.1", "1.2.2", None, "é😀", ""]
+    assert list(groups["1.2.1"]["count"]) == [3, 9]
+    assert table.value_counts("uid")["1.2.1"] == 2
+
+
+def test_strings_use_less_memory_than_objects():
+    records = [Record(f"1.3.6.1.4.1.{i}", i, "CT") for i in range(10000)]
+    table = _table(records)
+    objects = sum(sys.getsizeof(record.uid) for record in records)
+    assert table["uid"].nbytes < objects / 2
+
+
+def test_to_arrow_wraps_string_buffers_without_copying():
+    pyarrow = pytest.importorskip("pyarrow")
+    table = _table()
+    column = table["uid"]
+    arrow = table.to_arrow()
+    uid = arrow.column("uid").chunk(0)
+    _, offsets, data = uid.buffers()
+    assert offsets.address == column.offsets.ctypes.data
+    assert data.address == column.data.ctypes.data
+    assert uid.type == pyarrow.string()
+    assert uid.to_pylist() == column.tolist()
+    assert arrow.column("modality").to_pylist() == [
+        record.modality for record in RECORDS
+    ]
+    assert arrow.column("count").to_pylist() == [
+        record.count for record in RECORDS
+    ]
+
+
+def test_to_pandas():
+    pytest.importorskip("pandas")
+    frame = _table().to_pandas()
+    assert frame["uid"].tolist()[:2] == ["1.2.1", "1.2.2"]
+    assert frame["modality"].cat.categories.tolist() == ["CT", "MR"]
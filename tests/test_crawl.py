@@ -0,0 +1,141 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import json
+
+import pytest
+
+from tcia import crawl
+from tests.conftest import Response
+
+# collection -> patient -> study -> series
+TREE = {
+    "A": {"P0": {"1.1": ["1.1.1", "1.1.2"], "1.2": ["1.2.1"]}},
+    "B": {"P0": {"2.1": ["2.1.1"]}, "P1": {"2.2": []}},
+}
+
+
+@pytest.fixture
+def archive(server):
+    def patients(request):
+        return [
+            {
+                "PatientID": patient_id,
+                "Collection": request.params["Collection"],
+            }
+            for patient_id in TREE[request.params["Collection"]]
+        ]
+
+    def studies(request):
+        patient = TREE[request.params["Collection"]][
+            request.params["PatientID"]
+        ]
+        return [{"StudyInstanceUID": uid} for uid in patient]
+
+    def series(request):
+        study_instance_uid = request.params["StudyInstanceUID"]
+
+        for patients_ in TREE.values():
+            for studies_ in patients_.values():
+                if study_instance_uid in studies_:
+                    return [
+                        {
+                            "SeriesInstanceUID": uid,
+                            "StudyInstanceUID": study_instance_uid,
+                        }
+                        for uid in studies_[study_instance_uid]
+                    ]
+
+        return Response(status=404)
+
+    server.route("getPatient", patients)
+    server.route("getPatientStudy", studies)
+    server.route("getSeries", series)
+    return server
+
+
+def _uids(series):
+    return sorted(record.series_instance_uid for record in series)
+
+
+def test_crawl_yields_every_series(archive, client):
+    series = crawl.crawl_series(client, ["A", "B", "A"])
+    assert _uids(series) == ["1.1.1", "1.1.2", "1.2.1", "2.1.1"]
+    # Patient IDs repeat across collections but are crawled per collection.
+    assert len(archive.requests_to("getPatientStudy")) == 3
+    assert len(archive.requests_to("getPatient")) == 2
+
+
+def test_crawl_of_no_collections_is_empty(archive, client):
+    assert list(crawl.crawl_series(client, [])) == []
+    assert archive.requests == []
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"patient_workers": 0},
+        {"study_workers": 0},
+        {"series_workers": 0},
+        {"prefetch": 0},
+    ],
+)
+def test_crawl_rejects_bad_limits(client, kwargs):
+    with pytest.raises(ValueError):
+        crawl.crawl_series(client, ["A"], **kwargs)
+
+
+def test_crawl_raises_the_first_failure(archive, client):
+    archive.route("getPatientStudy", [{"StudyInstanceUID": "9.9"}])
+
+    with pytest.raises(Exception) as excinfo:
+        list(crawl.crawl_series(client, ["A"]))
+
+    assert excinfo.value.response.status_code == 404
+
+
+def test_crawl_resumes_from_a_checkpoint(archive, client, tmp_path):
+    checkpoint = tmp_path / "crawl.jsonl"
+    first = _uids(
+        crawl.crawl_series(client, ["A", "B"], checkpoint=checkpoint)
+    )
+    count = len(archive.requests)
+    second = _uids(
+        crawl.crawl_series(client, ["A", "B"], checkpoint=checkpoint)
+    )
+
+    assert second == first
+    assert len(archive.requests) == count
+
+
+def test_crawl_cuts_a_torn_checkpoint_line(archive, client, tmp_path):
+    checkpoint = tmp_path / "crawl.jsonl"
+    list(crawl.crawl_series(client, ["A", "B"], checkpoint=checkpoint))
+    lines = checkpoint.read_text(encoding="utf-8").splitlines(keepends=True)
+    # Lose the last branch and leave a torn line, as a kill mid-write
+    # would.
+    checkpoint.write_text(
+        "".join(lines[:-1]) + lines[-1][:10], encoding="utf-8"
+    )
+    count = len(archive.requests)
+    series = crawl.crawl_series(client, ["A", "B"], checkpoint=checkpoint)
+
+    assert _uids(series) == ["1.1.1", "1.1.2", "1.2.1", "2.1.1"]
+    assert len(archive.requests) == count + 1
+    entries = [
+        json.loads(line)
+        for line in checkpoint.read_text(encoding="utf-8").splitlines()
+    ]
+    assert len(entries) == len(lines)
+    assert json.loads(lines[-1]) in entries
@@ -0,0 +1,62 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import os
+import re
+import subprocess
+import sys
+
+# Cumulative import time allowed for "import tcia", in microseconds.
+# It takes about 65 ms; http.client alone would add some 40 ms more.
+_IMPORT_BUDGET = 100000
+
+_HEAVY_MODULES = [
+    "http.client",
+    "numpy",
+    "pkg_resources",
+    "requests",
+    "urllib3",
+]
+
+
+def _import_tcia():
+    script = (
+        "import sys, tcia; "
+        f"print(*[name for name in {_HEAVY_MODULES!r} "
+        "if name in sys.modules])"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+        env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+    )
+    (cumulative,) = re.findall(
+        r"^import time:\s+\d+ \|\s+(\d+) \| tcia$",
+        result.stderr,
+        flags=re.MULTILINE,
+    )
+    return result.stdout.split(), int(cumulative)
+
+
+def test_import_does_not_load_heavy_dependencies():
+    loaded, _ = _import_tcia()
+    assert loaded == []
+
+
+def test_import_stays_within_budget():
+    # The best of a few runs, so a busy machine does not fail the test.
+    assert min(_import_tcia()[1] for _ in range(3)) < _IMPORT_BUDGET
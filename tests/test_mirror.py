@@ -0,0 +1,256 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import json
+import os
+import subprocess
+import sys
+import random
+import textwrap
+
+import pytest
+
+from tcia import mirror
+from tests.conftest import Response
+from tests.conftest import make_zip
+
+SIZES = {f"1.2.{i}": (i % 7 + 1) * 1000 for i in range(40)}
+
+
+@pytest.fixture
+def archive(server):
+    server.route(
+        "getSeries",
+        lambda request: [
+            {
+                "SeriesInstanceUID": uid,
+                "Collection": request.params["Collection"],
+                "Modality": "CT",
+            }
+            for uid in SIZES
+            if request.params["Collection"] == "C"
+        ],
+    )
+    server.route(
+        "getSeriesSize",
+        lambda request: [
+            {
+                "TotalSizeInBytes": SIZES[request.params["SeriesInstanceUID"]],
+                "ObjectCount": 1,
+            }
+        ],
+    )
+    server.route(
+        "getImage",
+        lambda request: make_zip(
+            {"a.dcm": request.params["SeriesInstanceUID"].encode("ascii")}
+        ),
+    )
+
+
+def _shard_sizes(manifest):
+    sizes = [0] * manifest["shards"]
+
+    for entry in manifest["series"]:
+        sizes[entry["shard"]] += entry["size_in_bytes"]
+
+    return sizes
+
+
+def test_manifest_shards_are_deterministic_and_balanced(archive, client):
+    manifest = mirror.build_manifest(client, ["C"], shards=3)
+    again = mirror.build_manifest(client, ["C"], shards=3)
+
+    assert [entry["series_instance_uid"] for entry in manifest["series"]] == (
+        sorted(SIZES)
+    )
+    assert manifest["series"] == again["series"]
+    assert all(size > 0 for size in _shard_sizes(manifest))
+    assert manifest["created"].endswith("+00:00")
+
+
+def test_manifest_keeps_series_that_could_not_be_sized(
+    archive, server, client
+):
+    server.route("getSeriesSize", Response(status=404))
+    manifest = mirror.build_manifest(client, ["C"], shards=2)
+
+    assert len(manifest["series"]) == len(SIZES)
+    assert {entry["size_in_bytes"] for entry in manifest["series"]} == {None}
+
+
+def test_new_series_do_not_move_existing_ones(archive, client, monkeypatch):
+    before = mirror.build_manifest(client, ["C"], shards=3)
+    monkeypatch.setitem(SIZES, "9.9", 10**6)
+    after = mirror.build_manifest(client, ["C"], shards=3)
+
+    shards = {
+        entry["series_instance_uid"]: entry["shard"]
+        for entry in after["series"]
+    }
+    assert len(shards) == len(before["series"]) + 1
+    assert all(
+        shards[entry["series_instance_uid"]] == entry["shard"]
+        for entry in before["series"]
+    )
+
+
+def test_shard_assignment_is_stable_and_balanced():
+    rng = random.Random(1)
+    sizes = {f"1.2.{i}": rng.randint(1, 100) for i in range(2000)}
+    four = {uid: mirror._assign_shard(uid, 4) for uid in sizes}
+    five = {uid: mirror._assign_shard(uid, 5) for uid in sizes}
+
+    # A new shard only takes series; the others stay put.
+    moved = [uid for uid in sizes if four[uid] != five[uid]]
+    assert {five[uid] for uid in moved} == {4}
+    assert 0.15 < len(moved) / len(sizes) < 0.25
+
+    totals = [0] * 4
+
+    for uid, size in sizes.items():
+        totals[four[uid]] += size
+
+    mean = sum(totals) / 4
+    assert all(abs(total - mean) < 0.1 * mean for total in totals)
+    assert mirror._assign_shard("1.2.3", 1) == 0
+
+
+def test_manifest_round_trips(tmp_path):
+    manifest = {"version": 1, "shards": 1, "series": []}
+    mirror.write_manifest(manifest, tmp_path / "manifest.json")
+    assert mirror.read_manifest(tmp_path / "manifest.json") == manifest
+
+    (tmp_path / "old.json").write_text(json.dumps({"version": 0}))
+
+    with pytest.raises(ValueError):
+        mirror.read_manifest(tmp_path / "old.json")
+
+
+def test_shards_mirror_in_separate_processes(
+    archive, server, client, tmp_path
+):
+    manifest = mirror.build_manifest(client, ["C"], shards=2)
+    mirror.write_manifest(manifest, tmp_path / "manifest.json")
+    script = textwrap.dedent("""
+        import sys
+
+        from tcia import api
+        from tcia import mirror
+
+        url, manifest, shard, dest_dir = sys.argv[1:]
+        manifest = mirror.read_manifest(manifest)
+
+        with api.Client("key", base_url=url) as client:
+            report = mirror.run_shard(
+                client, manifest, int(shard), dest_dir, node=f"node-{shard}"
+            )
+
+        assert not report.failed
+        """)
+    environment = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    processes = [
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                script,
+                server.url,
+                str(tmp_path / "manifest.json"),
+                str(shard),
+                str(tmp_path / "mirror"),
+            ],
+            env=environment,
+        )
+        for shard in range(2)
+    ]
+
+    assert [process.wait() for process in processes] == [0, 0]
+    status = mirror.merge(
+        manifest,
+        [
+            tmp_path / "mirror" / f"shard-{shard}.journal.jsonl"
+            for shard in range(2)
+        ],
+    )
+
+    assert status.completed == sorted(SIZES)
+    assert not status.failed and not status.missing and not status.unexpected
+    assert len(server.requests_to("getImage")) == len(SIZES)
+    assert (tmp_path / "mirror" / "1.2.3.zip").exists()
+
+
+def test_run_shard_resumes_after_a_torn_journal(
+    archive, server, client, tmp_path
+):
+    manifest = mirror.build_manifest(client, ["C"], shards=1)
+    journal = tmp_path / "journal.jsonl"
+    done = json.dumps(
+        {"series_instance_uid": "1.2.0", "error": None, "size_in_bytes": 1}
+    )
+    journal.write_text(done + "\n" + '{"series_instance_uid": "1.2.1", "err')
+    del server.requests[:]
+
+    mirror.run_shard(client, manifest, 0, tmp_path, journal=journal)
+
+    lines = journal.read_text().splitlines()
+    entries = [json.loads(line) for line in lines]
+    assert lines[0] == done
+    assert sorted(entry["series_instance_uid"] for entry in entries) == sorted(
+        SIZES
+    )
+    assert len(server.requests_to("getImage")) == len(SIZES) - 1
+
+    status = mirror.merge(manifest, [journal])
+    assert status.completed == sorted(SIZES)
+
+
+def test_merge_reports_failed_missing_and_unexpected(tmp_path):
+    manifest = {
+        "series": [
+            {"series_instance_uid": uid, "shard": 0} for uid in ["a", "b", "c"]
+        ]
+    }
+    journal = tmp_path / "journal.jsonl"
+    journal.write_text(
+        "\n".join(
+            json.dumps(entry)
+            for entry in [
+                {"series_instance_uid": "a", "error": "boom"},
+                {
+                    "series_instance_uid": "a",
+                    "error": None,
+                    "size_in_bytes": 5,
+                },
+                {"series_instance_uid": "b", "error": "boom"},
+                {
+                    "series_instance_uid": "z",
+                    "error": None,
+                    "size_in_bytes": 1,
+                },
+            ]
+        )
+    )
+    status = mirror.merge(manifest, [journal, tmp_path / "absent.jsonl"])
+
+    assert status.completed == ["a"]
+    assert status.failed == {"b": "boom"}
+    assert status.missing == ["c"]
+    assert status.unexpected == ["z"]
+    assert status.size_in_bytes == 5
+
+
+def test_run_shard_rejects_unknown_shard(client, tmp_path):
+    with pytest.raises(ValueError):
+        mirror.run_shard(client, {"shards": 2, "series": []}, 2, tmp_path)
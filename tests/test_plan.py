@@ -0,0 +1,151 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import collections
+
+import pytest
+
+from tcia import _plan
+from tcia import _types
+from tests.conftest import Response
+
+SIZES = {"1.1": 500, "1.2": 300, "1.3": 200, "1.4": 100, "1.5": 100}
+
+
+@pytest.fixture
+def sizes(server):
+    def respond(request):
+        size = SIZES.get(request.params["SeriesInstanceUID"])
+
+        if size is None:
+            return Response(b"gone", status=404)
+
+        return [
+            {
+                "TotalSizeInBytes": f"{size}.0",
+                "ObjectCount": f"{size // 100}.0",
+            }
+        ]
+
+    server.route("getSeriesSize", respond)
+
+
+def _series(uid, collection, patient_id, modality):
+    fields = dict.fromkeys(_types.Series._fields)
+    fields.update(
+        series_instance_uid=uid,
+        collection=collection,
+        patient_id=patient_id,
+        modality=modality,
+    )
+    return _types.Series(**fields)
+
+
+def test_plan_totals_sizes_by_level(sizes, client):
+    plan = client.plan_download(
+        [
+            _series("1.1", "A", "P0", "CT"),
+            _series("1.2", "A", "P1", "MR"),
+            _series("1.3", "B", "P2", "CT"),
+            "1.4",
+            "1.1",
+        ]
+    )
+
+    assert plan.totals == (4, 11, 1100)
+    assert plan.by_collection == {
+        "A": (2, 8, 800),
+        "B": (1, 2, 200),
+        None: (1, 1, 100),
+    }
+    assert plan.by_modality["CT"] == (2, 7, 700)
+    assert plan.by_patient["P1"] == (1, 3, 300)
+    assert not plan.failed
+    assert plan.fits is None
+
+
+def test_plan_accepts_a_shared_list(sizes, server, client):
+    server.route(
+        "ContentsByName",
+        [
+            {
+                "SeriesInstanceUID": "1.1",
+                "Collection": "A",
+                "PatientID": "P0",
+                "Modality": "CT",
+            },
+            {"SeriesInstanceUID": "1.2", "Collection": "B"},
+            {"SeriesInstanceUID": "missing", "Collection": "B"},
+            {"SeriesInstanceUID": "1.1", "Collection": "A"},
+        ],
+    )
+    plan = client.plan_download(client.contents_by_name(name="list").get())
+
+    assert plan.totals == (2, 8, 800)
+    assert plan.by_collection == {"A": (1, 5, 500), "B": (1, 3, 300)}
+    assert plan.by_modality == {"CT": (1, 5, 500), None: (1, 3, 300)}
+    assert list(plan.failed) == ["missing"]
+    (request,) = server.requests_to("ContentsByName")
+    assert request.params["name"] == "list"
+
+
+def test_plan_rejects_series_without_a_uid(client):
+    with pytest.raises(ValueError):
+        client.plan_download([{"Collection": "A"}])
+
+
+def test_plan_reports_failed_series(sizes, client):
+    plan = client.plan_download(["1.1", "missing"])
+
+    assert [estimate.series_instance_uid for estimate in plan.series] == [
+        "1.1"
+    ]
+    assert list(plan.failed) == ["missing"]
+    assert plan.totals.size_in_bytes == 500
+
+
+def test_plan_checks_free_space(sizes, client, tmp_path, monkeypatch):
+    usage = collections.namedtuple("usage", ["total", "used", "free"])
+    monkeypatch.setattr(
+        _plan.shutil, "disk_usage", lambda path: usage(0, 0, 1200)
+    )
+
+    assert client.plan_download(
+        list(SIZES), dest_dir=tmp_path / "new" / "dir", headroom=0
+    ).fits
+    assert not client.plan_download(
+        list(SIZES), dest_dir=tmp_path, headroom=0.1
+    ).fits
+
+
+def test_balance_spreads_size_evenly_and_deterministically():
+    estimates = [
+        _types.SeriesEstimate(uid, None, None, None, 1, size)
+        for uid, size in SIZES.items()
+    ]
+    batches = _plan.balance(estimates, 2)
+
+    assert [
+        sum(estimate.size_in_bytes for estimate in batch) for batch in batches
+    ] == [600, 600]
+    assert batches == _plan.balance(list(reversed(estimates)), 2)
+    assert _plan.balance([], 3) == [[], [], []]
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{"batches": 0}, {"headroom": -0.1}, {"max_workers": 0}]
+)
+def test_plan_rejects_bad_options(client, kwargs):
+    with pytest.raises(ValueError):
+        client.plan_download(["1.1"], **kwargs)
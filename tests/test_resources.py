@@ -11,4 +11,408 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
 # implied. See the License for the specific language governing
 # permissions and limitations under the License.
-# ----------------------------------------------------------------------
\ No newline at end of file
+# ----------------------------------------------------------------------
+import concurrent.futures
+import gzip
+import io
+import json
+import re
+import time
+
+import pytest
+
+from tcia import _resources
+from tcia import api
+from tests.conftest import Response
+
+PAYLOAD = bytes(range(256)) * 400
+
+
+def _ranged(payload, *, etag='"v1"', honour_range=True):
+    def respond(request):
+        match = re.match(r"bytes=(\d+)-", request.headers.get("Range", ""))
+
+        if not honour_range or match is None:
+            return Response(payload, headers={"ETag": etag})
+
+        if request.headers.get("If-Range") not in (None, etag):
+            return Response(payload, headers={"ETag": etag})
+
+        start = int(match.group(1))
+
+        if start >= len(payload):
+            return Response(status=416)
+
+        return Response(
+            payload[start:],
+            status=206,
+            headers={
+                "ETag": etag,
+                "Content-Range": f"bytes {start}-{len(payload) - 1}/"
+                f"{len(payload)}",
+            },
+        )
+
+    return respond
+
+
+def _interrupted(client, tmp_path, size):
+    images = client.images(series_instance_uid="1.2.3")
+    path = tmp_path / "series.zip"
+    (tmp_path / "series.zip.part").write_bytes((PAYLOAD + bytes(16))[:size])
+    (tmp_path / "series.zip.part.json").write_text(
+        json.dumps(
+            {
+                "url": images._url,
+                "params": {"SeriesInstanceUID": "1.2.3"},
+                "etag": '"v1"',
+                "last_modified": None,
+            }
+        )
+    )
+    return images, path
+
+
+def test_resume_requests_only_the_missing_range(server, client, tmp_path):
+    server.route("getImage", _ranged(PAYLOAD))
+    images, path = _interrupted(client, tmp_path, 1000)
+    images.download(path, resume=True)
+
+    assert path.read_bytes() == PAYLOAD
+    (request,) = server.requests
+    assert request.headers["Range"] == "bytes=1000-"
+    assert request.headers["If-Range"] == '"v1"'
+    assert not (tmp_path / "series.zip.part").exists()
+    assert not (tmp_path / "series.zip.part.json").exists()
+
+
+def test_resume_restarts_when_range_is_ignored(server, client, tmp_path):
+    server.route("getImage", _ranged(PAYLOAD, honour_range=False))
+    images, path = _interrupted(client, tmp_path, 1000)
+    images.download(path, resume=True)
+    assert path.read_bytes() == PAYLOAD
+
+
+def test_resume_restarts_when_validator_changed(server, client, tmp_path):
+    server.route("getImage", _ranged(PAYLOAD, etag='"v2"'))
+    images, path = _interrupted(client, tmp_path, 1000)
+    images.download(path, resume=True)
+    assert path.read_bytes() == PAYLOAD
+
+
+def test_resume_restarts_when_range_not_satisfiable(server, client, tmp_path):
+    server.route("getImage", _ranged(PAYLOAD))
+    images, path = _interrupted(client, tmp_path, len(PAYLOAD) + 10)
+    images.download(path, resume=True)
+    assert path.read_bytes() == PAYLOAD
+    assert [request.headers.get("Range") for request in server.requests] == [
+        f"bytes={len(PAYLOAD) + 10}-",
+        None,
+    ]
+
+
+def test_resume_ignores_journal_of_another_request(server, client, tmp_path):
+    server.route("getImage", _ranged(PAYLOAD))
+    _, path = _interrupted(client, tmp_path, 1000)
+    client.images(series_instance_uid="9.9.9").download(path, resume=True)
+    assert path.read_bytes() == PAYLOAD
+    assert "Range" not in server.requests[0].headers
+
+
+def test_resume_skips_completed_download(server, client, tmp_path):
+    server.route("getImage", _ranged(PAYLOAD))
+    path = tmp_path / "series.zip"
+    path.write_bytes(b"done")
+    client.images(series_instance_uid="1.2.3").download(path, resume=True)
+    assert path.read_bytes() == b"done"
+    assert not server.requests
+
+
+def test_resume_requires_a_path(client):
+    with pytest.raises(TypeError):
+        client.images(series_instance_uid="1.2.3").download(
+            object(), resume=True
+        )
+
+
+def _metadata(request):
+    name = request.endpoint.split("/")[0]
+    return {
+        "QueryName": name,
+        "Description": f"{name} description",
+        "Parameters": ["Collection"],
+        "Result": {
+            "Name": "result",
+            "Description": "rows",
+            "Attributes": [
+                {"Name": "Collection", "Description": "c", "DICOM": None}
+            ],
+        },
+    }
+
+
+class _MetadataRoutes(dict):
+    def get(self, endpoint, default=None):
+        if endpoint.endswith("/metadata"):
+            return _metadata
+        return super().get(endpoint, default)
+
+
+@pytest.fixture
+def metadata_server(server):
+    server.routes = _MetadataRoutes()
+    yield server
+    _resources.invalidate_metadata(server.url)
+
+
+def test_metadata_is_fetched_once_per_process(metadata_server):
+    for _ in range(2):
+        with api.Client("test-key", base_url=metadata_server.url) as client:
+            metadata = client.series.metadata
+            assert client.series(collection="A").metadata is metadata
+
+    assert metadata.query_name == "getSeries"
+    assert metadata.result.attributes[0].name == "Collection"
+    assert len(metadata_server.requests) == 1
+
+
+def test_invalidate_metadata_refetches(metadata_server, client):
+    client.series.metadata
+    client.invalidate_metadata()
+    client.series.metadata
+    assert len(metadata_server.requests) == 2
+
+
+def test_preload_metadata_fetches_every_endpoint(metadata_server, client):
+    metadata = client.preload_metadata()
+    assert len(metadata) == len(metadata_server.requests) == 15
+    client.preload_metadata()
+    assert len(metadata_server.requests) == 15
+
+
+def test_iter_yields_records_from_a_streamed_array(server, client):
+    rows = [
+        {"SeriesInstanceUID": f"1.2.{i}", "ImageCount": i} for i in range(500)
+    ]
+    server.route("getSeries", rows)
+    records = client.series(collection="A").iter(chunk_size=7)
+    assert [record.series_instance_uid for record in records] == [
+        row["SeriesInstanceUID"] for row in rows
+    ]
+    (request,) = server.requests
+    assert request.params == {"Collection": "A", "format": "json"}
+
+
+_CSV = "".join(f"1.2.{i},Ä€😀\n" for i in range(20000))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 65536])
+def test_text_download_decodes_gzip_chunk_by_chunk(
+    server, client, tmp_path, chunk_size
+):
+    server.route(
+        "getSOPInstanceUIDs",
+        Response(
+            gzip.compress(_CSV.encode("utf-8")),
+            headers={"Content-Type": "text/csv", "Content-Encoding": "gzip"},
+        ),
+    )
+    path = tmp_path / "uids.csv"
+    uids = client.sop_instance_uids(series_instance_uid="1")
+    uids.download(str(path), chunk_size=chunk_size)
+
+    assert path.read_text(encoding="utf-8") == _CSV
+    (request,) = server.requests
+    assert "gzip" in request.headers["Accept-Encoding"]
+    assert request.params["format"] == "csv"
+
+
+def test_text_download_asks_for_gzip_without_session_defaults(server, client):
+    server.route("getSeries", "SeriesInstanceUID\n")
+    client.transport.session.headers.clear()
+    client.series(collection="A").download(io.StringIO())
+    (request,) = server.requests
+    assert "gzip" in request.headers["Accept-Encoding"]
+
+
+@pytest.mark.parametrize(
+    "content_type, encoding",
+    [
+        ("text/csv", "utf-8"),
+        ("text/csv; charset=utf-8", "utf-8"),
+        ("text/csv; charset=ISO-8859-1", "latin-1"),
+    ],
+)
+def test_text_download_honours_only_a_declared_charset(
+    server, client, content_type, encoding
+):
+    text = "Collection\nCT Lymph Nodes Ä\n"
+    server.route(
+        "getCollectionValues",
+        Response(
+            text.encode(encoding), headers={"Content-Type": content_type}
+        ),
+    )
+    buffer = io.StringIO()
+    client.collections().download(buffer, chunk_size=3)
+    assert buffer.getvalue() == text
+
+
+class _TimedBuffer(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.first_write = None
+
+    def write(self, text):
+        if self.first_write is None:
+            self.first_write = time.perf_counter()
+
+        return super().write(text)
+
+
+def test_text_download_writes_before_the_body_is_complete(server, client):
+    server.route("getSeries", "x" * 400000)
+    server.bandwidth = 2e6
+    buffer = _TimedBuffer()
+    start = time.perf_counter()
+    client.series(collection="A").download(buffer)
+    end = time.perf_counter()
+
+    assert len(buffer.getvalue()) == 400000
+    assert buffer.first_write - start < (end - start) / 2
+
+
+_SERIES = [
+    {"SeriesInstanceUID": f"1.{patient}.{modality}", "Modality": modality}
+    for patient in range(3)
+    for modality in ["CT", "MR"]
+]
+
+
+def _route_series(server):
+    def series(request):
+        params = {
+            key: value
+            for key, value in request.params.items()
+            if key != "format"
+        }
+
+        if params.get("PatientID") == "gone":
+            return Response(status=404)
+
+        return [
+            row
+            for row in _SERIES
+            if row["Modality"] == params.get("Modality", row["Modality"])
+            and row["SeriesInstanceUID"].split(".")[1]
+            == params.get("PatientID", "P1")[1:]
+        ]
+
+    server.route("getSeries", series)
+
+
+def test_get_many_keeps_the_query_filters(server, client):
+    _route_series(server)
+    result = client.series(modality="CT", collection="C").get_many(
+        patient_id=["P0", "P2", "P0"], max_workers=2
+    )
+
+    assert sorted(result.results) == ["P0", "P2"]
+    assert [record.series_instance_uid for record in result.records] == [
+        "1.0.CT",
+        "1.2.CT",
+    ]
+    assert result.failed == {}
+    assert sorted(
+        (request.params["PatientID"], request.params["Modality"])
+        for request in server.requests
+    ) == [("P0", "CT"), ("P2", "CT")]
+    assert {request.params["Collection"] for request in server.requests} == {
+        "C"
+    }
+
+
+def test_get_many_overrides_only_the_given_filters(server, client):
+    _route_series(server)
+    result = client.series(modality="CT", patient_id="P1").get_many(
+        modality=["MR"], patient_id="P0"
+    )
+    assert [record.series_instance_uid for record in result.records] == [
+        "1.0.MR"
+    ]
+
+
+def test_get_many_collects_failures(server, client):
+    _route_series(server)
+    result = client.series(modality="MR").get_many(patient_id=["P1", "gone"])
+
+    assert list(result.results) == ["P1"]
+    assert list(result.failed) == ["gone"]
+    assert result.failed["gone"].response.status_code == 404
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {},
+        {"patient_id": "P0"},
+        {"patient_id": ["P0"], "modality": ["CT"]},
+        {"patient_id": ["P0"], "max_workers": 0},
+    ],
+)
+def test_get_many_rejects_bad_arguments(client, kwargs):
+    with pytest.raises((TypeError, ValueError)):
+        client.series(modality="CT").get_many(**kwargs)
+
+
+def test_queries_are_immutable_and_hashable(client):
+    query = client.series(collection="A")
+
+    with pytest.raises(TypeError):
+        query._params["Collection"] = "B"
+
+    assert client.series is client.series
+    assert query == client.series(collection="A", patient_id=None)
+    assert query != client.series(collection="B")
+    assert query != client.patients(collection="A")
+    assert {query: 1}[client.series(collection="A")] == 1
+    assert query(patient_id="P0") is not query
+    # A derived query is keyed on its own params, not its parent's.
+    assert query(patient_id="P0") != query
+    assert hash(query(patient_id="P0")) == hash(client.series(patient_id="P0"))
+    assert {
+        name: value
+        for name, value in query._params.items()
+        if value is not None
+    } == {"Collection": "A"}
+
+
+def test_one_query_is_shared_safely_between_threads(server, client, tmp_path):
+    server.route(
+        "getSeries",
+        lambda request: (
+            f"{request.params['PatientID']}\n"
+            if request.params["format"] == "csv"
+            else [{"PatientID": request.params["PatientID"]}]
+        ),
+    )
+    query = client.series(collection="A", modality="CT")
+    params = dict(query._params)
+
+    def use(index):
+        patient = query(collection="A", modality="CT", patient_id=f"P{index}")
+        buffer = io.StringIO()
+        patient.download(buffer)
+        records = patient.get() + list(patient.iter())
+        return buffer.getvalue(), [record.patient_id for record in records]
+
+    with concurrent.futures.ThreadPoolExecutor(16) as executor:
+        results = list(executor.map(use, range(64)))
+
+    assert results == [
+        (f"P{index}\n", [f"P{index}", f"P{index}"]) for index in range(64)
+    ]
+    assert dict(query._params) == params
+    assert {request.params["Collection"] for request in server.requests} == {
+        "A"
+    }
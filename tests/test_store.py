@@ -0,0 +1,191 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import os
+import threading
+
+import pytest
+
+from tcia import _types
+from tcia import api
+from tcia import store
+from tests.conftest import make_zip
+
+MEMBERS = {"a.dcm": b"a" * 100, "b.dcm": b"b" * 50, "sub/c.dcm": b"a" * 100}
+
+
+def _members(members=MEMBERS):
+    return [(name, iter([data])) for name, data in members.items()]
+
+
+@pytest.fixture
+def images(tmp_path):
+    with store.ImageStore(tmp_path / "store") as images:
+        yield images
+
+
+def test_add_series_keeps_identical_content_once(images):
+    images.add_series("1.1", _members())
+    images.add_series("1.2", _members({"x.dcm": b"b" * 50}))
+
+    assert images.has_series("1.1")
+    assert [instance.filename for instance in images.instances("1.1")] == [
+        "a.dcm",
+        "b.dcm",
+        "sub/c.dcm",
+    ]
+    assert images.stats == (2, 4, 300, 150)
+    assert images.instances("9.9") is None
+
+
+def test_interrupted_series_is_not_complete(images):
+    images.add_instance("1.1", "a.dcm", [b"a"])
+    assert not images.has_series("1.1")
+    images.mark_complete("1.1")
+    assert images.has_series("1.1")
+
+
+@pytest.mark.parametrize("link", ["hard", "reflink", "copy"])
+def test_materialize_links_or_copies(images, tmp_path, link):
+    images.add_series("1.1", _members())
+    linked = store.ImageStore(images.path, link=link)
+    dest_dir = tmp_path / "dest"
+    (dest_dir / "sub").mkdir(parents=True)
+    (dest_dir / "sub" / "c.dcm").write_bytes(b"stale")
+
+    paths = linked.materialize("1.1", dest_dir)
+
+    assert sorted(paths) == sorted(str(dest_dir / name) for name in MEMBERS)
+
+    for name, data in MEMBERS.items():
+        assert (dest_dir / name).read_bytes() == data
+
+    shared = (
+        os.stat(dest_dir / "a.dcm").st_ino
+        == os.stat(dest_dir / "sub" / "c.dcm").st_ino
+    )
+    assert shared is (link == "hard")
+    linked.close()
+
+
+def test_materialize_unknown_series(images, tmp_path):
+    with pytest.raises(KeyError):
+        images.materialize("9.9", tmp_path)
+
+
+def test_verify_checks_counts_sizes_and_content(images):
+    instance, *_ = images.add_series("1.1", _members())
+    size = _types.SeriesSize(total_size_in_bytes="250.0", object_count="3.0")
+
+    assert images.verify("1.1", size, deep=True)
+    assert not images.verify("1.1", size._replace(object_count="2"))
+    assert not images.verify("1.1", size._replace(total_size_in_bytes="1"))
+    assert not images.verify("9.9", size)
+
+    path = images._object_path(instance.sha256)
+    os.chmod(path, 0o644)
+
+    with open(path, mode="r+b") as buffer:
+        buffer.write(b"z")
+
+    assert images.verify("1.1", size)
+    assert not images.verify("1.1", size, deep=True)
+
+
+def test_prune_removes_unreferenced_objects(images):
+    images.add_series("1.1", _members())
+    images.add_series("1.2", _members({"x.dcm": b"b" * 50}))
+    images.remove_series("1.1")
+
+    assert not images.has_series("1.1")
+    assert images.prune() == 1
+    assert images.prune() == 0
+    assert images.stats.unique_size_in_bytes == 50
+
+
+def test_prune_keeps_objects_referenced_during_the_scan(images, monkeypatch):
+    images.add_series("1.1", _members({"a.dcm": b"a" * 100}))
+    images.remove_series("1.1")
+    listdir = os.listdir
+
+    def racing_listdir(path):
+        # Another writer reuses the unreferenced object while prune()
+        # is between reading references and unlinking.
+        names = listdir(path)
+
+        if os.path.basename(path) == "objects":
+            images.add_series("1.2", _members({"x.dcm": b"a" * 100}))
+
+        return names
+
+    monkeypatch.setattr(store.os, "listdir", racing_listdir)
+    assert images.prune() == 0
+    monkeypatch.undo()
+
+    assert images.verify(
+        "1.2",
+        _types.SeriesSize(total_size_in_bytes=100, object_count=1),
+        deep=True,
+    )
+    assert images.prune() == 0
+
+
+def test_prune_is_safe_alongside_concurrent_adds(tmp_path):
+    # Separate handles, as separate processes sharing the store have.
+    with store.ImageStore(tmp_path / "store") as writer, store.ImageStore(
+        tmp_path / "store"
+    ) as pruner:
+        done = threading.Event()
+
+        def prune():
+            while not done.is_set():
+                pruner.prune()
+
+        thread = threading.Thread(target=prune)
+        thread.start()
+
+        try:
+            for index in range(100):
+                uid = f"1.{index}"
+                writer.add_series(uid, _members({"a.dcm": bytes([index % 5])}))
+                assert writer.verify(
+                    uid,
+                    _types.SeriesSize(total_size_in_bytes=1, object_count=1),
+                    deep=True,
+                )
+                writer.remove_series(uid)
+        finally:
+            done.set()
+            thread.join()
+
+
+def test_store_rejects_unknown_link(tmp_path):
+    with pytest.raises(ValueError):
+        store.ImageStore(tmp_path, link="symbolic")
+
+
+def test_client_extracts_each_series_once(server, images, tmp_path):
+    server.route("getImage", make_zip(MEMBERS))
+
+    with api.Client("test-key", base_url=server.url, store=images) as client:
+        for cohort in ["one", "two"]:
+            report = client.download_series(
+                ["1.1"], tmp_path / cohort, extract=True
+            )
+            assert report.size_in_bytes == 250
+
+    assert len(server.requests_to("getImage")) == 1
+
+    for cohort in ["one", "two"]:
+        assert (tmp_path / cohort / "1.1" / "b.dcm").read_bytes() == b"b" * 50
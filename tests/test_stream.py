@@ -0,0 +1,200 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import operator
+import os
+import pickle
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from tcia import api
+from tcia import cache
+from tcia import catalog
+from tcia import store
+from tcia import stream
+from tests.conftest import Response
+from tests.conftest import make_zip
+
+SERIES = {
+    f"1.2.{i}": {f"{i}/{j}.dcm": bytes([i, j]) * 10 for j in range(3)}
+    for i in range(4)
+}
+
+
+@pytest.fixture
+def images(server):
+    def respond(request):
+        members = SERIES.get(request.params["SeriesInstanceUID"])
+
+        if members is None:
+            return Response(b"gone", status=404)
+
+        return make_zip(members)
+
+    server.route("getImage", respond)
+
+
+def _by_series(instances):
+    series = {}
+
+    for instance in instances:
+        series.setdefault(instance.series_instance_uid, {})[
+            instance.filename
+        ] = instance.data
+
+    return series
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_iter_series_instances_yields_every_member(
+    images, client, max_workers
+):
+    instances = stream.iter_series_instances(
+        client, list(SERIES), prefetch=2, max_workers=max_workers
+    )
+    assert _by_series(instances) == SERIES
+
+
+def test_iter_series_instances_raises_worker_failures(images, client):
+    with pytest.raises(Exception):
+        list(stream.iter_series_instances(client, ["1.2.0", "missing"]))
+
+
+def test_iter_series_instances_can_be_abandoned(images, client):
+    instances = stream.iter_series_instances(client, list(SERIES), prefetch=1)
+    next(instances)
+    instances.close()
+
+
+def test_iter_single_images(server, client):
+    server.route(
+        "getSingleImage",
+        lambda request: request.params["SOPInstanceUID"].encode("ascii"),
+    )
+    instances = stream.iter_single_images(
+        client, [("1.2.0", "1.2.0.1"), ("1.2.0", "1.2.0.2")]
+    )
+    assert sorted(
+        (instance.filename, instance.data) for instance in instances
+    ) == [("1.2.0.1.dcm", b"1.2.0.1"), ("1.2.0.2.dcm", b"1.2.0.2")]
+
+
+@pytest.mark.parametrize("kwargs", [{"prefetch": 0}, {"max_workers": 0}])
+def test_streams_reject_bad_options(client, kwargs):
+    with pytest.raises(ValueError):
+        stream.iter_series_instances(client, [], **kwargs)
+
+    with pytest.raises(ValueError):
+        stream.InstanceDataset(client, [], **kwargs)
+
+
+def test_instance_dataset_survives_pickling(images, client):
+    dataset = stream.InstanceDataset(
+        client,
+        list(SERIES),
+        transform=operator.attrgetter("data"),
+        max_workers=2,
+    )
+    copy = pickle.loads(pickle.dumps(dataset))
+
+    assert isinstance(copy, stream.InstanceDataset)
+    assert sorted(copy) == sorted(
+        data for members in SERIES.values() for data in members.values()
+    )
+    assert copy._client.base_url == client.base_url
+    # An unpickled dataset pickles again, whether iterated or not.
+    assert len(list(pickle.loads(pickle.dumps(copy)))) == 12
+    fresh = pickle.loads(pickle.dumps(dataset))
+    assert len(list(pickle.loads(pickle.dumps(fresh)))) == 12
+
+
+def test_instance_dataset_pickles_the_full_client_configuration(tmp_path):
+    client = api.Client(
+        "test-key",
+        base_url="http://127.0.0.1:9",
+        pool_maxsize=3,
+        timeout=(1.0, 2.0),
+        retry=api.RetryPolicy(7, backoff_factor=0),
+        rate_limiter=api.RateLimiter(5, concurrency=2),
+        cache=cache.ResponseCache(tmp_path / "cache.sqlite", ttl=60),
+        catalog=catalog.Catalog(tmp_path / "catalog.sqlite"),
+        store=store.ImageStore(tmp_path / "store", link="copy"),
+    )
+    client.cache.set("u/query/e", {}, "[]", api_key="test-key")
+    client.series(collection="A")
+    dataset = stream.InstanceDataset(client, ["1.2.3"])
+
+    copy = pickle.loads(pickle.dumps(dataset))._client
+
+    assert copy is not client
+    assert repr(copy.transport) == repr(client.transport)
+    assert copy.transport.rate_limiter.in_flight == 0
+    assert copy.cache.get("u/query/e", {}, api_key="test-key") == "[]"
+    assert copy.catalog.path == client.catalog.path
+    assert repr(copy.store) == repr(client.store)
+    assert copy.series(collection="A") == client.series(collection="A")
+
+
+_FAKE_TORCH = {
+    "torch/__init__.py": "",
+    "torch/utils/__init__.py": "",
+    "torch/utils/data.py": """
+        import collections
+
+        WorkerInfo = collections.namedtuple("WorkerInfo", ["id", "num_workers"])
+        worker_info = None
+
+        class IterableDataset:
+            pass
+
+        def get_worker_info():
+            return worker_info
+    """,
+}
+
+
+def test_torch_is_imported_only_for_a_dataset(tmp_path):
+    # A stand-in torch package, to observe when it is imported.
+    for name, source in _FAKE_TORCH.items():
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(textwrap.dedent(source))
+
+    script = textwrap.dedent("""
+        import pickle
+        import sys
+
+        from tcia import api
+        from tcia import stream
+
+        assert "torch" not in sys.modules
+        client = api.Client("key", base_url="http://127.0.0.1:9")
+        dataset = stream.InstanceDataset(client, ["a", "b", "c", "d"])
+        data = sys.modules["torch.utils.data"]
+        assert isinstance(dataset, data.IterableDataset)
+        assert isinstance(dataset, stream.InstanceDataset)
+        assert type(pickle.loads(pickle.dumps(dataset))) is type(dataset)
+
+        stream.iter_series_instances = lambda client, uids, **kwargs: iter(uids)
+        data.worker_info = data.WorkerInfo(id=1, num_workers=2)
+        assert list(dataset) == ["b", "d"]
+        """)
+    environment = dict(
+        os.environ,
+        PYTHONPATH=os.pathsep.join([str(tmp_path)] + sys.path[:]),
+    )
+    subprocess.run([sys.executable, "-c", script], check=True, env=environment)
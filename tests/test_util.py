@@ -11,4 +11,479 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
 # implied. See the License for the specific language governing
 # permissions and limitations under the License.
-# ----------------------------------------------------------------------
\ No newline at end of file
+# ----------------------------------------------------------------------
+import gc
+import gzip
+import http.client
+import io
+import json
+import random
+import threading
+import time
+
+import pytest
+
+from tcia import _transport
+from tcia import _utils
+from tests.conftest import Response
+
+
+def test_transport_creates_session_lazily():
+    transport = _transport.Transport()
+    assert transport._session is None
+    session = transport.session
+    assert session is transport.session
+    transport.close()
+
+
+def test_transport_close_without_session():
+    _transport.Transport().close()
+
+
+def test_transport_mounts_pooled_adapter():
+    transport = _transport.Transport(
+        pool_connections=3, pool_maxsize=7, pool_block=True
+    )
+    adapter = transport.session.get_adapter("https://example.org")
+    assert adapter is transport.session.get_adapter("http://example.org")
+    assert adapter._pool_connections == 3
+    assert adapter._pool_maxsize == 7
+    assert adapter._pool_block is True
+
+
+def test_transport_without_keep_alive_sends_connection_close():
+    transport = _transport.Transport(keep_alive=False)
+    assert transport.session.headers["Connection"] == "close"
+
+
+@pytest.mark.parametrize(
+    "kwargs", [{"pool_connections": 0}, {"pool_maxsize": 0}]
+)
+def test_transport_rejects_empty_pools(kwargs):
+    with pytest.raises(ValueError):
+        _transport.Transport(**kwargs)
+
+
+def test_resources_of_one_client_share_a_transport(client):
+    assert client.series.__dict__["_transport"] is client.transport
+    assert client.images.__dict__["_transport"] is client.transport
+
+
+def _flaky(responses):
+    responses = list(responses)
+
+    def respond(request):
+        return responses.pop(0) if len(responses) > 1 else responses[0]
+
+    return respond
+
+
+def _transport_for(server, **kwargs):
+    kwargs.setdefault("retry", _transport.RetryPolicy(3, backoff_factor=0))
+    return _transport.Transport(**kwargs), f"{server.url}/query/getData"
+
+
+def test_transport_retries_retryable_statuses(server):
+    server.route(
+        "getData",
+        _flaky([Response(status=503), Response(status=429), "done"]),
+    )
+    transport, url = _transport_for(server)
+    assert transport.get_text(url) == "done"
+    assert len(server.requests) == 3
+
+
+def test_transport_gives_up_after_total_retries(server):
+    server.route("getData", Response(status=500))
+    transport, url = _transport_for(
+        server, retry=_transport.RetryPolicy(2, backoff_factor=0)
+    )
+
+    with pytest.raises(Exception) as excinfo:
+        transport.get_text(url)
+
+    assert excinfo.value.response.status_code == 500
+    assert len(server.requests) == 3
+
+
+def test_transport_does_not_retry_client_errors(server):
+    server.route("getData", Response(status=404))
+    transport, url = _transport_for(server)
+
+    with pytest.raises(Exception):
+        transport.get_text(url)
+
+    assert len(server.requests) == 1
+
+
+@pytest.mark.parametrize("status", [404, 503])
+def test_transport_closes_streamed_error_responses(server, status):
+    server.route("getData", Response(b"x" * 100000, status=status))
+    transport, url = _transport_for(
+        server, retry=_transport.RetryPolicy(1, backoff_factor=0)
+    )
+
+    with pytest.raises(Exception) as excinfo:
+        transport.get_content_iter(url)
+
+    assert excinfo.value.response.raw.closed
+
+
+@pytest.mark.parametrize(
+    "value, expected", [("3", 3.0), ("-1", 0.0), ("soon", None), (None, None)]
+)
+def test_retry_policy_honours_retry_after(value, expected):
+    policy = _transport.RetryPolicy(backoff_factor=0)
+    assert policy.delay(0, value) == (0 if expected is None else expected)
+
+
+def test_retry_policy_backs_off_within_window():
+    policy = _transport.RetryPolicy(backoff_factor=1, backoff_max=5)
+
+    for attempt in range(6):
+        assert 0 <= policy.delay(attempt) <= min(5, 2**attempt)
+
+
+def test_rate_limiter_adapts_concurrency():
+    limiter = _transport.RateLimiter(
+        1000, concurrency=8, max_concurrency=16, target_latency=1.0
+    )
+    limiter.acquire()
+    limiter.release(0.1, throttled=True)
+    assert limiter.concurrency == 4
+    limiter.acquire()
+    limiter.release(2.0)
+    assert limiter.concurrency == 3
+
+    for _ in range(20):
+        limiter.acquire()
+        limiter.release(0.1)
+
+    assert limiter.concurrency > 3
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"rate": 0}, {"concurrency": 0}, {"concurrency": 40}],
+)
+def test_rate_limiter_rejects_bad_limits(kwargs):
+    with pytest.raises(ValueError):
+        _transport.RateLimiter(**kwargs)
+
+
+def test_rate_limiter_slot_is_held_until_a_stream_is_consumed(server):
+    server.route("getData", b"x" * 300000)
+    limiter = _transport.RateLimiter(1000)
+    transport, url = _transport_for(server, rate_limiter=limiter)
+
+    chunks = transport.get_content_iter(url, chunk_size=65536)
+    assert limiter.in_flight == 1
+    assert len(b"".join(chunks)) == 300000
+    assert limiter.in_flight == 0
+
+    with transport.get_response(url, stream=True) as response:
+        assert limiter.in_flight == 1
+        assert len(response.content) == 300000
+
+    assert limiter.in_flight == 0
+
+    text = transport.get_text_iter(url)
+    next(text)
+    text.close()
+    assert limiter.in_flight == 0
+
+    transport.get_text(url)
+    assert limiter.in_flight == 0
+
+
+def test_rate_limiter_slot_of_an_abandoned_stream_is_released(server):
+    server.route("getData", b"x" * 1000)
+    limiter = _transport.RateLimiter(1000)
+    transport, url = _transport_for(server, rate_limiter=limiter)
+
+    chunks = transport.get_content_iter(url)
+    assert limiter.in_flight == 1
+    del chunks
+    gc.collect()
+    assert limiter.in_flight == 0
+
+
+def _run_flights(flights, key, function, count, results):
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(_call_flight(flights, key, function))
+        )
+        for _ in range(count)
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    return threads
+
+
+def _call_flight(flights, key, function):
+    try:
+        return flights.do(key, function)
+    except Exception as error:
+        return error
+
+
+def test_single_flight_shares_one_call_between_concurrent_callers():
+    flights = _transport._SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def function():
+        calls.append(None)
+        started.set()
+        release.wait()
+        return ["result"]
+
+    results = []
+    leader = _run_flights(flights, "key", function, 1, results)
+    started.wait()
+    followers = _run_flights(flights, "key", function, 9, results)
+    # Let the followers reach the in-flight call before it finishes.
+    time.sleep(0.1)
+    release.set()
+
+    for thread in leader + followers:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 10
+    assert all(result is results[0] for result in results)
+    assert flights._calls == {}
+
+
+def test_single_flight_shares_the_error():
+    flights = _transport._SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def function():
+        started.set()
+        release.wait()
+        raise ValueError("failed")
+
+    results = []
+    leader = _run_flights(flights, "key", function, 1, results)
+    started.wait()
+    followers = _run_flights(flights, "key", function, 4, results)
+    time.sleep(0.1)
+    release.set()
+
+    for thread in leader + followers:
+        thread.join()
+
+    assert len(results) == 5
+    assert all(isinstance(result, ValueError) for result in results)
+    assert flights._calls == {}
+
+
+def test_single_flight_does_not_cache_finished_calls():
+    flights = _transport._SingleFlight()
+    calls = []
+    flights.do("key", lambda: calls.append(None))
+    flights.do("key", lambda: calls.append(None))
+    assert len(calls) == 2
+
+
+def test_flight_key_ignores_param_order_and_missing_values():
+    key = _transport._flight_key(
+        "text", "url", {"a": 1, "b": 2, "c": None}, {"api_key": "k"}
+    )
+    assert key == _transport._flight_key(
+        "text", "url", {"b": 2, "a": 1}, {"api_key": "k"}
+    )
+    assert key != _transport._flight_key(
+        "records", "url", {"a": 1, "b": 2}, {"api_key": "k"}
+    )
+    assert key != _transport._flight_key(
+        "text", "url", {"a": 1, "b": 3}, {"api_key": "k"}
+    )
+    assert key != _transport._flight_key(
+        "text", "url", {"a": 1, "b": 2}, {"api_key": "other"}
+    )
+
+
+def _stream(server, endpoint, session):
+    return _utils.get_response(
+        f"{server.url}/query/{endpoint}", stream=True, session=session
+    )
+
+
+def test_write_response_content_reads_directly_and_reuses_connection(
+    server, tmp_path
+):
+    import requests
+
+    body = bytes(range(256)) * 4000
+    server.route("getImage", body)
+
+    with requests.Session() as session:
+        for index in range(3):
+            response = _stream(server, "getImage", session)
+            assert _utils._get_reader(response)[1] is True
+            path = tmp_path / f"{index}.zip"
+            size = _utils.write_response_content(response, path)
+            assert size == len(body)
+            assert path.read_bytes() == body
+
+    assert server.connections == 1
+
+
+def test_write_response_content_detects_a_short_body(server):
+    import requests
+
+    # Connection: close makes the stub hang up after the short body
+    # instead of leaving the client waiting for the rest.
+    server.route(
+        "getImage",
+        Response(
+            b"x" * 1000,
+            headers={"Content-Length": "5000", "Connection": "close"},
+        ),
+    )
+
+    with requests.Session() as session:
+        response = _stream(server, "getImage", session)
+        assert _utils._get_reader(response)[1] is True
+
+        with pytest.raises(http.client.IncompleteRead) as excinfo:
+            _utils.write_response_content(response, io.BytesIO())
+
+    assert excinfo.value.expected == 4000
+
+
+def test_write_response_content_decodes_content_codings(server):
+    import requests
+
+    body = b"dicom" * 10000
+    server.route(
+        "getImage",
+        Response(gzip.compress(body), headers={"Content-Encoding": "gzip"}),
+    )
+
+    with requests.Session() as session:
+        response = _stream(server, "getImage", session)
+        assert _utils._get_reader(response)[1] is False
+        buffer = io.BytesIO()
+        _utils.write_response_content(response, buffer)
+
+    assert buffer.getvalue() == body
+
+
+class _PlainRaw(io.BytesIO):
+    # A raw stream without urllib3's private layout.
+    decode_content = False
+
+
+class _PlainResponse:
+    def __init__(self, body):
+        self.raw = _PlainRaw(body)
+        self.headers = {"Content-Length": str(len(body))}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.raw.close()
+
+
+def test_write_response_content_falls_back_to_raw_readinto():
+    body = b"x" * 200000
+    response = _PlainResponse(body)
+    assert _utils._get_reader(response) == (response.raw, False)
+    buffer = io.BytesIO()
+    assert _utils.write_response_content(response, buffer) == len(body)
+    assert buffer.getvalue() == body
+
+
+def _random_value(rng, depth=0):
+    kind = rng.choice(
+        ["int", "float", "string", "literal"]
+        + (["array", "object"] if depth < 3 else [])
+    )
+
+    if kind == "int":
+        return rng.randint(-(10**12), 10**12)
+
+    if kind == "float":
+        return rng.choice(
+            [
+                rng.uniform(-1e6, 1e6),
+                rng.uniform(-1, 1) * 10 ** rng.randint(-300, 300),
+                -2500.0,
+            ]
+        )
+
+    if kind == "string":
+        return "".join(
+            rng.choice('ab"\\/\n\té€😀 ,]') for _ in range(rng.randint(0, 8))
+        )
+
+    if kind == "literal":
+        return rng.choice([True, False, None])
+
+    if kind == "array":
+        return [
+            _random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))
+        ]
+
+    return {
+        str(index): _random_value(rng, depth + 1)
+        for index in range(rng.randint(0, 4))
+    }
+
+
+def _random_split(rng, text):
+    cuts = sorted(
+        rng.sample(range(1, len(text)), min(len(text) - 1, 8))
+        if len(text) > 1
+        else []
+    )
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [None])]
+
+
+def test_iter_json_array_matches_json_loads_on_random_splits():
+    rng = random.Random(1234)
+
+    for _ in range(2000):
+        array = [_random_value(rng) for _ in range(rng.randint(0, 6))]
+        text = json.dumps(
+            array,
+            indent=rng.choice([None, 1]),
+            separators=rng.choice([(",", ":"), (", ", ": ")]),
+            ensure_ascii=rng.random() < 0.5,
+        )
+        text = rng.choice(["", " ", "\n"]) + text + rng.choice(["", "\n"])
+        chunks = _random_split(rng, text)
+        assert list(_utils.iter_json_array(chunks)) == json.loads(text), chunks
+
+
+@pytest.mark.parametrize(
+    "chunks, expected",
+    [
+        (["[-2500.", "0, 1]"], [-2500.0, 1]),
+        (["[1e", "5, 2]"], [1e5, 2]),
+        (["[tr", "ue, nu", "ll]"], [True, None]),
+        (["[", "]"], []),
+        (['["a\\', '"b"]'], ['a"b']),
+    ],
+)
+def test_iter_json_array_waits_for_complete_scalars(chunks, expected):
+    assert list(_utils.iter_json_array(chunks)) == expected
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["", "1", "{}", "[1 2]", "[1,,2]", "[1,]", "[,1]", "[1]x", "[1", "[1e]"],
+)
+def test_iter_json_array_rejects_malformed_input(text):
+    for chunks in ([text], list(text)):
+        with pytest.raises(ValueError):
+            list(_utils.iter_json_array(chunks))
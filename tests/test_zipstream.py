@@ -0,0 +1,140 @@
+# Copyright 2019 Geoffrey A. Reed. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied. See the License for the specific language governing
+# permissions and limitations under the License.
+# ----------------------------------------------------------------------
+import io
+import random
+import zipfile
+
+import pytest
+
+from tcia import _zipstream
+from tests.conftest import make_zip
+
+MEMBERS = {
+    "a/1.dcm": bytes(range(256)) * 300,
+    "a/2.dcm": b"PK\x07\x08" * 1000 + b"tail",
+    "b/empty.dcm": b"",
+    "é.dcm": b"x",
+}
+
+
+class _Unseekable(io.RawIOBase):
+    # zipfile writes data descriptors when it cannot seek back.
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, bytes_):
+        self.data += bytes_
+        return len(bytes_)
+
+
+def _streamed_zip(members, compression):
+    buffer = _Unseekable()
+
+    with zipfile.ZipFile(buffer, mode="w", compression=compression) as zip_:
+        for name, data in members.items():
+            with zip_.open(name, mode="w") as member:
+                member.write(data)
+
+    return bytes(buffer.data)
+
+
+def _chunks(data, rng):
+    position = 0
+
+    while position < len(data):
+        size = rng.randint(1, 5000)
+        yield data[position : position + size]
+        position += size
+
+
+def _read(content_iter):
+    return {
+        name: b"".join(data_iter)
+        for name, data_iter in _zipstream.iter_members(content_iter)
+    }
+
+
+@pytest.mark.parametrize(
+    "compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]
+)
+@pytest.mark.parametrize("make", [make_zip, _streamed_zip])
+def test_iter_members_matches_zipfile(make, compression):
+    data = (
+        make(MEMBERS, compression=compression)
+        if make is make_zip
+        else make(MEMBERS, compression)
+    )
+    rng = random.Random(7)
+
+    for _ in range(5):
+        assert _read(_chunks(data, rng)) == MEMBERS
+
+
+def test_iter_members_skips_unread_members():
+    data = make_zip(MEMBERS)
+    names = [name for name, _ in _zipstream.iter_members([data])]
+    assert names == list(MEMBERS)
+
+
+@pytest.mark.parametrize(
+    "compression", [zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED]
+)
+def test_iter_members_rejects_corrupt_data(compression):
+    data = bytearray(make_zip({"a.dcm": b"a" * 1000}, compression=compression))
+    data[38] ^= 0xFF
+
+    with pytest.raises(ValueError):
+        _read([bytes(data)])
+
+
+@pytest.mark.parametrize(
+    "data",
+    [b"", b"not a zip", make_zip(MEMBERS)[:300]],
+    ids=["empty", "foreign", "truncated"],
+)
+def test_iter_members_rejects_truncated_or_foreign_streams(data):
+    with pytest.raises(ValueError):
+        _read([data])
+
+
+def test_extract_writes_members_and_directories(tmp_path):
+    members = dict(MEMBERS, **{"c/": b""})
+    paths = _zipstream.extract([make_zip(members)], tmp_path)
+
+    assert sorted(paths) == sorted(str(tmp_path / name) for name in MEMBERS)
+    assert (tmp_path / "c").is_dir()
+
+    for name, data in MEMBERS.items():
+        assert (tmp_path / name).read_bytes() == data
+
+
+def test_extract_refuses_paths_outside_destination(tmp_path):
+    with pytest.raises(ValueError):
+        _zipstream.extract([make_zip({"../evil.dcm": b"x"})], tmp_path / "d")
+
+    assert not (tmp_path / "evil.dcm").exists()
+
+
+def test_images_extract_streams_the_series(server, client, tmp_path):
+    server.route("getImage", make_zip(MEMBERS))
+    images = client.images(series_instance_uid="1.2.3")
+
+    assert len(images.extract(tmp_path)) == len(MEMBERS)
+    assert (tmp_path / "a" / "2.dcm").read_bytes() == MEMBERS["a/2.dcm"]
+    assert dict(images.iter_files()) == MEMBERS
+    assert not list(tmp_path.glob("*.zip"))